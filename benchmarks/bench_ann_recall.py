@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark: IVF ANN index (src/retrieval_graph/ann.py) vs. exact brute force.
+
+Prints recall@k and per-query latency for several `nprobe` values so an
+operating point can be picked for `task2_search.py --index ann --nprobe N`.
+
+Usage:
+  python benchmarks/bench_ann_recall.py --tables 100000 --dim 256
+  python benchmarks/bench_ann_recall.py --store outputs/task1/embeddings/text-embedding-3-small.npz
+
+Without `--store`, clustered random vectors stand in for real table embeddings.
+With `--store`, the cached table embeddings are used and queries are noisy copies of tables.
+"""
+import argparse, os, sys, time
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import numpy as np
+from src.retrieval_graph.embedding import _unit_matrix, rank_by_vectors
+from src.retrieval_graph.ann import IVFIndex, recall_at_k
+
+
+def synthetic(n, dim, clusters, rng):
+    centers = rng.standard_normal((clusters, dim), dtype=np.float32)
+    labels = rng.integers(0, clusters, size=n)
+    return _unit_matrix(centers[labels] + 0.6 * rng.standard_normal((n, dim), dtype=np.float32))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ANN recall/latency sweep")
+    parser.add_argument("--tables", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--clusters", type=int, default=500)
+    parser.add_argument("--store", type=str, default=None, help="EmbeddingStore .npz to use")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--nlist", type=int, default=None)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32, 64])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    if args.store:
+        with np.load(args.store, allow_pickle=False) as z:
+            mat = _unit_matrix(z["vectors"])
+    else:
+        mat = synthetic(args.tables, args.dim, args.clusters, rng)
+    n = mat.shape[0]
+    rows = rng.integers(0, n, size=args.queries)
+    queries = _unit_matrix(mat[rows] + 0.3 * rng.standard_normal((args.queries, mat.shape[1]),
+                                                                  dtype=np.float32) / np.sqrt(mat.shape[1]))
+    names = [f"t{i}" for i in range(n)]
+
+    t0 = time.perf_counter()
+    index = IVFIndex.build(mat, nlist=args.nlist)
+    print(f"tables={n} dim={mat.shape[1]} nlist={index.nlist} build={time.perf_counter() - t0:.2f}s")
+
+    t0 = time.perf_counter()
+    for q in queries:
+        rank_by_vectors(q, mat, names, args.k)
+    exact_ms = (time.perf_counter() - t0) * 1000 / len(queries)
+    print(f"{'exact':>8} recall@{args.k}=1.000  {exact_ms:8.3f} ms/query")
+
+    for nprobe in args.nprobe:
+        t0 = time.perf_counter()
+        for q in queries:
+            index.search(mat, q, args.k, nprobe)
+        ms = (time.perf_counter() - t0) * 1000 / len(queries)
+        rec = recall_at_k(index, mat, queries, args.k, nprobe)
+        print(f"{'nprobe=' + str(nprobe):>8} recall@{args.k}={rec:.3f}  {ms:8.3f} ms/query  "
+              f"({exact_ms / ms:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""
+Microbenchmark: per-call overhead of building a new ChatOpenAI per call (old behaviour)
+vs. the cached, connection-pooled client returned by `load_chat_model`.
+
+Runs against the local fake server, so latency is the stub's `--latency` plus client overhead.
+
+Usage:
+  python benchmarks/bench_chat_client.py --calls 200 --latency 0.0
+"""
+import argparse, os, sys, time
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from fake_openai_server import serve
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chat client reuse microbenchmark")
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.0, help="Stub server latency (s)")
+    parser.add_argument("--port", type=int, default=8766)
+    args = parser.parse_args()
+
+    server = serve(port=args.port, latency=args.latency)
+    os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{args.port}/v1"
+    os.environ.setdefault("OPENAI_API_KEY", "fake")
+    os.environ["LLM_CACHE"] = "off"   # identical messages: time the pooled HTTP calls, not cache hits
+
+    from langchain_openai import ChatOpenAI
+    from src.retrieval_graph.utils import load_chat_model
+
+    messages = [{"role": "system", "content": "You are a test."}, {"role": "user", "content": "ping"}]
+
+    t0 = time.perf_counter()
+    for _ in range(args.calls):
+        llm = ChatOpenAI(model="fake", api_key=os.environ["OPENAI_API_KEY"],
+                         base_url=os.environ["OPENAI_BASE_URL"], temperature=0.7)
+        llm.invoke(messages)
+    fresh = (time.perf_counter() - t0) / args.calls
+
+    load_chat_model("fake").invoke(messages)   # warm up: build client + open connection once
+    t0 = time.perf_counter()
+    for _ in range(args.calls):
+        load_chat_model("fake").invoke(messages)
+    cached = (time.perf_counter() - t0) / args.calls
+
+    print(f"new client per call : {fresh * 1000:8.2f} ms/call")
+    print(f"cached pooled client: {cached * 1000:8.2f} ms/call")
+    print(f"saved per call      : {(fresh - cached) * 1000:8.2f} ms ({fresh / cached:.1f}x)")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark: CLI startup cost (`python -X importtime`) against a tracked budget.
+
+For every module in benchmarks/import_budget.json:
+- cumulative import time of the module (fastest of --runs fresh interpreters),
+- the heaviest direct imports it pulls in,
+- heavy modules that must NOT be loaded by the import alone (numpy, pandas, openai, LangChain).
+Also times `python <script> --help` end to end.
+
+Times are relative to a baseline, so the budgets measure the project's own imports rather
+than the machine: the "baseline" stdlib modules of the budget file (e.g. typing, ~20 ms on a
+slow box), plus a module's own "baseline" list, are imported before the module under test, and `--help` is charged only the time
+above a bare `python -c "import <baseline>"`.
+
+Exits with status 1 if any budget is exceeded or a forbidden module is loaded, so it can gate CI.
+
+Usage:
+  python benchmarks/bench_import_time.py
+  python benchmarks/bench_import_time.py --runs 7 --top 8 --json outputs/import_time.json
+"""
+import argparse, json, os, subprocess, sys, time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+DEFAULT_BUDGET = os.path.join(os.path.dirname(os.path.abspath(__file__)), "import_budget.json")
+
+
+def parse_importtime(stderr: str):
+    """[(self_us, cumulative_us, depth, name)] from `-X importtime` output."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3 or not parts[0].strip().isdigit():
+            continue   # header line
+        raw = parts[2].rstrip()
+        name = raw.lstrip()
+        depth = (len(raw) - len(name) - 1) // 2
+        rows.append((int(parts[0]), int(parts[1]), depth, name))
+    return rows
+
+
+def measure_import(module: str, forbid, baseline=()):
+    """Cumulative import time (ms), its direct children and which forbidden modules got loaded."""
+    pre = "".join(f"import {m}; " for m in baseline)
+    code = (f"{pre}import sys; import {module}; "
+            f"print(','.join(m for m in {list(forbid)!r} if m in sys.modules))")
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=ROOT,
+                          capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "import failed")
+    rows = parse_importtime(proc.stderr)
+    # importtime prints children before their parent; the module's own row is its last top-level entry
+    total_us, children, pending = 0, [], []
+    for self_us, cum_us, depth, name in rows:
+        if depth == 0:
+            if name == module:
+                total_us, children = cum_us, [(c, n) for _, c, d, n in pending if d == 1]
+            pending = []
+        else:
+            pending.append((self_us, cum_us, depth, name))
+    loaded = [m for m in proc.stdout.strip().split(",") if m]
+    return total_us / 1000.0, children, loaded
+
+
+def measure_wall(argv) -> float:
+    """Wall time (ms) of one `python <argv>` run."""
+    t0 = time.perf_counter()
+    proc = subprocess.run([sys.executable, *argv], cwd=ROOT, capture_output=True, text=True)
+    dt = (time.perf_counter() - t0) * 1000
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "run failed")
+    return dt
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import-time budget check")
+    parser.add_argument("--budget", type=str, default=DEFAULT_BUDGET)
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters per measurement (fastest counts)")
+    parser.add_argument("--top", type=int, default=5, help="Heaviest direct imports to show per module")
+    parser.add_argument("--json", type=str, default=None, help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    with open(args.budget, "r", encoding="utf-8") as f:
+        budget = json.load(f)
+
+    baseline = budget.get("baseline", [])
+    base_code = "; ".join(f"import {m}" for m in baseline) or "pass"
+    base_ms = min(measure_wall(["-c", base_code]) for _ in range(args.runs))
+    failures, results = [], {"baseline": {"modules": baseline, "wall_ms": base_ms}, "modules": {}, "help": {}}
+    print(f"baseline `python -c \"{base_code}\"`: {base_ms:.1f} ms (preloaded before every module below)")
+    print(f"{'module':<40}{'ms':>10}{'budget':>9}  status")
+    for module, spec in budget.get("modules", {}).items():
+        forbid = spec.get("forbid", [])
+        try:
+            # a module may add its own stdlib baseline (e.g. http.server for the server)
+            pre = baseline + spec.get("baseline", [])
+            runs = [measure_import(module, forbid, pre) for _ in range(args.runs)]
+        except RuntimeError as e:
+            print(f"{module:<40}{'-':>10}{spec['max_ms']:>9}  ERROR {e}")
+            failures.append(module)
+            results["modules"][module] = {"error": str(e)}
+            continue
+        fastest = min(runs, key=lambda r: r[0])
+        ms, children, loaded = fastest[0], fastest[1], runs[-1][2]
+        ok = ms <= spec["max_ms"] and not loaded
+        status = "ok" if ok else "OVER BUDGET" if not loaded else f"LOADS {', '.join(loaded)}"
+        print(f"{module:<40}{ms:>10.1f}{spec['max_ms']:>9}  {status}")
+        for cum_us, name in sorted(children, reverse=True)[: args.top]:
+            print(f"    {cum_us / 1000:8.1f} ms  {name}")
+        if not ok:
+            failures.append(module)
+        results["modules"][module] = {"ms": ms, "max_ms": spec["max_ms"], "forbidden_loaded": loaded,
+                                      "top_imports": [[n, c / 1000] for c, n in
+                                                      sorted(children, reverse=True)[: args.top]]}
+
+    for script, spec in budget.get("help", {}).items():
+        try:
+            ms = min(measure_wall([script, "--help"]) for _ in range(args.runs)) - base_ms
+        except RuntimeError as e:
+            print(f"{script + ' --help':<40}{'-':>10}{spec['max_ms']:>9}  ERROR {e}")
+            failures.append(script)
+            results["help"][script] = {"error": str(e)}
+            continue
+        ok = ms <= spec["max_ms"]
+        print(f"{script + ' --help':<40}{ms:>10.1f}{spec['max_ms']:>9}  {'ok' if ok else 'OVER BUDGET'}")
+        if not ok:
+            failures.append(script)
+        results["help"][script] = {"ms_over_baseline": ms, "max_ms": spec["max_ms"]}
+
+    if args.json:
+        os.makedirs(os.path.dirname(args.json) or ".", exist_ok=True)
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if failures:
+        print(f"budget exceeded: {', '.join(failures)}")
+        sys.exit(1)
+    print("all within budget")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,368 @@
+# -*- coding: utf-8 -*-
+"""
+Offline benchmark suite for Tasks 1-3 (no network, no API key).
+
+The real task code runs against the deterministic stand-ins of stub_backends.py (chat model
+and embeddings client, configurable latency / failure rate / token counts) over synthetic
+catalogs from synth_catalog.py (10 / 1k / 100k tables, narrow or wide).
+
+Stages (each one runs in a fresh subprocess, so peak RSS is per stage):
+  summarize   Task 1: column profiling + LLM summary per CSV (--workers threads)
+  rank        Task 2: bm25 (build + queries), embedding (table embeddings + batched queries),
+              llm (one ranking call per query), hybrid (bm25 top --limit -> LLM rerank)
+  evaluate    Task 3: per-table calls, asyncio (--concurrency), batched (--batch-size)
+
+Output: one JSON file (config, environment, one record per stage/step/catalog with wall time,
+throughput, peak RSS, calls/failures/tokens). `--baseline old.json` prints the wall-time ratio
+of every step against a previous run.
+
+Usage:
+  python benchmarks/bench_suite.py
+  python benchmarks/bench_suite.py --sizes 10 1k 100k --shapes narrow --stages rank --queries 200
+  python benchmarks/bench_suite.py --chat-latency 0.3 --chat-fail-rate 0.05 --baseline outputs/bench/last.json
+  # provider quota enforced by the stubs (429s); the client limits of scheduler.py come from env
+  LLM_RPM=1150 python benchmarks/bench_suite.py --stages evaluate --chat-rpm 1200
+  # malformed JSON answers: repaired client-side or re-asked (structured_output.py)
+  python benchmarks/bench_suite.py --stages summarize evaluate --chat-drift-rate 0.3
+"""
+import argparse, contextlib, io, json, os, platform, subprocess, sys, tempfile, time
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synth_catalog import SIZES, SHAPES, make_summaries, make_queries, write_csvs
+
+STAGES = ["summarize", "rank", "evaluate"]
+
+
+def peak_rss_mb():
+    """Process high-water RSS in MB (None where the resource module is missing, e.g. Windows)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(kb / 1024 if sys.platform != "darwin" else kb / 1024 / 1024, 1)
+
+
+class StageAborted(Exception):
+    """A required step failed (already recorded)."""
+
+
+def structured_totals():
+    """Parse failures / repaired / re-asked answers recorded by metrics.py so far (all stages)."""
+    from src.retrieval_graph.metrics import RECORDER
+    snap = RECORDER.snapshot().values()
+    return {k: sum(s[k] for s in snap) for k in ("parse_failures", "repaired", "reasked")}
+
+
+class Recorder:
+    """Collects one record per timed step of a stage."""
+
+    def __init__(self, stage, size, shape, tables):
+        self.base = {"stage": stage, "size": size, "shape": shape, "tables": tables}
+        self.records = []
+
+    @contextlib.contextmanager
+    def step(self, name, items, unit, chat=None, emb=None, optional=False):
+        """Time one step; an error is recorded and, unless `optional`, ends the stage."""
+        rec = dict(self.base, step=name, items=items, unit=unit)
+        c0 = (chat.calls, chat.failures, chat.rate_limited, chat.drifted, structured_totals()) if chat else None
+        e0 = (emb.requests, emb.failures, emb.rate_limited) if emb else None
+        t0 = time.perf_counter()
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):   # the tasks print per table
+                yield rec
+        except Exception as e:
+            rec["error"] = f"{type(e).__name__}: {e}"
+            if not optional:
+                self._finish(rec, t0, chat, emb, c0, e0)
+                raise StageAborted() from e
+        self._finish(rec, t0, chat, emb, c0, e0)
+
+    def _finish(self, rec, t0, chat, emb, c0, e0):
+        rec["wall_s"] = round(time.perf_counter() - t0, 4)
+        rec["throughput"] = round(rec["items"] / rec["wall_s"], 2) if rec["wall_s"] and "error" not in rec else None
+        rec["peak_rss_mb"] = peak_rss_mb()
+        if chat:
+            rec["llm_calls"], rec["llm_failures"] = chat.calls - c0[0], chat.failures - c0[1]
+            rec["llm_429"] = chat.rate_limited - c0[2]
+            rec["llm_drifted"] = chat.drifted - c0[3]
+            for k, v in structured_totals().items():
+                rec[k] = v - c0[4][k]
+        if emb:
+            rec["embed_requests"], rec["embed_failures"] = emb.requests - e0[0], emb.failures - e0[1]
+            rec["embed_429"] = emb.rate_limited - e0[2]
+        self.records.append(rec)
+
+
+def run_summarize(opts, rec, chat, workdir):
+    from concurrent.futures import ThreadPoolExecutor
+    import task1_schema_summary as t1
+
+    n = min(SIZES[opts.size], opts.csv_max)
+    paths = write_csvs(os.path.join(workdir, "csv"), make_summaries(n, SHAPES[opts.shape], opts.seed),
+                       rows=opts.rows, seed=opts.seed)
+    prompt = t1.get_schema_prompt()
+    profiles = {}
+    with rec.step("profile", len(paths), "tables/s"):
+        with ThreadPoolExecutor(max_workers=opts.workers) as pool:
+            profiles = dict(zip(paths, pool.map(lambda p: t1.get_profile(p, {}), paths)))
+    with rec.step("summarize", len(paths), "tables/s", chat=chat) as r:
+        llm = t1.get_chat_model("stub")
+        with ThreadPoolExecutor(max_workers=opts.workers) as pool:
+            out = list(pool.map(lambda p: t1.summarize_table(
+                llm, prompt, p, 5, ((profiles.get(p) or {}).get("profile"))), paths))
+        r["fallbacks"] = sum(1 for _, from_llm in out if not from_llm)
+
+
+def run_rank(opts, rec, chat, emb, workdir):
+    import task2_search as t2
+
+    summaries = make_summaries(SIZES[opts.size], SHAPES[opts.shape], opts.seed)
+    queries = make_queries(summaries, opts.queries, opts.seed)
+    by_name = {s["table"]: s for s in summaries}
+
+    def recall(results):
+        hits = [bool(set(q["gold"]) & {c["table"] for c in res}) for q, res in zip(queries, results)]
+        return round(sum(hits) / len(hits), 4) if hits else None
+
+    from src.retrieval_graph.lexical import load_bm25_index
+    bm25 = None
+    with rec.step("bm25_build", len(summaries), "tables/s"):
+        bm25 = load_bm25_index(summaries, os.path.join(workdir, "bm25_index.json"))
+    with rec.step("bm25_query", len(queries), "queries/s") as r:
+        res = [bm25.search(q["query"], opts.k) for q in queries]
+        r["recall_at_k"] = recall(res)
+
+    ranker = None
+    with rec.step("embedding_build", len(summaries), "tables/s", emb=emb, optional=True):
+        from stub_backends import install
+        from src.retrieval_graph.embedding import EmbeddingRanker
+        install(embeddings=emb)
+        ranker = EmbeddingRanker(summaries, "stub-embedding", store_dir=None)
+    if ranker is not None:
+        with rec.step("embedding_query", len(queries), "queries/s", emb=emb, optional=True) as r:
+            res = []
+            for i in range(0, len(queries), opts.batch_size):
+                res += ranker.rank([q["query"] for q in queries[i:i + opts.batch_size]], opts.k)
+            r["recall_at_k"] = recall(res)
+
+    llm_queries = queries[: opts.llm_queries]
+    snippets = [t2.build_table_snippet(s) for s in summaries[: opts.limit]]
+    with rec.step("llm", len(llm_queries), "queries/s", chat=chat):
+        for q in llm_queries:
+            try:
+                t2.normalize_choices(t2.call_llm_rank(q["query"], snippets, opts.k, "stub"), summaries)
+            except Exception:
+                pass   # injected failure: counted via llm_failures
+    pool = summaries[: opts.tournament_max]
+    with rec.step("llm_tournament", len(llm_queries), "queries/s", chat=chat) as r:
+        all_snippets = [t2.build_table_snippet(s) for s in pool]
+        res, levels = [], []
+        for q in llm_queries:
+            try:
+                out = t2.call_llm_rank(q["query"], all_snippets, opts.k, "stub", budget_tokens=opts.prompt_tokens)
+                levels.append((out.get("tournament") or {}).get("levels", 1))
+                res.append(t2.normalize_choices(out, by_name))
+            except Exception:
+                res.append([])
+        r["tables_ranked"], r["levels"] = len(pool), max(levels) if levels else None
+        r["recall_at_k"] = recall(res)
+    ns = argparse.Namespace(k=opts.k, model="stub")
+    with rec.step("hybrid", len(llm_queries), "queries/s", chat=chat) as r:
+        res = []
+        for q in llm_queries:
+            cands = bm25.search(q["query"], opts.limit)
+            try:
+                res.append(t2.rerank_candidates(ns, q["query"], cands, summaries, by_name))
+            except Exception:
+                res.append([])
+        r["recall_at_k"] = recall(res)
+
+
+def run_evaluate(opts, rec, chat, workdir):
+    import asyncio
+    import task3_eval as t3
+    from src.retrieval_graph.lexical import load_bm25_index
+
+    summaries = make_summaries(SIZES[opts.size], SHAPES[opts.shape], opts.seed)
+    queries = make_queries(summaries, opts.llm_queries, opts.seed)
+    by_name = {s["table"]: s for s in summaries}
+    bm25 = load_bm25_index(summaries, None)
+    candidates = {q["id"]: [c["table"] for c in bm25.search(q["query"], opts.k)] for q in queries}
+    needed = sorted({t for ts in candidates.values() for t in ts})
+    paths = dict(zip(needed, write_csvs(os.path.join(workdir, "csv"), [by_name[t] for t in needed],
+                                        rows=opts.rows, seed=opts.seed)))
+
+    def jobs_for(q):
+        return [{"table": t, "summary": by_name[t]["summary"], "columns": by_name[t]["columns"],
+                 "samples": t3.sample_rows(paths[t], n=3)} for t in candidates[q["id"]]]
+
+    n_items = sum(len(v) for v in candidates.values())
+    all_jobs = []
+    with rec.step("samples", n_items, "tables/s"):
+        all_jobs = [(q, jobs_for(q)) for q in queries]
+    with rec.step("per_table", n_items, "tables/s", chat=chat) as r:
+        stats = {}
+        for q, jobs in all_jobs:
+            for j in jobs:
+                try:
+                    t3.call_llm_eval("stub", q["query"], j["table"], j["summary"], j["columns"], j["samples"],
+                                     stats=stats)
+                except Exception:
+                    pass
+        r["input_tokens"], r["output_tokens"] = stats.get("input_tokens", 0), stats.get("output_tokens", 0)
+    with rec.step("async", n_items, "tables/s", chat=chat) as r:
+        for q, jobs in all_jobs:
+            asyncio.run(t3.eval_candidates_async("stub", q["query"], jobs, opts.concurrency))
+        r["concurrency"] = opts.concurrency
+    with rec.step("batched", n_items, "tables/s", chat=chat) as r:
+        stats = {}
+        for q, jobs in all_jobs:
+            for i in range(0, len(jobs), opts.eval_batch_size):
+                try:
+                    t3.call_llm_eval_batch("stub", q["query"], jobs[i:i + opts.eval_batch_size], stats)
+                except Exception:
+                    pass   # per-table fallback hit an injected failure
+        r["input_tokens"], r["output_tokens"] = stats.get("input_tokens", 0), stats.get("output_tokens", 0)
+        r["retried"] = stats.get("retried", 0)
+
+
+def worker(opts):
+    """Run one (stage, size, shape) in this process and write its records to --result-file."""
+    from stub_backends import StubChatModel, StubEmbeddingsClient, install
+
+    chat = StubChatModel(latency=opts.chat_latency, per_token=opts.chat_per_token,
+                         fail_rate=opts.chat_fail_rate, completion_tokens=opts.completion_tokens,
+                         seed=opts.seed, rpm=opts.chat_rpm, tpm=opts.chat_tpm, drift_rate=opts.chat_drift_rate)
+    emb = StubEmbeddingsClient(dim=opts.dim, latency=opts.embed_latency, per_item=opts.embed_per_item,
+                               fail_rate=opts.embed_fail_rate, seed=opts.seed,
+                               rpm=opts.embed_rpm, tpm=opts.embed_tpm)
+    os.environ["LLM_CACHE"] = "off"        # measure the calls, not the response cache
+    os.environ["EMBED_RETRIES"] = os.environ.get("EMBED_RETRIES", "3")
+    rec = Recorder(opts.stage, opts.size, opts.shape, SIZES[opts.size])
+    with tempfile.TemporaryDirectory(prefix="bench_suite_") as workdir:
+        try:
+            install(chat=chat, tasks=[{"summarize": "task1_schema_summary", "rank": "task2_search",
+                                       "evaluate": "task3_eval"}[opts.stage]])
+            if opts.stage == "summarize":
+                run_summarize(opts, rec, chat, workdir)
+            elif opts.stage == "rank":
+                run_rank(opts, rec, chat, emb, workdir)
+            else:
+                run_evaluate(opts, rec, chat, workdir)
+        except StageAborted:
+            pass
+        except Exception as e:   # setup failed (e.g. a missing dependency): one error record
+            rec.records.append(dict(rec.base, step="setup", error=f"{type(e).__name__}: {e}"))
+    with open(opts.result_file, "w", encoding="utf-8") as f:
+        json.dump(rec.records, f)
+
+
+def fmt(v, spec):
+    return format(v, spec) if isinstance(v, (int, float)) else "-"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark suite for Tasks 1-3 (stub LLM/embeddings)")
+    parser.add_argument("--stages", nargs="+", default=STAGES, choices=STAGES)
+    parser.add_argument("--sizes", nargs="+", default=["10", "1k"], choices=list(SIZES),
+                        help="Catalog sizes (100k: several GB of RAM with --shapes wide)")
+    parser.add_argument("--shapes", nargs="+", default=list(SHAPES), choices=list(SHAPES))
+    parser.add_argument("--queries", type=int, default=200, help="Queries for bm25/embedding ranking")
+    parser.add_argument("--llm-queries", type=int, default=20, help="Queries for llm/hybrid ranking and Task 3")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--limit", type=int, default=30, help="LLM candidates (llm/hybrid)")
+    parser.add_argument("--batch-size", type=int, default=256, help="Embedding queries per batch")
+    parser.add_argument("--prompt-tokens", type=int, default=8000, help="LLM ranking: candidate tokens per prompt")
+    parser.add_argument("--tournament-max", type=int, default=5000,
+                        help="llm_tournament step: rank the first N tables of the catalog (no --limit)")
+    parser.add_argument("--workers", type=int, default=8, help="Task 1 threads")
+    parser.add_argument("--concurrency", type=int, default=8, help="Task 3 asyncio concurrency")
+    parser.add_argument("--eval-batch-size", type=int, default=5, help="Task 3 candidates per batched call")
+    parser.add_argument("--csv-max", type=int, default=1000, help="Max CSV files written for Task 1")
+    parser.add_argument("--rows", type=int, default=200, help="Rows per synthetic CSV")
+    parser.add_argument("--chat-latency", type=float, default=0.05, help="Stub chat latency per call (s)")
+    parser.add_argument("--chat-per-token", type=float, default=0.0, help="Stub chat latency per output token (s)")
+    parser.add_argument("--chat-fail-rate", type=float, default=0.0)
+    parser.add_argument("--chat-drift-rate", type=float, default=0.0,
+                        help="Stub chat answers that drift from the JSON shape (fences, truncation, ...)")
+    parser.add_argument("--completion-tokens", type=int, default=None,
+                        help="Reported completion tokens per call (default: size of the stub answer)")
+    parser.add_argument("--chat-rpm", type=float, default=0, help="Stub chat quota, requests/min (429 above)")
+    parser.add_argument("--chat-tpm", type=float, default=0, help="Stub chat quota, tokens/min (429 above)")
+    parser.add_argument("--embed-latency", type=float, default=0.02, help="Stub embeddings latency per request (s)")
+    parser.add_argument("--embed-per-item", type=float, default=0.0, help="Stub embeddings latency per text (s)")
+    parser.add_argument("--embed-fail-rate", type=float, default=0.0)
+    parser.add_argument("--embed-rpm", type=float, default=0, help="Stub embeddings quota, requests/min")
+    parser.add_argument("--embed-tpm", type=float, default=0, help="Stub embeddings quota, tokens/min")
+    parser.add_argument("--dim", type=int, default=256, help="Stub embedding dimension")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", type=str, default=os.path.join("outputs", "bench", "suite.json"))
+    parser.add_argument("--baseline", type=str, default=None, help="Previous --out file to compare against")
+    # internal: run one stage in this process
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--stage", type=str, default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--size", type=str, default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--shape", type=str, default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--result-file", type=str, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        return worker(args)
+
+    passthrough = sys.argv[1:]
+    results = []
+    print(f"{'stage':<10}{'size':>6} {'shape':<7}{'step':<16}{'wall s':>9}{'throughput':>18}"
+          f"{'peak MB':>9}  notes")
+    for stage in args.stages:
+        for size in args.sizes:
+            for shape in args.shapes:
+                with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as tf:
+                    result_file = tf.name
+                cmd = [sys.executable, os.path.abspath(__file__), *passthrough, "--worker",
+                       "--stage", stage, "--size", size, "--shape", shape, "--result-file", result_file]
+                proc = subprocess.run(cmd, capture_output=True, text=True,
+                                      cwd=os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+                try:
+                    with open(result_file, "r", encoding="utf-8") as f:
+                        records = json.load(f)
+                except Exception:
+                    err = (proc.stderr.strip().splitlines() or ["worker failed"])[-1]
+                    records = [{"stage": stage, "size": size, "shape": shape, "step": "worker", "error": err}]
+                finally:
+                    os.unlink(result_file)
+                for r in records:
+                    notes = r.get("error") or ", ".join(
+                        f"{k}={r[k]}" for k in ("recall_at_k", "levels", "llm_calls", "llm_failures", "llm_429",
+                                                "llm_drifted", "parse_failures", "repaired", "reasked",
+                                                "embed_requests", "embed_429", "fallbacks", "retried")
+                        if r.get(k) not in (None, 0))
+                    print(f"{stage:<10}{size:>6} {shape:<7}{r.get('step', ''):<16}{fmt(r.get('wall_s'), '9.3f')}"
+                          f"{fmt(r.get('throughput'), '10.1f'):>10} {r.get('unit', ''):<9}"
+                          f"{fmt(r.get('peak_rss_mb'), '7.0f'):>7}  {notes}")
+                results += records
+
+    cfg = {k: v for k, v in vars(args).items()
+           if k not in ("worker", "stage", "size", "shape", "result_file", "out", "baseline")}
+    out = {"config": cfg, "env": {"python": platform.python_version(), "platform": platform.platform(),
+                                  "cpus": os.cpu_count(), "time": time.strftime("%Y-%m-%dT%H:%M:%S")},
+           "results": results}
+    os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(out, f, indent=2)
+    print(f"Saved: {args.out}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            base = {(r["stage"], r["size"], r["shape"], r.get("step")): r for r in json.load(f)["results"]}
+        print(f"\nvs baseline {args.baseline} (wall time new/old, <1 = faster)")
+        for r in results:
+            b = base.get((r["stage"], r["size"], r["shape"], r.get("step")))
+            if b and b.get("wall_s") and r.get("wall_s") and "error" not in r and "error" not in b:
+                print(f"  {r['stage']:<10}{r['size']:>6} {r['shape']:<7}{r['step']:<16}"
+                      f"{r['wall_s'] / b['wall_s']:6.2f}x  ({b['wall_s']:.3f}s -> {r['wall_s']:.3f}s)")
+
+
+if __name__ == "__main__":
+    main()
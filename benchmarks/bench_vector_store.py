@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark: table-embedding layouts of src/retrieval_graph/vector_store.py.
+
+For every (dtype, dim) layout the matrix is written and memory-mapped like task2 does, then:
+- bytes of the layout vs. the float32 file and vs. Python lists of floats (what `_embed_texts` returns),
+- recall@k of the top-k against exact float32 scoring,
+- per-query latency on the mapped matrix.
+With `--processes N`, N worker processes map the same file and scan it; their file-backed
+(shared page cache) and anonymous (private) RSS show that the pages are not copied per process.
+
+Usage:
+  python benchmarks/bench_vector_store.py --tables 100000 --dim 1536 --dims 1536 512 256
+  python benchmarks/bench_vector_store.py --store outputs/task1/embeddings/text-embedding-3-small.npz
+  python benchmarks/bench_vector_store.py --tables 200000 --dim 512 --processes 4
+
+Without `--store`, clustered random vectors stand in for real table embeddings.
+"""
+import argparse, os, sys, tempfile, time
+from multiprocessing import Pool
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import numpy as np
+from src.retrieval_graph.embedding import _unit_matrix, _scores, _query_matrix, _topk_indices
+from src.retrieval_graph.vector_store import VectorFile
+
+LIST_FLOAT_BYTES = 8 + 24   # list slot + one Python float object
+
+
+def synthetic(n, dim, clusters, rng):
+    centers = rng.standard_normal((clusters, dim), dtype=np.float32)
+    labels = rng.integers(0, clusters, size=n)
+    return _unit_matrix(centers[labels] + 0.6 * rng.standard_normal((n, dim), dtype=np.float32))
+
+
+def topk_sets(mat, queries, k):
+    q = _query_matrix(queries, mat.shape[1])
+    return [set(_topk_indices(row, k).tolist()) for row in _scores(mat, q)]
+
+
+def proc_rss():
+    """(file-backed MB, anonymous MB) of this process (Linux /proc; (None, None) elsewhere)."""
+    out = {}
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith(("RssFile:", "RssAnon:")):
+                    key, val = line.split(":")
+                    out[key] = int(val.split()[0]) / 1024
+    except OSError:
+        return None, None
+    return out.get("RssFile"), out.get("RssAnon")
+
+
+def scan_worker(task):
+    base, dtype, dim, q = task
+    mat = VectorFile(base, dtype, dim).open()
+    _scores(mat, _query_matrix(q, mat.shape[1]))   # touch every page
+    return proc_rss()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Vector layout recall / memory sweep")
+    parser.add_argument("--tables", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--clusters", type=int, default=500)
+    parser.add_argument("--store", type=str, default=None, help="EmbeddingStore .npz to use")
+    parser.add_argument("--dtypes", nargs="+", default=["float32", "float16", "int8"])
+    parser.add_argument("--dims", type=int, nargs="+", default=None,
+                        help="Truncation dims to try (default: full, 1/2, 1/4 of --dim)")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--processes", type=int, default=0, help="Also map the float32 file from N processes")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    if args.store:
+        with np.load(args.store, allow_pickle=False) as z:
+            mat = _unit_matrix(z["vectors"])
+    else:
+        mat = synthetic(args.tables, args.dim, args.clusters, rng)
+    n, full_dim = mat.shape
+    rows = rng.integers(0, n, size=args.queries)
+    queries = _unit_matrix(mat[rows] + 0.3 * rng.standard_normal((args.queries, full_dim),
+                                                                  dtype=np.float32) / np.sqrt(full_dim))
+    dims = args.dims or [full_dim, full_dim // 2, full_dim // 4]
+    exact = topk_sets(mat, queries, args.k)
+    f32_bytes = mat.nbytes
+    print(f"tables={n} dim={full_dim}  float32={f32_bytes / 1e6:.1f}MB  "
+          f"python lists~{n * full_dim * LIST_FLOAT_BYTES / 1e6:.0f}MB")
+    print(f"{'layout':<16}{'MB':>9}{'vs f32':>8}{'vs lists':>9}{'recall@' + str(args.k):>10}{'ms/query':>10}")
+
+    with tempfile.TemporaryDirectory(prefix="bench_vectors_") as tmp:
+        base = os.path.join(tmp, "bench")
+        for dim in dims:
+            for dtype in args.dtypes:
+                vf = VectorFile(base, dtype, None if dim >= full_dim else dim)
+                vf.write(mat, "bench")
+                mapped = vf.open("bench")
+                size = os.path.getsize(vf.vec_path) + (os.path.getsize(vf.scale_path) if dtype == "int8" else 0)
+                t0 = time.perf_counter()
+                got = topk_sets(mapped, queries, args.k)
+                ms = (time.perf_counter() - t0) * 1000 / len(queries)
+                recall = sum(len(a & b) for a, b in zip(exact, got)) / (args.k * len(exact))
+                label = f"{dtype}/d{dim}"
+                print(f"{label:<16}{size / 1e6:9.1f}{f32_bytes / size:7.1f}x"
+                      f"{n * full_dim * LIST_FLOAT_BYTES / size:8.0f}x{recall:10.3f}{ms:10.3f}")
+                del mapped
+
+        if args.processes:
+            VectorFile(base, "float32").write(mat, "bench")
+            with Pool(args.processes) as pool:
+                res = pool.map(scan_worker, [(base, "float32", None, queries[:8])] * args.processes)
+            print(f"\n{args.processes} processes mapping one {f32_bytes / 1e6:.1f}MB float32 file:")
+            for i, (file_mb, anon_mb) in enumerate(res):
+                if file_mb is None:
+                    print("  RSS breakdown needs Linux /proc")
+                    break
+                print(f"  worker {i}: file-backed (shared) {file_mb:8.1f}MB  anonymous (private) {anon_mb:8.1f}MB")
+
+
+if __name__ == "__main__":
+    main()
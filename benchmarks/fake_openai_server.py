@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""
+Local stand-in for the OpenAI API: POST /v1/embeddings and POST /v1/chat/completions.
+
+- Deterministic vectors (hash of the text), so results can be compared across runs.
+- Simulated latency: `--latency` seconds per request + `--per-item` seconds per input.
+- Enforces `--max-items` inputs per request (HTTP 400 above it, like the real API).
+- `--fail-rate` returns HTTP 500 for a random share of requests (to exercise retries).
+- `--rpm` / `--tpm` enforce a quota: requests over it get HTTP 429 with a `retry-after-ms`
+  header (scheduler.py; set LLM_RPM / EMBED_TPM ... on the client to stay under it).
+- Chat completions answer with `--reply` (a fixed JSON string) after `--latency` seconds.
+
+Usage:
+  python benchmarks/fake_openai_server.py --port 8765
+  OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=x python task2_search.py ... --mode embedding
+  python benchmarks/fake_openai_server.py --rpm 600 --tpm 200000
+"""
+import argparse, hashlib, json, os, random, struct, sys, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from stub_backends import StubQuota, StubRateLimitError
+
+
+def fake_vector(text: str, dim: int):
+    out, counter = [], 0
+    while len(out) < dim:
+        digest = hashlib.sha256(f"{counter}:{text}".encode("utf-8")).digest()
+        out += [b / 127.5 - 1.0 for b in struct.unpack("32B", digest)]
+        counter += 1
+    return out[:dim]
+
+
+def make_handler(opts):
+    stats = {"requests": 0, "inputs": 0, "failed": 0, "rate_limited": 0}
+    lock = threading.Lock()
+    quota = StubQuota(opts.rpm, opts.tpm)
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"   # keep-alive, so client connection pooling is measurable
+
+        def log_message(self, *a):
+            pass
+
+        def _send(self, code, obj, headers=None):
+            body = json.dumps(obj).encode("utf-8")
+            self.send_response(code)
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            with lock:
+                self._send(200, dict(stats))
+
+        def _admit(self, tokens):
+            """True if within the quota, else a 429 was sent."""
+            try:
+                quota.admit(tokens)
+                return True
+            except StubRateLimitError as e:
+                with lock:
+                    stats["rate_limited"] += 1
+                self._send(429, {"error": {"message": str(e), "type": "requests", "code": "rate_limit_exceeded"}},
+                           e.response.headers)
+                return False
+
+        def _chat(self, req):
+            with lock:
+                stats["requests"] += 1
+            prompt_tokens = sum(len(str(m.get("content", ""))) // 4 + 1 for m in req.get("messages", []))
+            if not self._admit(prompt_tokens + len(opts.reply) // 4 + 1):
+                return
+            time.sleep(opts.latency)
+            if random.random() < opts.fail_rate:
+                with lock:
+                    stats["failed"] += 1
+                return self._send(500, {"error": {"message": "injected failure"}})
+            self._send(200, {
+                "id": "chatcmpl-fake", "object": "chat.completion", "created": int(time.time()),
+                "model": req.get("model", "fake"),
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": opts.reply}}],
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(opts.reply) // 4 + 1,
+                          "total_tokens": prompt_tokens + len(opts.reply) // 4 + 1},
+            })
+
+        def do_POST(self):
+            n = int(self.headers.get("Content-Length", "0"))
+            req = json.loads(self.rfile.read(n) or b"{}")
+            if self.path.rstrip("/").endswith("/chat/completions"):
+                return self._chat(req)
+            inputs = req.get("input") or []
+            if isinstance(inputs, str):
+                inputs = [inputs]
+            with lock:
+                stats["requests"] += 1
+                stats["inputs"] += len(inputs)
+            if len(inputs) > opts.max_items:
+                return self._send(400, {"error": {"message": f"too many inputs ({len(inputs)})"}})
+            if not self._admit(sum(len(t) // 4 + 1 for t in inputs)):
+                return
+            time.sleep(opts.latency + opts.per_item * len(inputs))
+            if random.random() < opts.fail_rate:
+                with lock:
+                    stats["failed"] += 1
+                return self._send(500, {"error": {"message": "injected failure"}})
+            self._send(200, {
+                "object": "list",
+                "model": req.get("model", "fake"),
+                "data": [{"object": "embedding", "index": i, "embedding": fake_vector(t, opts.dim)}
+                         for i, t in enumerate(inputs)],
+                "usage": {"prompt_tokens": sum(len(t) // 4 + 1 for t in inputs),
+                          "total_tokens": sum(len(t) // 4 + 1 for t in inputs)},
+            })
+
+    return Handler
+
+
+DEFAULT_REPLY = json.dumps({"query": "", "choices": []})
+
+
+def serve(port=8765, dim=64, latency=0.05, per_item=0.0005, max_items=2048, fail_rate=0.0,
+          reply=DEFAULT_REPLY, rpm=0, tpm=0):
+    """Start the server in a daemon thread and return it (call .shutdown() to stop)."""
+    opts = argparse.Namespace(dim=dim, latency=latency, per_item=per_item,
+                              max_items=max_items, fail_rate=fail_rate, reply=reply, rpm=rpm, tpm=tpm)
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(opts))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake OpenAI API server")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--dim", type=int, default=64)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--per-item", type=float, default=0.0005)
+    parser.add_argument("--max-items", type=int, default=2048)
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    parser.add_argument("--reply", type=str, default=DEFAULT_REPLY, help="Chat completion content")
+    parser.add_argument("--rpm", type=float, default=0, help="Requests/min quota (429 above, 0 = none)")
+    parser.add_argument("--tpm", type=float, default=0, help="Tokens/min quota (429 above, 0 = none)")
+    a = parser.parse_args()
+    server = serve(a.port, a.dim, a.latency, a.per_item, a.max_items, a.fail_rate, a.reply, a.rpm, a.tpm)
+    print(f"fake OpenAI server on http://127.0.0.1:{a.port}/v1 (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
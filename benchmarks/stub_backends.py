@@ -0,0 +1,373 @@
+# -*- coding: utf-8 -*-
+"""
+In-process, deterministic stand-ins for the chat model and the embeddings client.
+
+- StubChatModel: `invoke` / `ainvoke` / `stream` like a LangChain chat model. The answer is built from
+  the request (the system prompt tells which task is asking), so Tasks 1-3 parse it exactly
+  like a real reply: schema summaries, ranked choices, per-table and batched evaluations.
+- StubEmbeddingsClient: `client.embeddings.create(model=..., input=[...])` like the OpenAI SDK,
+  with hash-seeded vectors (same text -> same vector, across runs and processes).
+
+Both simulate latency (`latency` per request + `per_token` per completion token / `per_item`
+per embedded text), inject failures at `fail_rate` (seeded) and report token usage; set
+`completion_tokens` to pin the reported completion size instead of estimating it.
+`rpm` / `tpm` enforce a quota like the provider (StubQuota): a request over it fails at once
+with HTTP 429 and a Retry-After hint, so scheduler.py can be exercised offline.
+`drift_rate` (chat) makes that share of answers drift from the JSON shape like real models do
+(markdown fence, prose, trailing comma, Python repr, numbers as strings, a missing field, a
+truncated tail, an out-of-range rating), so structured_output.py can be exercised offline; a
+model bound to a `response_format` (`bind`, like provider JSON mode) never drifts.
+
+`install(chat, embeddings, tasks)` plugs them into the repo's seams: the `load_chat_model` wrappers of
+task2_search / task3_eval, task1's `get_chat_model` and `embedding._openai_client` (which feeds
+`_embed_texts`), so the real code paths run without network or API key.
+
+Usage:
+  from stub_backends import StubChatModel, StubEmbeddingsClient, install
+  install(StubChatModel(latency=0.2), StubEmbeddingsClient(latency=0.05))
+"""
+import asyncio, hashlib, json, random, re, threading, time
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+
+from src.retrieval_graph import prompts
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+
+class StubAPIError(RuntimeError):
+    """Injected failure (stands in for a 5xx / timeout from the provider; `status_code` like the SDK)."""
+
+    def __init__(self, message: str, status_code: int = 500):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class StubRateLimitError(StubAPIError):
+    """HTTP 429 with a `retry-after-ms` header, like openai.RateLimitError."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message, 429)
+        self.response = SimpleNamespace(status_code=429,
+                                        headers={"retry-after-ms": str(int(retry_after * 1000) + 1)})
+
+
+class StubQuota:
+    """
+    Requests/min and tokens/min limits, refilled continuously with one `window` (s) of burst.
+    `admit(tokens)` consumes the quota or raises StubRateLimitError (nothing is consumed then).
+    """
+
+    def __init__(self, rpm: float = 0, tpm: float = 0, window: float = 1.0):
+        self.limits = [(rpm / 60.0, max(1.0, rpm / 60.0 * window)) if rpm else None,
+                       (tpm / 60.0, max(1.0, tpm / 60.0 * window)) if tpm else None]
+        self.levels = [lim[1] if lim else 0.0 for lim in self.limits]
+        self.rejected = 0
+        self._t = time.monotonic()
+        self._lock = threading.Lock()
+
+    def admit(self, tokens: int) -> None:
+        with self._lock:
+            now = time.monotonic()
+            waits = []
+            for i, (lim, cost) in enumerate(zip(self.limits, (1, tokens))):
+                if lim is None:
+                    continue
+                rate, cap = lim
+                self.levels[i] = min(cap, self.levels[i] + (now - self._t) * rate)
+                # a request larger than the burst is admitted from a full bucket (level goes negative)
+                if self.levels[i] < min(cost, cap):
+                    waits.append((min(cost, cap) - self.levels[i]) / rate)
+            self._t = now
+            if waits:
+                self.rejected += 1
+                raise StubRateLimitError("stub: rate limit exceeded", max(waits))
+            for i, cost in enumerate((1, tokens)):
+                if self.limits[i] is not None:
+                    self.levels[i] -= cost
+
+
+def _tokens(text: str) -> int:
+    return len(text) // 4 + 1
+
+
+def _words(text: str) -> set:
+    return set(_WORD_RE.findall((text or "").lower().replace("_", " ")))
+
+
+def _overlap(query: str, text: str) -> float:
+    q = _words(query)
+    return len(q & _words(text)) / len(q) if q else 0.0
+
+
+class StubMessage:
+    """The parts of an AIMessage the tasks read: content, usage_metadata, response_metadata."""
+
+    def __init__(self, content: str, input_tokens: int, output_tokens: int, cached_tokens: int = 0):
+        self.content = content
+        self.usage_metadata = {"input_tokens": input_tokens, "output_tokens": output_tokens,
+                               "total_tokens": input_tokens + output_tokens,
+                               "input_token_details": {"cache_read": cached_tokens}}
+        self.response_metadata = {"model_name": "stub", "finish_reason": "stop",
+                                  "token_usage": {"prompt_tokens": input_tokens,
+                                                  "completion_tokens": output_tokens}}
+
+
+class StubChunk(StubMessage):
+    """One streamed piece; chunks add up like LangChain's AIMessageChunk (usage on the last one)."""
+
+    def __init__(self, content: str, usage: Optional[Dict[str, Any]] = None):
+        self.content = content
+        self.usage_metadata = usage
+        self.response_metadata = {"model_name": "stub"}
+
+    def __add__(self, other: "StubChunk") -> "StubChunk":
+        return StubChunk(self.content + other.content, other.usage_metadata or self.usage_metadata)
+
+
+class StubChatModel:
+    def __init__(self, latency: float = 0.0, per_token: float = 0.0, fail_rate: float = 0.0,
+                 completion_tokens: Optional[int] = None, cached_ratio: float = 0.0, seed: int = 0,
+                 rpm: float = 0, tpm: float = 0, drift_rate: float = 0.0):
+        self.latency = latency
+        self.per_token = per_token
+        self.fail_rate = fail_rate
+        self.drift_rate = drift_rate
+        self.drifted = 0
+        self.completion_tokens = completion_tokens
+        self.cached_ratio = cached_ratio
+        self.calls = 0
+        self.failures = 0
+        self.quota = StubQuota(rpm, tpm)
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @property
+    def rate_limited(self) -> int:
+        return self.quota.rejected
+
+    # ---- answers -------------------------------------------------------------------------
+    @staticmethod
+    def _summary(payload: Dict[str, Any]) -> Dict[str, Any]:
+        table = str(payload.get("table", ""))
+        cols = [str(c) for c in payload.get("columns") or []]
+        return {"table": table,
+                "summary": f"The {table} table stores {table.replace('_', ' ')} records. "
+                           f"It is used for lookups and joins on {', '.join(cols[:3]) or table}.",
+                "columns": [{"name": c, "description": f"The {c.replace('_', ' ')} of the record."}
+                            for c in cols]}
+
+    @staticmethod
+    def _ranking(user: str) -> Dict[str, Any]:
+        query = user.split("\n", 2)[1] if user.startswith("User query:") else user
+        m = re.search(r"^K = (\d+)", user, flags=re.M)
+        k = int(m.group(1)) if m else 5
+        blocks = re.split(r"^- table: ", user, flags=re.M)[1:]
+        scored = []
+        for b in blocks:
+            name = b.split("\n", 1)[0].strip()
+            scored.append((-_overlap(query, b), hashlib.sha256(name.encode()).hexdigest(), name))
+        scored.sort()
+        return {"query": query,
+                "choices": [{"table": name, "score": max(1, min(5, round(1 - s * 4))),
+                             "reason": "stub: term overlap with summary/columns"}
+                            for s, _, name in scored[:k]]}
+
+    @staticmethod
+    def _evaluation(query: str, cand: Dict[str, Any]) -> Dict[str, Any]:
+        text = " ".join([cand.get("table", ""), cand.get("table_summary", "")] + list(cand.get("columns") or []))
+        rating = max(1, min(5, 1 + round(_overlap(query, text) * 4)))
+        return {"table": cand.get("table", ""), "relevance_rating": rating,
+                "sufficient_to_answer": rating >= 4,
+                "why": [f"{len(_words(query) & _words(text))} query terms found"],
+                "missing_info": [], "irrelevant_info": []}
+
+    def _answer(self, messages: List[Any], strict: bool = False) -> str:
+        def content(m):
+            return m.get("content", "") if isinstance(m, dict) else getattr(m, "content", str(m))
+
+        # the request is the first user message (a re-ask of structured_output.py is answered
+        # with the full object again; only the fields it asked for are used)
+        system = content(messages[0]) if len(messages) > 1 else ""
+        user = content(messages[1] if len(messages) > 1 else messages[-1]) if messages else ""
+        try:
+            payload = json.loads(user)
+        except Exception:
+            payload = {}
+        if system == prompts.SCHEMA_SUMMARY_PROMPT:
+            out = self._summary(payload)
+        elif system == prompts.TABLE_MATCH_PROMPT:
+            out = self._ranking(user)
+        elif system == prompts.EVAL_PROMPT:
+            out = dict(self._evaluation(payload.get("query", ""), payload), query=payload.get("query", ""))
+        elif system == prompts.EVAL_BATCH_PROMPT:
+            out = {"query": payload.get("query", ""),
+                   "evaluations": [self._evaluation(payload.get("query", ""), c)
+                                   for c in payload.get("candidates") or []]}
+        else:
+            out = {}
+        if strict or not out:
+            return json.dumps(out, ensure_ascii=False)
+        with self._lock:
+            kind = self._rng.randrange(8) if self._rng.random() < self.drift_rate else None
+            self.drifted += kind is not None
+        return self._drift(out, kind)
+
+    @staticmethod
+    def _drift(out: Dict[str, Any], kind: Optional[int]) -> str:
+        """The answer rendered with one kind of format drift (None: exact JSON)."""
+        items = next((v for v in out.values() if isinstance(v, list) and v and isinstance(v[0], dict)), None)
+        target = items[0] if items and "summary" not in out else out
+        rating = next((k for k in ("relevance_rating", "score", "summary") if k in target), None)
+        if kind == 4 and rating and rating != "summary":
+            target[rating] = str(target[rating])          # numbers as strings
+        elif kind == 5 and rating:
+            del target[rating]                            # a required field missing
+        elif kind == 7 and rating and rating != "summary":
+            target[rating] = 7                            # out of the 1-5 scale
+        text = json.dumps(out, ensure_ascii=False, indent=1)
+        if kind == 0:
+            return "```json\n" + text + "\n```"
+        if kind == 1:
+            return "Here is the requested JSON:\n" + text + "\nLet me know if you need anything else."
+        if kind == 2:
+            return text[:-1].rstrip() + ",\n}"
+        if kind == 3:
+            return repr(out)
+        if kind == 6:
+            return text[:max(1, int(len(text) * 0.9))]
+        return text
+
+    # ---- LangChain-like API --------------------------------------------------------------
+    def bind(self, **kwargs) -> "StubBoundChatModel":
+        return StubBoundChatModel(self, kwargs)
+
+    def _prepare(self, messages: List[Any], strict: bool = False):
+        text = self._answer(messages, strict)
+        tin = sum(_tokens(m.get("content", "") if isinstance(m, dict) else str(m)) for m in messages)
+        tout = self.completion_tokens if self.completion_tokens is not None else _tokens(text)
+        with self._lock:
+            self.calls += 1
+        self.quota.admit(tin + tout)
+        with self._lock:
+            failed = self._rng.random() < self.fail_rate
+            if failed:
+                self.failures += 1
+        delay = self.latency + self.per_token * tout
+        msg = StubMessage(text, tin, tout, int(tin * self.cached_ratio))
+        return failed, delay, msg
+
+    def invoke(self, messages: List[Any], **kwargs) -> StubMessage:
+        failed, delay, msg = self._prepare(messages, "response_format" in kwargs)
+        time.sleep(delay)
+        if failed:
+            raise StubAPIError("stub: injected failure")
+        return msg
+
+    def stream(self, messages: List[Any], chunk_chars: int = 16, **kwargs):
+        """`latency` before the first chunk, then the per-token time spread over the chunks."""
+        failed, delay, msg = self._prepare(messages, "response_format" in kwargs)
+        time.sleep(self.latency)
+        if failed:
+            raise StubAPIError("stub: injected failure")
+        text = msg.content
+        pieces = [text[i:i + chunk_chars] for i in range(0, len(text), chunk_chars)] or [""]
+        for i, piece in enumerate(pieces):
+            time.sleep((delay - self.latency) / len(pieces))
+            yield StubChunk(piece, msg.usage_metadata if i == len(pieces) - 1 else None)
+
+    async def ainvoke(self, messages: List[Any], **kwargs) -> StubMessage:
+        failed, delay, msg = self._prepare(messages, "response_format" in kwargs)
+        await asyncio.sleep(delay)
+        if failed:
+            raise StubAPIError("stub: injected failure")
+        return msg
+
+
+class StubBoundChatModel:
+    """`StubChatModel.bind(**kwargs)`: the same model with `kwargs` (e.g. response_format) on every call."""
+
+    def __init__(self, chat: StubChatModel, kwargs: Dict[str, Any]):
+        self.chat = chat
+        self.kwargs = kwargs
+
+    def invoke(self, messages: List[Any], **kwargs) -> StubMessage:
+        return self.chat.invoke(messages, **dict(self.kwargs, **kwargs))
+
+    def stream(self, messages: List[Any], **kwargs):
+        return self.chat.stream(messages, **dict(self.kwargs, **kwargs))
+
+    async def ainvoke(self, messages: List[Any], **kwargs) -> StubMessage:
+        return await self.chat.ainvoke(messages, **dict(self.kwargs, **kwargs))
+
+
+def stub_vector(text: str, dim: int) -> List[float]:
+    import numpy as np   # only the embeddings stub needs it
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    return np.random.default_rng(seed).standard_normal(dim).astype(np.float32).tolist()
+
+
+class _Embeddings:
+    def __init__(self, owner: "StubEmbeddingsClient"):
+        self.owner = owner
+
+    def create(self, model: str, input, **kwargs):
+        o = self.owner
+        texts = [input] if isinstance(input, str) else list(input)
+        with o._lock:
+            o.requests += 1
+        if len(texts) > o.max_items:
+            raise StubAPIError(f"stub: too many inputs ({len(texts)} > {o.max_items})", 400)
+        o.quota.admit(sum(_tokens(t) for t in texts))
+        with o._lock:
+            o.inputs += len(texts)
+            failed = o._rng.random() < o.fail_rate
+            if failed:
+                o.failures += 1
+        time.sleep(o.latency + o.per_item * len(texts))
+        if failed:
+            raise StubAPIError("stub: injected failure")
+        tokens = sum(_tokens(t) for t in texts)
+        return SimpleNamespace(
+            model=model,
+            data=[SimpleNamespace(index=i, embedding=stub_vector(t, o.dim)) for i, t in enumerate(texts)],
+            usage=SimpleNamespace(prompt_tokens=tokens, total_tokens=tokens))
+
+
+class StubEmbeddingsClient:
+    def __init__(self, dim: int = 256, latency: float = 0.0, per_item: float = 0.0,
+                 fail_rate: float = 0.0, max_items: int = 2048, seed: int = 0,
+                 rpm: float = 0, tpm: float = 0):
+        self.dim = dim
+        self.latency = latency
+        self.per_item = per_item
+        self.fail_rate = fail_rate
+        self.max_items = max_items
+        self.requests = 0
+        self.inputs = 0
+        self.failures = 0
+        self.quota = StubQuota(rpm, tpm)
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.embeddings = _Embeddings(self)
+
+    @property
+    def rate_limited(self) -> int:
+        return self.quota.rejected
+
+
+def install(chat: Optional[StubChatModel] = None,
+            embeddings: Optional[StubEmbeddingsClient] = None,
+            tasks=("task1_schema_summary", "task2_search", "task3_eval")) -> None:
+    """Route the chat model of `tasks` and the embeddings client (embedding.py) to the stubs."""
+    import importlib
+    if chat is not None:
+        for name in tasks:
+            mod = importlib.import_module(name)
+            if name == "task1_schema_summary":
+                mod.get_chat_model = lambda name=None: chat
+            else:
+                mod.load_chat_model = lambda model=None: chat
+    if embeddings is not None:
+        from src.retrieval_graph import embedding
+        embedding._openai_client = lambda: embeddings
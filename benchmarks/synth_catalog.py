@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""
+Synthetic, reproducible catalogs for the benchmark suite.
+
+- make_summaries(n, n_cols): Task 1-style schema summaries (what Tasks 2/3 read), built
+  in memory, so 100k-table catalogs do not need 100k CSVs or LLM calls.
+- write_csvs(out_dir, summaries, rows): the matching CSV files (Task 1 input, Task 3 samples).
+- make_queries(summaries, n): natural-language-ish queries, each with its gold table.
+
+Table and column names are drawn from small vocabularies, so lexical / embedding ranking
+has realistic overlaps (several "customer_*" tables, shared "created_at" columns, ...).
+At 100k tables each (domain, entity) pair has hundreds of near-duplicates, so recall against
+the single gold table drops by construction: compare it across runs, not as an absolute.
+"""
+import csv, os, random
+from typing import Any, Dict, List
+
+SIZES = {"10": 10, "1k": 1_000, "100k": 100_000}
+SHAPES = {"narrow": 6, "wide": 48}   # columns per table
+
+DOMAINS = ["sales", "hr", "finance", "inventory", "marketing", "support", "logistics", "billing",
+           "film", "rental", "payments", "crm", "web", "mobile", "warehouse", "audit"]
+ENTITIES = ["customer", "order", "invoice", "employee", "product", "supplier", "shipment", "ticket",
+            "campaign", "payment", "store", "account", "session", "actor", "category", "address",
+            "contract", "refund", "visit", "review"]
+ATTRIBUTES = ["id", "name", "status", "amount", "price", "quantity", "created_at", "updated_at",
+              "country", "city", "email", "phone", "rating", "discount", "currency", "region",
+              "start_date", "end_date", "owner", "priority", "channel", "score", "weight", "code"]
+
+
+def make_summaries(n: int, n_cols: int, seed: int = 0) -> List[Dict[str, Any]]:
+    rng = random.Random(seed)
+    out = []
+    for i in range(n):
+        domain, entity = rng.choice(DOMAINS), rng.choice(ENTITIES)
+        table = f"{domain}_{entity}_{i}"
+        attrs = rng.sample(ATTRIBUTES, min(n_cols - 1, len(ATTRIBUTES)))
+        cols = [f"{entity}_id"] + attrs + [f"extra_{j}" for j in range(max(0, n_cols - 1 - len(attrs)))]
+        out.append({
+            "table": table,
+            "summary": f"The {table} table stores {domain} {entity} records with their "
+                       f"{', '.join(attrs[:3])}. It is used for {domain} reporting and joins on {entity}_id.",
+            "columns": [{"name": c, "description": f"The {c.replace('_', ' ')} of the {entity}."} for c in cols],
+        })
+    return out
+
+
+def _value(col: str, rng: random.Random, r: int) -> str:
+    if col.endswith("_id") or col == "id":
+        return str(r + 1)
+    if col in ("amount", "price", "discount", "score", "weight"):
+        return f"{rng.uniform(0, 1000):.2f}"
+    if col in ("quantity", "rating", "priority"):
+        return str(rng.randint(1, 5))
+    if col.endswith("_at") or col.endswith("_date"):
+        return f"2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+    if rng.random() < 0.05:
+        return ""   # some nulls for the profiler
+    return f"{col}_{rng.randint(0, 50)}"
+
+
+def write_csvs(out_dir: str, summaries: List[Dict[str, Any]], rows: int = 200, seed: int = 0) -> List[str]:
+    """One `<table>.csv` per summary; returns the paths (existing files are overwritten)."""
+    os.makedirs(out_dir, exist_ok=True)
+    rng = random.Random(seed)
+    paths = []
+    for s in summaries:
+        cols = [c["name"] for c in s["columns"]]
+        path = os.path.join(out_dir, f"{s['table']}.csv")
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            w = csv.writer(f)
+            w.writerow(cols)
+            for r in range(rows):
+                w.writerow([_value(c, rng, r) for c in cols])
+        paths.append(path)
+    return paths
+
+
+def make_queries(summaries: List[Dict[str, Any]], n: int, seed: int = 0) -> List[Dict[str, Any]]:
+    """[{"id", "query", "gold": [table]}]; the query names the gold table's domain, entity and a column."""
+    rng = random.Random(seed + 1)
+    out = []
+    for i in range(n):
+        s = rng.choice(summaries)
+        domain, entity = s["table"].split("_")[:2]
+        col = rng.choice(s["columns"][1:] or s["columns"])["name"].replace("_", " ")
+        out.append({"id": i, "query": f"{domain} {entity} records by {col}", "gold": [s["table"]]})
+    return out
@@ -0,0 +1,145 @@
+"""Approximate nearest-neighbour (ANN) index for large table catalogs.
+
+IVF-style index built with numpy only:
+- a spherical k-means coarse quantizer splits the unit-normalized table vectors into `nlist` lists,
+- a query scores the centroids, then only the rows of the `nprobe` closest lists.
+
+`nlist` / `nprobe` trade recall for latency; `recall_at_k` measures the loss against
+the exact brute-force path so an operating point can be chosen.
+"""
+
+from typing import Dict, List, Optional, Sequence
+import os
+import numpy as np
+
+from .embedding import _unit_matrix, _topk_indices, _query_matrix
+
+
+def default_nlist(n: int) -> int:
+    """~sqrt(n) lists, the usual IVF starting point."""
+    return max(1, min(n, int(round(np.sqrt(n)))))
+
+
+def _assign(mat: np.ndarray, centroids: np.ndarray, chunk: int = 8192) -> np.ndarray:
+    """Nearest centroid (max cosine) per row, computed in chunks to bound memory."""
+    out = np.empty(mat.shape[0], dtype=np.int64)
+    for i in range(0, mat.shape[0], chunk):
+        out[i:i + chunk] = np.argmax(mat[i:i + chunk] @ centroids.T, axis=1)
+    return out
+
+
+def _train_kmeans(mat: np.ndarray, nlist: int, iters: int, seed: int,
+                  max_train: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    train = mat[:]   # a QuantizedMatrix de-quantizes here
+    if mat.shape[0] > max_train:
+        train = mat[rng.choice(mat.shape[0], size=max_train, replace=False)]
+    centroids = train[rng.choice(train.shape[0], size=nlist, replace=False)].copy()
+    for _ in range(iters):
+        assign = _assign(train, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, train)
+        counts = np.bincount(assign, minlength=nlist)
+        empty = counts == 0
+        if empty.any():
+            # re-seed empty lists with random rows so every list stays useful
+            sums[empty] = train[rng.choice(train.shape[0], size=int(empty.sum()))]
+        centroids = _unit_matrix(sums)
+    return centroids
+
+
+class IVFIndex:
+    """
+    Inverted-file index over a unit-normalized float32 matrix.
+
+    The index keeps only centroids and row ids; the vectors themselves stay in the
+    caller's matrix (e.g. the EmbeddingStore), so nothing is duplicated on disk.
+    """
+
+    def __init__(self, centroids: np.ndarray, order: np.ndarray, offsets: np.ndarray,
+                 fingerprint: str = ""):
+        self.centroids = centroids
+        self.order = order          # row ids grouped by list
+        self.offsets = offsets      # list i = order[offsets[i]:offsets[i+1]]
+        self.fingerprint = fingerprint
+
+    @property
+    def nlist(self) -> int:
+        return int(self.centroids.shape[0])
+
+    @classmethod
+    def build(cls, mat: np.ndarray, nlist: Optional[int] = None, iters: int = 10,
+              seed: int = 0, max_train: int = 50000, fingerprint: str = "") -> "IVFIndex":
+        n = int(mat.shape[0])
+        if n == 0:
+            raise ValueError("Cannot build an ANN index over an empty matrix")
+        nlist = max(1, min(n, nlist or default_nlist(n)))
+        centroids = _train_kmeans(mat, nlist, iters, seed, max(max_train, nlist))
+        assign = _assign(mat, centroids)
+        order = np.argsort(assign, kind="stable").astype(np.int64)
+        offsets = np.zeros(nlist + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(np.bincount(assign, minlength=nlist))
+        return cls(centroids, order, offsets, fingerprint)
+
+    def save(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            np.savez(f, centroids=self.centroids, order=self.order, offsets=self.offsets,
+                     fingerprint=np.array(self.fingerprint))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> Optional["IVFIndex"]:
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path, allow_pickle=False) as z:
+                return cls(z["centroids"], z["order"], z["offsets"], str(z["fingerprint"]))
+        except Exception as e:
+            print(f"[ann] ignore unreadable index {path}: {e}")
+            return None
+
+    def search(self, mat: np.ndarray, qvec: Sequence[float], k: int = 5,
+               nprobe: int = 8) -> np.ndarray:
+        """Row ids of the (approximate) top-k rows of `mat` for one query, best first."""
+        q = _query_matrix(qvec, mat.shape[1])[0]
+        probe = _topk_indices(self.centroids @ q, max(1, nprobe))
+        cands = np.concatenate([self.order[self.offsets[p]:self.offsets[p + 1]] for p in probe])
+        if cands.size == 0:
+            return cands
+        cands.sort()   # sequential access into `mat`, and ties keep input order
+        return cands[_topk_indices(mat[cands] @ q, k)]
+
+
+def load_or_build(path: str, mat: np.ndarray, fingerprint: str,
+                  nlist: Optional[int] = None) -> IVFIndex:
+    """Reuse the saved index if it was built for the same table set, else rebuild and save it."""
+    index = IVFIndex.load(path)
+    if index is not None and index.fingerprint == fingerprint and (nlist is None or index.nlist == nlist):
+        return index
+    index = IVFIndex.build(mat, nlist=nlist, fingerprint=fingerprint)
+    index.save(path)
+    return index
+
+
+def rank_by_index(index: IVFIndex, mat: np.ndarray, qvec: Sequence[float],
+                  table_names: List[str], k: int = 5, nprobe: int = 8) -> List[Dict]:
+    """Same output shape as `rank_by_vectors`: [{"table": str, "score": float}]."""
+    q = _query_matrix(qvec, mat.shape[1])[0]
+    ids = index.search(mat, q, k, nprobe)
+    return [{"table": table_names[i], "score": float(mat[i] @ q)} for i in ids]
+
+
+def recall_at_k(index: IVFIndex, mat: np.ndarray, queries: np.ndarray,
+                k: int = 5, nprobe: int = 8) -> float:
+    """Mean |ANN top-k ∩ exact top-k| / k over the given query vectors."""
+    queries = _query_matrix(queries, mat.shape[1])
+    k = min(k, mat.shape[0])
+    if k == 0 or queries.shape[0] == 0:
+        return 1.0
+    hit = 0
+    for q in queries:
+        exact = set(_topk_indices(mat @ q, k).tolist())
+        hit += len(exact.intersection(index.search(mat, q, k, nprobe).tolist()))
+    return hit / (k * queries.shape[0])
@@ -0,0 +1,47 @@
+"""Table text used by every ranking path (embeddings, BM25).
+
+Kept free of third-party imports so the lexical path and the CLI entry points can use it
+without loading numpy / openai.
+"""
+
+from typing import Dict, List
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Cheap token estimate (~4 characters per token), good enough for request / prompt budgeting.
+    """
+    return len(text) // 4 + 1
+
+
+def _build_table_corpus_from_summaries(summaries: List[Dict], max_cols: int = 16,
+                                       col_descriptions: bool = False) -> Dict[str, str]:
+    """
+    Convert each table into a short text: table name + summary + a few column names
+    (+ the column descriptions when `col_descriptions` is True, used by the BM25 index).
+    Return {table_name: text}.
+    """
+    corpus: Dict[str, str] = {}
+    for it in summaries:
+        tname = (it.get("table") or it.get("name") or "").strip()
+        if not tname:
+            continue
+        summ = (it.get("summary") or "").strip()
+        cols = it.get("columns") or []
+        col_names = []
+        col_descs = []
+        for c in cols[:max_cols]:
+            if isinstance(c, dict):
+                n = (c.get("name") or "").strip()
+                if n:
+                    col_names.append(n)
+                    d = (c.get("description") or "").strip()
+                    if d:
+                        col_descs.append(f"{n}: {d}")
+            elif isinstance(c, str):
+                col_names.append(c)
+        text = f"table: {tname}\nsummary: {summ}\ncolumns: {', '.join(col_names)}"
+        if col_descriptions and col_descs:
+            text += "\n" + "\n".join(col_descs)
+        corpus[tname] = text
+    return corpus
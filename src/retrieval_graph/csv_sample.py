@@ -0,0 +1,72 @@
+"""Bounded-memory CSV sampling shared by Task 1 and Task 3.
+
+Both tasks only need the header and a handful of rows, so:
+- the encoding is detected ONCE from a small byte prefix (no parse-and-retry per encoding),
+- only the header + first N rows are parsed (`nrows`), or a reservoir sample is drawn
+  while streaming the file in fixed-size chunks.
+Peak memory depends on N / chunksize, never on the file size.
+"""
+
+from typing import Optional
+import codecs
+import random
+import pandas as pd
+
+PREFIX_BYTES = 64 * 1024
+
+
+def detect_encoding(path: str, nbytes: int = PREFIX_BYTES) -> str:
+    """
+    Pick 'utf-8-sig' (BOM), 'utf-8' or 'latin1' from the first `nbytes` of the file.
+    latin1 decodes any byte sequence, so it is the last resort.
+    """
+    with open(path, "rb") as f:
+        head = f.read(nbytes)
+    if head.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    try:
+        # final=False: a multi-byte character cut at the end of the prefix is not an error
+        codecs.getincrementaldecoder("utf-8")().decode(head, final=False)
+        return "utf-8"
+    except UnicodeDecodeError:
+        return "latin1"
+
+
+def read_csv_head(path: str, n: int = 5, encoding: Optional[str] = None) -> pd.DataFrame:
+    """
+    Header + first `n` rows (deterministic). Columns are complete even when n == 0.
+    """
+    enc = encoding or detect_encoding(path)
+    try:
+        return pd.read_csv(path, encoding=enc, nrows=max(0, int(n)))
+    except UnicodeDecodeError:
+        # a non-UTF-8 byte after the detection prefix
+        return pd.read_csv(path, encoding="latin1", nrows=max(0, int(n)))
+
+
+def read_csv_reservoir(path: str, n: int = 5, seed: int = 0, chunksize: int = 100_000,
+                       encoding: Optional[str] = None) -> pd.DataFrame:
+    """
+    Uniform random sample of `n` rows drawn in one streaming pass (reservoir sampling).
+    Rows keep their file order in the result.
+    """
+    enc = encoding or detect_encoding(path)
+    rng = random.Random(seed)
+    reservoir = []   # (row position, row as dict)
+    columns = None
+    seen = 0
+    for chunk in pd.read_csv(path, encoding=enc, chunksize=chunksize, encoding_errors="replace"):
+        if columns is None:
+            columns = list(chunk.columns)
+        for pos, row in zip(range(seen, seen + len(chunk)), chunk.itertuples(index=False, name=None)):
+            if len(reservoir) < n:
+                reservoir.append((pos, row))
+            else:
+                j = rng.randint(0, pos)
+                if j < n:
+                    reservoir[j] = (pos, row)
+        seen += len(chunk)
+    if columns is None:
+        return read_csv_head(path, 0, enc)
+    reservoir.sort(key=lambda x: x[0])
+    return pd.DataFrame([r for _, r in reservoir], columns=columns)
@@ -4,33 +4,33 @@ Created on Sun Aug 19 23:25:15 2025
 
 @author: LENOVO
 """
-from typing import List, Dict
-import os, math
-from openai import OpenAI
-
-def _build_table_corpus_from_summaries(summaries: List[Dict], max_cols: int = 16) -> Dict[str, str]:
-    """
-    Convert each table into a short text: table name + summary + a few column names.
-    Return {table_name: text}.
-    """
-    corpus: Dict[str, str] = {}
-    for it in summaries:
-        tname = (it.get("table") or it.get("name") or "").strip()
-        if not tname:
-            continue
-        summ = (it.get("summary") or "").strip()
-        cols = it.get("columns") or []
-        col_names = []
-        for c in cols[:max_cols]:
-            if isinstance(c, dict):
-                n = (c.get("name") or "").strip()
-                if n:
-                    col_names.append(n)
-            elif isinstance(c, str):
-                col_names.append(c)
-        text = f"table: {tname}\nsummary: {summ}\ncolumns: {', '.join(col_names)}"
-        corpus[tname] = text
-    return corpus
+from __future__ import annotations
+from typing import TYPE_CHECKING, List, Dict, Optional, Sequence, Tuple
+import os, re, math, hashlib
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+from .corpus import _build_table_corpus_from_summaries, estimate_tokens
+from .metrics import record_call
+from .scheduler import scheduler_for
+
+if TYPE_CHECKING:
+    from openai import OpenAI
+
+# Request budgeting for `_embed_texts` (provider limits: 2048 inputs / ~300k tokens per request)
+EMBED_MAX_ITEMS = int(os.getenv("EMBED_MAX_ITEMS", "512"))        # inputs per request
+EMBED_MAX_TOKENS = int(os.getenv("EMBED_MAX_TOKENS", "100000"))   # estimated tokens per request
+EMBED_WORKERS = int(os.getenv("EMBED_WORKERS", "4"))              # concurrent requests
+EMBED_RETRIES = int(os.getenv("EMBED_RETRIES", "3"))              # retries per failed chunk
+# RPM / TPM limits, adaptive concurrency and backoff: EMBED_RPM, EMBED_TPM, EMBED_CONCURRENCY (scheduler.py)
+
+def _openai_client() -> OpenAI:
+    """
+    Embeddings client from OPENAI_API_KEY (`openai` is only imported once an API call is due).
+    SDK retries are off: scheduler.py retries with the shared rate limits and backoff.
+    """
+    from openai import OpenAI
+    return OpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)
 
 def _cosine(a: List[float], b: List[float]) -> float:
     """
@@ -49,34 +49,361 @@ def _cosine(a: List[float], b: List[float]) -> float:
         return 0.0
     return dot / math.sqrt(na * nb)
 
-def _embed_texts(client: OpenAI, model: str, texts: List[str]) -> List[List[float]]:
+def _unit_matrix(vecs) -> np.ndarray:
+    """
+    Stack vectors into a float32 matrix whose rows are L2-normalized.
+    Zero vectors stay zero, so they score 0.0 like in `_cosine`.
+    """
+    mat = np.asarray(vecs, dtype=np.float32)
+    if mat.ndim == 1:
+        mat = mat.reshape(1, -1)
+    norms = np.linalg.norm(mat, axis=1, keepdims=True)
+    norms[norms == 0.0] = 1.0
+    return mat / norms
+
+def _topk_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    Indices of the k highest scores, best first.
+    Uses argpartition (O(n)) and only sorts the k winners; ties keep input order.
+    """
+    n = int(scores.shape[0])
+    k = min(int(k), n)
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if k < n:
+        idx = np.argpartition(-scores, k - 1)[:k]
+    else:
+        idx = np.arange(n)
+    # primary key: score (desc), secondary key: original position (asc)
+    return idx[np.lexsort((idx, -scores[idx]))]
+
+def _query_matrix(qmat, dim: int) -> np.ndarray:
+    """
+    Unit query rows matching a table matrix of width `dim` (queries are cut to the first
+    `dim` components, like a truncated table matrix, then re-normalized).
+    """
+    q = np.asarray(qmat, dtype=np.float32)
+    if q.ndim == 1:
+        q = q.reshape(1, -1)
+    return _unit_matrix(q[:, :dim] if dim and dim < q.shape[1] else q)
+
+def _scores(tmat, q: np.ndarray) -> np.ndarray:
+    """
+    (queries x tables) scores of unit query rows against a table matrix: a float32 ndarray /
+    np.memmap (one BLAS product on the mapped pages) or a vector_store.QuantizedMatrix.
+    """
+    if isinstance(tmat, np.ndarray):
+        return np.asarray(q @ tmat.T)
+    return tmat.scores(q)
+
+def rank_by_vectors(qvec: Sequence[float], tmat,
+                    table_names: List[str], k: int = 5) -> List[Dict]:
+    """
+    Score one query vector against a pre-normalized table matrix (one row per table)
+    with a single matrix-vector product, return [{"table": str, "score": float}].
+    """
+    if tmat.shape[0] == 0:
+        return []
+    scores = _scores(tmat, _query_matrix(qvec, tmat.shape[1]))[0]
+    return [{"table": table_names[i], "score": float(scores[i])}
+            for i in _topk_indices(scores, k)]
+
+def _estimate_tokens(text: str) -> int:
+    """
+    Cheap token estimate (corpus.estimate_tokens), good enough for request budgeting.
+    """
+    return estimate_tokens(text)
+
+def _chunk_ranges(texts: List[str], max_items: int, max_tokens: int) -> List[Tuple[int, int]]:
+    """
+    Split texts into consecutive [lo, hi) ranges that respect both the item and
+    the estimated-token budget (a single oversized text still gets its own chunk).
+    """
+    ranges: List[Tuple[int, int]] = []
+    start, tokens = 0, 0
+    for i, t in enumerate(texts):
+        n = _estimate_tokens(t)
+        if i > start and (i - start >= max_items or tokens + n > max_tokens):
+            ranges.append((start, i))
+            start, tokens = i, 0
+        tokens += n
+    if start < len(texts):
+        ranges.append((start, len(texts)))
+    return ranges
+
+def _embed_chunk(client: OpenAI, model: str, texts: List[str], retries: int) -> List[List[float]]:
+    """
+    One embeddings request through the shared scheduler (scheduler.py: RPM/TPM limits, adaptive
+    concurrency, jittered backoff); only this chunk is retried when it fails transiently.
+    Recorded as one "embedding" call in metrics.py (latency includes the retries).
+    """
+    tokens = sum(_estimate_tokens(t) for t in texts)
+    with record_call("embedding", kind="embedding", model=model, items=len(texts)) as call:
+        resp = scheduler_for("embedding", model).run(
+            lambda: client.embeddings.create(model=model, input=texts), tokens=tokens, call=call,
+            retries=retries)
+        call.done(resp)
+        data = sorted(enumerate(resp.data), key=lambda p: getattr(p[1], "index", p[0]))
+        if len(data) != len(texts):
+            raise ValueError(f"expected {len(texts)} embeddings, got {len(data)}")
+        return [d.embedding for _, d in data]
+
+def _embed_texts(client: OpenAI, model: str, texts: List[str],
+                 max_items: Optional[int] = None, max_tokens: Optional[int] = None,
+                 workers: Optional[int] = None, retries: Optional[int] = None) -> List[List[float]]:
     """
     Call the OpenAI API to get embeddings for a list of texts.
+    Large inputs are split by item count and estimated tokens, chunks are sent
+    concurrently (bounded worker pool) and the results are reassembled in input order.
+    """
+    if not texts:
+        return []
+    retries = EMBED_RETRIES if retries is None else retries
+    ranges = _chunk_ranges(texts, max_items or EMBED_MAX_ITEMS, max_tokens or EMBED_MAX_TOKENS)
+    if len(ranges) == 1:
+        return _embed_chunk(client, model, texts, retries)
+
+    workers = max(1, min(workers or EMBED_WORKERS, len(ranges)))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        parts = list(pool.map(lambda r: _embed_chunk(client, model, texts[r[0]:r[1]], retries), ranges))
+    return [v for part in parts for v in part]
+
+def _text_key(text: str) -> str:
+    """
+    Content hash of a table text (the cache key inside one model's store).
+    """
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def _safe_model_name(model: str) -> str:
+    return re.sub(r"[^A-Za-z0-9._-]+", "_", model)
+
+def corpus_fingerprint(corpus: Dict[str, str]) -> str:
+    """
+    Hash of the whole table set (names + text hashes), used to tell whether
+    an index built over the corpus embeddings is still valid.
+    """
+    h = hashlib.sha256()
+    for t, text in corpus.items():
+        h.update(f"{t}\0{_text_key(text)}\n".encode("utf-8"))
+    return h.hexdigest()
+
+class EmbeddingStore:
+    """
+    Persistent table-corpus embeddings for ONE embedding model.
+
+    Entries are keyed by (model, sha256(table text)) and saved as a single .npz file
+    `<store_dir>/<model>.npz`, so an unchanged table is never embedded twice and
+    a query-time search only sends the query to the API.
+    """
+
+    def __init__(self, store_dir: str, model: str):
+        self.model = model
+        self.path = os.path.join(store_dir, f"{_safe_model_name(model)}.npz")
+        self._vecs: Dict[str, np.ndarray] = {}
+        self.load()
+
+    def __len__(self) -> int:
+        return len(self._vecs)
+
+    def load(self) -> None:
+        self._vecs = {}
+        if not os.path.exists(self.path):
+            return
+        try:
+            with np.load(self.path, allow_pickle=False) as z:
+                if str(z["model"]) != self.model:
+                    return
+                for key, v in zip(z["keys"].tolist(), z["vectors"]):
+                    self._vecs[key] = v
+        except Exception as e:
+            # a broken cache only costs one re-embed, never the search itself
+            print(f"[embedding] ignore unreadable store {self.path}: {e}")
+            self._vecs = {}
+
+    def save(self) -> None:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        keys = list(self._vecs.keys())
+        vectors = (np.stack([self._vecs[key] for key in keys]).astype(np.float32)
+                   if keys else np.zeros((0, 0), dtype=np.float32))
+        tmp = self.path + ".tmp"
+        with open(tmp, "wb") as f:
+            np.savez(f, model=np.array(self.model), keys=np.array(keys, dtype=str),
+                     vectors=vectors)
+        os.replace(tmp, self.path)   # atomic: readers never see a half-written store
+
+    def sync(self, client: OpenAI, corpus: Dict[str, str]) -> Tuple[List[str], np.ndarray]:
+        """
+        Make the store match `corpus` ({table_name: text}):
+          - embed only new/changed texts,
+          - drop entries whose text is no longer in the corpus.
+        Return (table_names, unit-normalized float32 matrix aligned with table_names).
+        """
+        table_names = list(corpus.keys())
+        keys = {t: _text_key(corpus[t]) for t in table_names}
+
+        missing: Dict[str, str] = {}
+        for t in table_names:
+            if keys[t] not in self._vecs:
+                missing.setdefault(keys[t], corpus[t])   # identical texts embed once
+        changed = bool(missing)
+        if missing:
+            new_keys = list(missing.keys())
+            vecs = _unit_matrix(_embed_texts(client, self.model, [missing[x] for x in new_keys]))
+            for key, v in zip(new_keys, vecs):
+                self._vecs[key] = v
+
+        live = set(keys.values())
+        stale = [key for key in self._vecs if key not in live]
+        for key in stale:
+            del self._vecs[key]
+        changed = changed or bool(stale)
+
+        if changed:
+            self.save()
+        if not table_names:
+            return [], np.zeros((0, 0), dtype=np.float32)
+        return table_names, np.stack([self._vecs[keys[t]] for t in table_names])
+
+def rank_matrix(qmat, tmat, table_names: List[str], k: int = 5,
+                block: int = 1024) -> List[List[Dict]]:
     """
-    resp = client.embeddings.create(model=model, input=texts)
-    return [d.embedding for d in resp.data]
+    Rank many queries at once: each block of query vectors is scored against the
+    pre-normalized table matrix with ONE matrix product, then top-k per row.
+    Returns one [{"table", "score"}] list per query, in query order.
+    """
+    if tmat.shape[0] == 0:
+        return [[] for _ in range(len(qmat))]
+    q = _query_matrix(qmat, tmat.shape[1])
+    out: List[List[Dict]] = []
+    for i in range(0, q.shape[0], block):   # block bounds the (queries x tables) score matrix
+        scores = _scores(tmat, q[i:i + block])
+        for row in scores:
+            out.append([{"table": table_names[j], "score": float(row[j])}
+                        for j in _topk_indices(row, k)])
+    return out
+
+def _table_matrix(client: OpenAI, corpus: Dict[str, str], embedding_model: str,
+                  store_dir: Optional[str] = None, dtype: str = "float32",
+                  dim: Optional[int] = None) -> Tuple[List[str], np.ndarray]:
+    """
+    (table_names, unit-normalized table matrix).
+    With `store_dir`, the matrix is memory-mapped from vector_store's file for this
+    (model, dtype, dim); it is rebuilt from the EmbeddingStore only when the corpus changed.
+    float16 / int8 / truncated layouts come back as a vector_store.QuantizedMatrix.
+    """
+    from .vector_store import VectorFile, as_matrix, quantize
+    table_names = list(corpus.keys())
+    if store_dir:
+        fp = corpus_fingerprint(corpus)
+        vf = VectorFile(os.path.join(store_dir, _safe_model_name(embedding_model)), dtype, dim)
+        mat = vf.open(fp)
+        if mat is None:
+            table_names, full = EmbeddingStore(store_dir, embedding_model).sync(client, corpus)
+            vf.write(full, fp)
+            mat = vf.open(fp)
+        return table_names, mat
+    full = _unit_matrix(_embed_texts(client, embedding_model, [corpus[t] for t in table_names]))
+    if dtype == "float32" and not dim:
+        return table_names, full
+    return table_names, as_matrix(*quantize(full, dtype, dim))
+
+def _ivf_index(tmat, corpus: Dict[str, str], embedding_model: str, store_dir: Optional[str],
+               dtype: str, dim: Optional[int], nlist: Optional[int]):
+    """IVF index over `tmat`: saved next to the vector file with `store_dir`, else built in memory."""
+    from .ann import IVFIndex, load_or_build
+    fp = corpus_fingerprint(corpus)
+    if store_dir:
+        from .vector_store import vector_tag
+        return load_or_build(os.path.join(store_dir, f"{_safe_model_name(embedding_model)}"
+                                                     f"{vector_tag(dtype, dim)}.ivf.npz"),
+                             tmat, fp, nlist)
+    return IVFIndex.build(tmat, nlist=nlist, fingerprint=fp)
+
+class EmbeddingRanker:
+    """
+    Table embeddings loaded once, then any number of queries ranked against them
+    (batch query mode, long-running services). index="ann" ranks through an IVF index
+    (nlist / nprobe as in embed_rank_tables) instead of scoring every table.
+    """
+
+    def __init__(self, summaries: List[Dict], embedding_model: str = "text-embedding-3-small",
+                 store_dir: Optional[str] = None, client: Optional[OpenAI] = None,
+                 dtype: str = "float32", dim: Optional[int] = None,
+                 index: str = "exact", nlist: Optional[int] = None, nprobe: int = 8):
+        self.embedding_model = embedding_model
+        self.client = client or _openai_client()
+        self.nprobe = nprobe
+        self.ivf = None
+        corpus = _build_table_corpus_from_summaries(summaries)
+        if corpus:
+            self.table_names, self.tmat = _table_matrix(self.client, corpus, embedding_model, store_dir,
+                                                        dtype, dim)
+            if index == "ann":
+                self.ivf = _ivf_index(self.tmat, corpus, embedding_model, store_dir, dtype, dim, nlist)
+        else:
+            self.table_names, self.tmat = [], np.zeros((0, 0), dtype=np.float32)
+
+    def rank(self, queries: List[str], k: int = 5) -> List[List[Dict]]:
+        """One [{"table", "score"}] list per query; queries are embedded in chunked batches."""
+        if not queries:
+            return []
+        if not self.table_names:
+            return [[] for _ in queries]
+        qmat = _embed_texts(self.client, self.embedding_model, list(queries))
+        if self.ivf is not None:
+            from .ann import rank_by_index
+            return [rank_by_index(self.ivf, self.tmat, q, self.table_names, k, self.nprobe) for q in qmat]
+        return rank_matrix(qmat, self.tmat, self.table_names, k)
 
 def embed_rank_tables(
     summaries: List[Dict],
     query: str,
     embedding_model: str = "text-embedding-3-small",
     k: int = 5,
+    store_dir: Optional[str] = None,
+    index: str = "exact",
+    nlist: Optional[int] = None,
+    nprobe: int = 8,
+    report: Optional[Dict] = None,
+    dtype: str = "float32",
+    dim: Optional[int] = None,
 ):
     """
     Rank tables using embeddings, return [{"table": str, "score": float}] without reason.
+    If `store_dir` is given, table embeddings are read from / added to an EmbeddingStore
+    there and only the query is sent to the API.
+    index="ann" searches an IVF index (see ann.py) saved in `store_dir` instead of
+    scoring every table; `nlist` / `nprobe` tune recall vs latency. If `report` is a dict,
+    the ANN recall@k against the exact ranking is written into it.
+    `dtype` (float32 / float16 / int8) and `dim` (truncation) pick the vector_store layout
+    the table matrix is ranked from.
     """
     corpus = _build_table_corpus_from_summaries(summaries)
     if not corpus:
         return []
 
-    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    client = _openai_client()
+
+    if store_dir or index == "ann" or dtype != "float32" or dim:
+        table_names, tmat = _table_matrix(client, corpus, embedding_model, store_dir, dtype, dim)
+        qvec = _embed_texts(client, embedding_model, [query])[0]
+        if index != "ann":
+            return rank_by_vectors(qvec, tmat, table_names, k)
+
+        from .ann import rank_by_index
+        ivf = _ivf_index(tmat, corpus, embedding_model, store_dir, dtype, dim, nlist)
+        ranked = rank_by_index(ivf, tmat, qvec, table_names, k, nprobe)
+        if report is not None:
+            exact = {r["table"] for r in rank_by_vectors(qvec, tmat, table_names, k)}
+            report["recall_at_k"] = (len(exact & {r["table"] for r in ranked}) / len(exact)
+                                     if exact else 1.0)
+            report.update({"nlist": ivf.nlist, "nprobe": nprobe, "tables": len(table_names)})
+        return ranked
+
     table_names = list(corpus.keys())
     table_texts = [corpus[t] for t in table_names]
 
     vecs = _embed_texts(client, embedding_model, [query] + table_texts)
     qvec, tvecs = vecs[0], vecs[1:]
 
-    scored = [{"table": name, "score": _cosine(qvec, v)}
-              for name, v in zip(table_names, tvecs)]
-    scored.sort(key=lambda x: x["score"], reverse=True)
-    return scored[:k]
+    return rank_by_vectors(qvec, _unit_matrix(tvecs), table_names, k)
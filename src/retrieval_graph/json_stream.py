@@ -0,0 +1,153 @@
+"""Incremental parsing of a streamed JSON answer (Task 2 ranking, Task 3 evaluations).
+
+The prompts ask for ONE JSON object, e.g. {"query": ..., "choices": [{...}, {...}]}. While the
+model is still generating, `JsonStreamParser.feed(chunk)` reports what is already complete:
+
+    ("item", "choices", {...})        one element of a top-level array, as soon as it closes
+    ("field", "relevance_rating", 4)  a top-level value, as soon as it ends
+
+Text before the first "{" (a markdown fence, a preamble) is skipped; an element that does not
+parse is skipped too, the caller still parses the full text at the end as before.
+
+`stream_invoke(llm, messages, on_event)` drives `llm.stream(messages)`, feeds every chunk to
+the parser and returns the aggregated message (content + usage_metadata like `invoke`).
+A retried request streams again from the start: wrap the callback with `emit_once` (outside
+the retried function) so entries of an earlier attempt are not passed on twice.
+
+Standard library only.
+"""
+
+from typing import Any, Callable, List, Optional, Tuple
+import json
+
+Event = Tuple[str, str, Any]
+
+
+class JsonStreamParser:
+    """Character-level scanner over the top-level object; see module docstring for the events."""
+
+    def __init__(self):
+        self.buf = ""
+        self._i = 0
+        self._started = False
+        self.done = False
+        self._depth = 0
+        self._in_str = False
+        self._esc = False
+        self._str_start = 0
+        self._expect_key = False
+        self._key: Optional[str] = None
+        self._val_start: Optional[int] = None
+        self._in_array = False
+        self._elem_from: Optional[int] = None
+
+    def feed(self, chunk: str) -> List[Event]:
+        events: List[Event] = []
+        self.buf += chunk or ""
+        buf = self.buf
+        while self._i < len(buf) and not self.done:
+            i, c = self._i, buf[self._i]
+            self._i += 1
+            if self._in_str:
+                if self._esc:
+                    self._esc = False
+                elif c == "\\":
+                    self._esc = True
+                elif c == '"':
+                    self._in_str = False
+                    if self._depth == 1 and self._expect_key:
+                        self._key = json.loads(buf[self._str_start:i + 1])
+                continue
+            if not self._started:
+                if c == "{":
+                    self._started, self._depth, self._expect_key = True, 1, True
+                continue
+            if c == '"':
+                self._in_str, self._str_start = True, i
+            elif c == ":" and self._depth == 1:
+                self._val_start, self._expect_key, self._in_array = i + 1, False, False
+            elif c == "," and self._depth == 1:
+                self._end_field(i, events)
+                self._expect_key = True
+            elif c == "," and self._depth == 2 and self._in_array:
+                self._end_item(i, events)
+                self._elem_from = i + 1
+            elif c in "{[":
+                if (c == "[" and self._depth == 1 and self._val_start is not None
+                        and not buf[self._val_start:i].strip()):
+                    self._in_array, self._elem_from = True, i + 1
+                self._depth += 1
+            elif c == "]" and self._depth == 2 and self._in_array:
+                self._end_item(i, events)
+                self._depth = 1
+            elif c == "}" and self._depth == 1:
+                self._end_field(i, events)
+                self._depth, self.done = 0, True
+            elif c in "}]":
+                self._depth -= 1
+                if self._depth == 2 and self._in_array:
+                    # an object / array element just closed: emit it without waiting for the ","
+                    self._end_item(i + 1, events)
+                    self._elem_from = None
+        return events
+
+    def _end_field(self, i: int, events: List[Event]) -> None:
+        if self._val_start is None:
+            return
+        text = self.buf[self._val_start:i].strip()
+        self._val_start, self._in_array = None, False
+        try:
+            events.append(("field", self._key or "", json.loads(text)))
+        except ValueError:
+            pass
+
+    def _end_item(self, i: int, events: List[Event]) -> None:
+        if self._elem_from is None:   # already emitted when it closed
+            return
+        text = self.buf[self._elem_from:i].strip()
+        if not text:
+            return
+        try:
+            events.append(("item", self._key or "", json.loads(text)))
+        except ValueError:
+            pass
+
+
+def emit_once(on_event: Callable[[Event], None], item_key: str = "table") -> Callable[[Event], None]:
+    """
+    `on_event` that skips events already seen: a field by its name, an array item by its
+    `item_key` value (the whole item if it has none).
+    """
+    seen = set()
+
+    def emit(ev: Event) -> None:
+        kind, field, value = ev
+        if kind == "item":
+            ident = value.get(item_key) if isinstance(value, dict) and item_key in value else \
+                json.dumps(value, sort_keys=True, default=str)
+        else:
+            ident = None
+        key = (kind, field, str(ident))
+        if key in seen:
+            return
+        seen.add(key)
+        on_event(ev)
+
+    return emit
+
+
+def stream_invoke(llm: Any, messages: List[Any], on_event: Callable[[Event], None]) -> Any:
+    """
+    `llm.stream(messages)` with every completed item / field passed to `on_event` as it arrives.
+    Returns the chunks added together (content + usage_metadata), like the message of `invoke`.
+    """
+    parser = JsonStreamParser()
+    full = None
+    for chunk in llm.stream(messages):
+        full = chunk if full is None else full + chunk
+        text = chunk.content if isinstance(getattr(chunk, "content", None), str) else ""
+        for ev in parser.feed(text):
+            on_event(ev)
+    if full is None:
+        raise ValueError("LLM stream returned no chunks")
+    return full
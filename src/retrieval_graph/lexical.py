@@ -0,0 +1,178 @@
+"""Offline lexical table ranking (no API calls).
+
+BM25 over the same table text the embedding path uses (`corpus._build_table_corpus_from_summaries`:
+table name, summary, column names, plus column descriptions). The index is an inverted index
+(term -> {table: term frequency}) persisted as JSON next to the schema summaries; tables are
+added / removed incrementally by comparing a hash of their text. Tokens are folded to their
+singular form (films -> film, categories -> category) at index and query time; an index saved
+with another token format is rebuilt.
+
+Used by `task2_search.py --mode bm25` and as the lexical first stage of hybrid mode.
+"""
+
+from typing import Dict, List, Optional
+import hashlib
+import heapq
+import json
+import math
+import os
+import re
+
+from .corpus import _build_table_corpus_from_summaries
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_ES_RE = re.compile(r"(?:ss|x|z|ch|sh)es$")
+
+INDEX_FORMAT = 2   # bump when tokenize() changes: saved indexes of another format are rebuilt
+
+# BM25 text uses more columns than the embedding text (no token cost here)
+BM25_MAX_COLS = 64
+
+
+def stem(tok: str) -> str:
+    """Light plural folding: -ies -> -y, -(ss|x|z|ch|sh)es -> stem, -s -> stem (not -ss / -us / -is)."""
+    if len(tok) <= 3 or not tok.endswith("s") or tok.endswith(("ss", "us", "is")):
+        return tok
+    if tok.endswith("ies") and len(tok) > 4:
+        return tok[:-3] + "y"
+    if _ES_RE.search(tok):
+        return tok[:-2]
+    return tok[:-1]
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lower-case alphanumeric tokens, plurals folded (see `stem`); snake_case names are split into
+    their parts too.
+    """
+    return [stem(t) for t in _TOKEN_RE.findall((text or "").lower().replace("_", " "))]
+
+
+class BM25Index:
+    """
+    Incremental BM25 inverted index over table texts.
+
+    Persisted form is the forward index ({table: {"hash", "tf"}}); the postings
+    (term -> {table: tf}) are rebuilt in memory on load.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.docs: Dict[str, Dict] = {}                 # table -> {"hash": str, "len": int, "tf": {term: n}}
+        self.postings: Dict[str, Dict[str, int]] = {}   # term -> {table: tf}
+        self.total_len = 0
+
+    def __len__(self) -> int:
+        return len(self.docs)
+
+    def add(self, table: str, text: str) -> None:
+        """Add (or replace) one table."""
+        if table in self.docs:
+            self.remove(table)
+        tf: Dict[str, int] = {}
+        for tok in tokenize(text):
+            tf[tok] = tf.get(tok, 0) + 1
+        doc_len = sum(tf.values())
+        self.docs[table] = {"hash": hashlib.sha256(text.encode("utf-8")).hexdigest(),
+                            "len": doc_len, "tf": tf}
+        for tok, n in tf.items():
+            self.postings.setdefault(tok, {})[table] = n
+        self.total_len += doc_len
+
+    def remove(self, table: str) -> None:
+        doc = self.docs.pop(table, None)
+        if doc is None:
+            return
+        for tok in doc["tf"]:
+            plist = self.postings.get(tok)
+            if plist is not None:
+                plist.pop(table, None)
+                if not plist:
+                    del self.postings[tok]
+        self.total_len -= doc["len"]
+
+    def sync(self, corpus: Dict[str, str]) -> bool:
+        """Add new/changed tables and remove tables not in `corpus`; True if anything changed."""
+        changed = False
+        for table in [t for t in self.docs if t not in corpus]:
+            self.remove(table)
+            changed = True
+        for table, text in corpus.items():
+            doc = self.docs.get(table)
+            if doc is None or doc["hash"] != hashlib.sha256(text.encode("utf-8")).hexdigest():
+                self.add(table, text)
+                changed = True
+        return changed
+
+    def search(self, query: str, k: int = 5) -> List[Dict]:
+        """Top-k [{"table": str, "score": float}] by BM25 (tables without any query term are skipped)."""
+        n = len(self.docs)
+        if n == 0 or k <= 0:
+            return []
+        avgdl = self.total_len / n if n else 0.0
+        scores: Dict[str, float] = {}
+        for tok in set(tokenize(query)):
+            plist = self.postings.get(tok)
+            if not plist:
+                continue
+            idf = math.log(1 + (n - len(plist) + 0.5) / (len(plist) + 0.5))
+            for table, tf in plist.items():
+                norm = self.k1 * (1 - self.b + self.b * self.docs[table]["len"] / (avgdl or 1.0))
+                scores[table] = scores.get(table, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        best = heapq.nlargest(k, scores.items(), key=lambda x: x[1])
+        return [{"table": t, "score": s} for t, s in best]
+
+    def save(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"format": INDEX_FORMAT, "k1": self.k1, "b": self.b,
+                       "docs": {t: {"hash": d["hash"], "tf": d["tf"]} for t, d in self.docs.items()}},
+                      f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        """Load a saved index; an empty index if the file is missing or unreadable."""
+        index = cls()
+        if not path or not os.path.exists(path):
+            return index
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception as e:
+            print(f"[bm25] ignore unreadable index {path}: {e}")
+            return index
+        if data.get("format") != INDEX_FORMAT:
+            print(f"[bm25] rebuilding {path} (token format {data.get('format', 1)} -> {INDEX_FORMAT})")
+            return index
+        index.k1, index.b = float(data.get("k1", 1.5)), float(data.get("b", 0.75))
+        for table, d in (data.get("docs") or {}).items():
+            tf = {tok: int(n) for tok, n in d["tf"].items()}
+            doc_len = sum(tf.values())
+            index.docs[table] = {"hash": d["hash"], "len": doc_len, "tf": tf}
+            for tok, n in tf.items():
+                index.postings.setdefault(tok, {})[table] = n
+            index.total_len += doc_len
+        return index
+
+
+def load_bm25_index(summaries: List[Dict], index_path: Optional[str] = None) -> BM25Index:
+    """
+    Load the persisted index (if any), bring it in line with `summaries` incrementally,
+    and save it back when something changed.
+    """
+    corpus = _build_table_corpus_from_summaries(summaries, max_cols=BM25_MAX_COLS, col_descriptions=True)
+    index = BM25Index.load(index_path) if index_path else BM25Index()
+    if index.sync(corpus) and index_path:
+        index.save(index_path)
+    return index
+
+
+def lexical_rank_tables(summaries: List[Dict], query: str, k: int = 5,
+                        index_path: Optional[str] = None) -> List[Dict]:
+    """
+    Rank tables with BM25, return [{"table": str, "score": float}] (best first).
+    """
+    return load_bm25_index(summaries, index_path).search(query, k)
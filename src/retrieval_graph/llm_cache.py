@@ -0,0 +1,181 @@
+"""Persistent, content-addressed LLM response cache shared by Tasks 1–3.
+
+Plugs into LangChain's cache hook (`ChatOpenAI(cache=...)`, adapter in utils.py), so every
+`invoke` / `ainvoke` made through `load_chat_model` is looked up first. The key is a SHA-256 of LangChain's
+`llm_string` (model, temperature and the other call settings) plus the serialized prompt
+(system prompt + user payload), so any change in either is a miss.
+
+The cache is used only when replaying an answer is safe to do silently: for temperature-0
+clients (--deterministic / LLM_DETERMINISTIC=1), or when LLM_CACHE names a file explicitly
+(opting in to replay sampled answers too). By default, sampled calls are never cached.
+
+Configuration (environment / .env):
+    LLM_CACHE               path of the SQLite file (unset: <repo>/outputs/llm_cache.sqlite at temperature 0
+                            only; a path: always), "off" to disable
+    LLM_CACHE_MAX_MB        size cap, least-recently-used entries are evicted first (default 256)
+    LLM_CACHE_MAX_AGE_DAYS  entries older than this are ignored and evicted (default 30, 0 = never)
+    LLM_DETERMINISTIC       "1" pins temperature to 0 in load_chat_model (reproducible runs)
+
+Standard library only (values are opaque strings here), so the CLIs can import it without
+pulling in LangChain.
+"""
+
+from typing import Any, Dict, Optional
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+# under the repository root, not the cwd: every task shares one cache wherever it is started from
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+                                  "outputs", "llm_cache.sqlite")
+
+
+class SQLiteResponseCache:
+    """Response store backed by one SQLite file, with size/age eviction and hit/miss counters."""
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_bytes: int = 256 * 1024 * 1024,
+                 max_age_s: float = 30 * 86400, evict_every: int = 100):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age_s = max_age_s
+        self.evict_every = evict_every
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, created REAL, accessed REAL, size INTEGER, value TEXT)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses(accessed)")
+        self.evict()
+
+    @staticmethod
+    def _key(prompt: str, llm_string: str) -> str:
+        return hashlib.sha256(f"{llm_string}\0{prompt}".encode("utf-8")).hexdigest()
+
+    def _expired(self, created: float, now: float) -> bool:
+        return bool(self.max_age_s) and now - created > self.max_age_s
+
+    def get(self, prompt: str, llm_string: str, count_miss: bool = True) -> Optional[str]:
+        """Stored value or None; `count_miss=False` for a look-ahead that is followed by the real lookup."""
+        key = self._key(prompt, llm_string)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT created, value FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None or self._expired(row[0], now):
+                self.misses += count_miss
+                return None
+            self._conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            self.hits += 1
+        return row[1]
+
+    def put(self, prompt: str, llm_string: str, value: str) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, created, accessed, size, value) VALUES (?, ?, ?, ?, ?)",
+                (self._key(prompt, llm_string), now, now, len(value), value))
+            self.writes += 1
+            due = self.evict_every and self.writes % self.evict_every == 0
+        if due:
+            self.evict()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+
+    def evict(self) -> int:
+        """Drop expired entries, then least-recently-used ones until under the size cap."""
+        removed = 0
+        with self._lock:
+            if self.max_age_s:
+                cur = self._conn.execute("DELETE FROM responses WHERE created < ?",
+                                         (time.time() - self.max_age_s,))
+                removed += cur.rowcount
+            total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            if self.max_bytes and total > self.max_bytes:
+                for key, size in self._conn.execute(
+                        "SELECT key, size FROM responses ORDER BY accessed").fetchall():
+                    if total <= self.max_bytes:
+                        break
+                    self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    total -= size
+                    removed += 1
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": entries, "bytes": size, "path": self.path}
+
+
+_CACHE: Optional[SQLiteResponseCache] = None
+_CACHE_LOCK = threading.Lock()
+
+
+def get_response_cache(temperature: Optional[float] = None) -> Optional[SQLiteResponseCache]:
+    """
+    Process-wide cache configured from the environment, or None: LLM_CACHE=off, or LLM_CACHE
+    unset and `temperature` not 0 (sampled answers are not replayed unless asked for).
+    """
+    global _CACHE
+    path = os.getenv("LLM_CACHE")
+    if path is None:
+        if temperature != 0:
+            return None
+        path = DEFAULT_CACHE_PATH
+    if path.strip().lower() in ("", "0", "off", "false", "none"):
+        return None
+    with _CACHE_LOCK:
+        if _CACHE is None or _CACHE.path != path:
+            _CACHE = SQLiteResponseCache(
+                path,
+                max_bytes=int(float(os.getenv("LLM_CACHE_MAX_MB", "256")) * 1024 * 1024),
+                max_age_s=float(os.getenv("LLM_CACHE_MAX_AGE_DAYS", "30")) * 86400,
+            )
+        return _CACHE
+
+
+def cached_response(llm: Any, messages: Any) -> Any:
+    """
+    The answer to `messages` already in the response cache of a load_chat_model client (or of
+    `client.bind(...)`), looked up without a request; None on a miss or without the cache.
+    Lets scheduler.py return cache hits before taking RPM/TPM quota.
+    """
+    kwargs: Dict[str, Any] = {}
+    if getattr(llm, "bound", None) is not None and isinstance(getattr(llm, "kwargs", None), dict):
+        llm, kwargs = llm.bound, dict(llm.kwargs)   # llm.bind(response_format=...)
+    lookup = getattr(getattr(llm, "cache", None), "cached_message", None)
+    return lookup(llm, messages, **kwargs) if callable(lookup) else None
+
+
+def deterministic_mode() -> bool:
+    return os.getenv("LLM_DETERMINISTIC", "").strip().lower() in ("1", "true", "yes", "on")
+
+
+def configure(deterministic: bool = False, no_cache: bool = False) -> None:
+    """Apply the tasks' --deterministic / --no-cache flags (before the first load_chat_model call)."""
+    if deterministic:
+        os.environ["LLM_DETERMINISTIC"] = "1"
+    if no_cache:
+        os.environ["LLM_CACHE"] = "off"
+
+
+def cache_stats_line() -> str:
+    """One-line hit/miss summary for the end of a run ('' if the cache was never used)."""
+    if _CACHE is None:
+        return ""
+    s = _CACHE.stats()
+    return (f"[cache] hits={s['hits']} misses={s['misses']} hit_rate={s['hit_rate']:.0%} "
+            f"entries={s['entries']} size={s['bytes'] / 1e6:.1f}MB ({s['path']})")
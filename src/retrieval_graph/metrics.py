@@ -0,0 +1,322 @@
+"""Per-call instrumentation for chat-model and embedding requests (Tasks 1–3, embedding.py).
+
+Every model call is wrapped in `record_call(stage, ...)`:
+
+    with record_call("task3.eval", model=model, table=table) as call:
+        resp = llm.invoke(messages)
+        call.done(resp)              # latency stops here; token usage read from the response
+        data = parse(resp)           # an exception after done() counts as a parse failure
+                                     # (structured_output.py marks call.repaired / call.reasked)
+
+Streamed calls also call `call.first_result()` when the first parsed entry arrives, so the
+time-to-first-result (ttfr_s) is reported next to the total latency.
+
+Each call becomes one record {ts, run, stage, kind, model, table, items, latency_s, ttfr_s,
+prompt_tokens, completion_tokens, cached_tokens, cache_hit, retries, rate_limited, repaired, reasked,
+parse_failure, error} (retries and rate_limited (429s) are reported by scheduler.py; repaired /
+reasked mark JSON answers that structured_output.py fixed client-side / with a re-ask; cache_hit
+marks answers replayed from the local response cache by scheduler.py: no request, 0 tokens billed):
+- streamed to `<LLM_METRICS_DIR>/<run>-<YYYYmmdd-HHMMSS>.jsonl` (one file per run, earlier runs are
+  kept) once `configure_run(run)` was called (default dir outputs/metrics, LLM_METRICS_DIR=off
+  disables the files),
+- aggregated per (stage, kind, model) in memory for `summary_lines()` (p50/p95/p99 latency)
+  and `prometheus_text()` (a Prometheus text-format snapshot, written by `finish_run()`, which
+  also prints the response-cache and scheduler lines at the end of a task).
+
+Standard library only; safe to use from threads and asyncio tasks.
+"""
+
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Tuple
+import json
+import os
+import threading
+import time
+
+DEFAULT_METRICS_DIR = os.path.join("outputs", "metrics")
+LATENCY_WINDOW = 100_000   # latencies kept per stage for the percentiles
+
+
+class CallMetrics:
+    """One in-flight call; filled by `done()` / `retry()` and written when the block exits."""
+
+    def __init__(self, stage: str, kind: str, model: Optional[str], table: Optional[str],
+                 items: Optional[int]):
+        self.stage = stage
+        self.kind = kind
+        self.model = model
+        self.table = table
+        self.items = items
+        self.retries = 0
+        self.rate_limited = 0
+        self.repaired = False
+        self.reasked = False
+        self.cache_hit = False   # set by scheduler.py: answer replayed from llm_cache.py
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cached_tokens = 0
+        self.latency_s: Optional[float] = None
+        self.ttfr_s: Optional[float] = None
+        self._t0 = time.perf_counter()
+
+    def retry(self, rate_limited: bool = False) -> None:
+        self.retries += 1
+        self.rate_limited += rate_limited
+
+    def first_result(self) -> None:
+        """Mark the first usable entry of a streamed answer (only the first call counts)."""
+        if self.ttfr_s is None:
+            self.ttfr_s = time.perf_counter() - self._t0
+
+    def done(self, resp: Any = None) -> None:
+        """
+        Stop the clock and read token usage (LangChain usage_metadata or OpenAI `usage`). A cache
+        hit keeps the usage of the original call in its metadata but bills nothing: 0 tokens.
+        """
+        self.latency_s = time.perf_counter() - self._t0
+        if self.cache_hit:
+            return
+        u = getattr(resp, "usage_metadata", None)
+        if u:
+            details = u.get("input_token_details") or {}
+            self.prompt_tokens = int(u.get("input_tokens", 0) or 0)
+            self.completion_tokens = int(u.get("output_tokens", 0) or 0)
+            self.cached_tokens = int(details.get("cache_read", 0) or 0)
+            return
+        u = getattr(resp, "usage", None)
+        if u is not None:
+            self.prompt_tokens = int(getattr(u, "prompt_tokens", 0) or 0)
+            self.completion_tokens = int(getattr(u, "completion_tokens", 0) or 0)
+            details = getattr(u, "prompt_tokens_details", None)
+            self.cached_tokens = int(getattr(details, "cached_tokens", 0) or 0) if details else 0
+
+
+class _Agg:
+    __slots__ = ("calls", "errors", "parse_failures", "retries", "rate_limited", "repaired", "reasked",
+                 "cache_hits", "prompt_tokens", "completion_tokens", "cached_tokens", "latency_sum", "latencies", "ttfrs")
+
+    def __init__(self):
+        self.calls = self.errors = self.parse_failures = self.retries = self.rate_limited = 0
+        self.repaired = self.reasked = self.cache_hits = 0
+        self.prompt_tokens = self.completion_tokens = self.cached_tokens = 0
+        self.latency_sum = 0.0
+        self.latencies: List[float] = []
+        self.ttfrs: List[float] = []
+
+
+class MetricsRecorder:
+    def __init__(self):
+        self.run: Optional[str] = None
+        self.jsonl_path: Optional[str] = None
+        self._file = None
+        self._lock = threading.Lock()
+        self._agg: Dict[Tuple[str, str, str], _Agg] = {}
+
+    def configure(self, run: str, metrics_dir: Optional[str] = None) -> None:
+        """Start a run: reset the aggregates and open a new `<dir>/<run>-<timestamp>.jsonl`."""
+        metrics_dir = os.getenv("LLM_METRICS_DIR", DEFAULT_METRICS_DIR) if metrics_dir is None else metrics_dir
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            self.run, self.jsonl_path = run, None
+            self._agg.clear()
+            if metrics_dir.strip().lower() not in ("", "0", "off", "false", "none"):
+                os.makedirs(metrics_dir, exist_ok=True)
+                stamp = time.strftime("%Y%m%d-%H%M%S")
+                self.jsonl_path = os.path.join(metrics_dir, f"{run}-{stamp}.jsonl")
+                self._file = open(self.jsonl_path, "a", encoding="utf-8")   # same-second reruns append
+
+    def add(self, call: CallMetrics, parse_failure: bool, error: Optional[str]) -> None:
+        latency = call.latency_s if call.latency_s is not None else time.perf_counter() - call._t0
+        rec = {"ts": round(time.time(), 3), "run": self.run, "stage": call.stage, "kind": call.kind,
+               "model": call.model, "table": call.table, "items": call.items,
+               "latency_s": round(latency, 6),
+               "ttfr_s": round(call.ttfr_s, 6) if call.ttfr_s is not None else None,
+               "prompt_tokens": call.prompt_tokens,
+               "completion_tokens": call.completion_tokens, "cached_tokens": call.cached_tokens,
+               "cache_hit": call.cache_hit, "retries": call.retries, "rate_limited": call.rate_limited,
+               "repaired": call.repaired, "reasked": call.reasked, "parse_failure": parse_failure, "error": error}
+        key = (call.stage, call.kind, call.model or "")
+        with self._lock:
+            a = self._agg.get(key)
+            if a is None:
+                a = self._agg[key] = _Agg()
+            a.calls += 1
+            a.errors += error is not None
+            a.parse_failures += parse_failure
+            a.retries += call.retries
+            a.rate_limited += call.rate_limited
+            a.repaired += call.repaired
+            a.reasked += call.reasked
+            a.cache_hits += call.cache_hit
+            a.prompt_tokens += call.prompt_tokens
+            a.completion_tokens += call.completion_tokens
+            a.cached_tokens += call.cached_tokens
+            a.latency_sum += latency
+            a.latencies.append(latency)
+            if len(a.latencies) > LATENCY_WINDOW:
+                del a.latencies[: len(a.latencies) - LATENCY_WINDOW]
+            if call.ttfr_s is not None:
+                a.ttfrs.append(call.ttfr_s)
+                if len(a.ttfrs) > LATENCY_WINDOW:
+                    del a.ttfrs[: len(a.ttfrs) - LATENCY_WINDOW]
+            if self._file is not None:
+                self._file.write(json.dumps(rec, ensure_ascii=False) + "\n")
+                self._file.flush()
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """{"stage (model)": {kind, calls, errors, parse_failures, parse_failure_rate, repaired, reasked,
+        cache_hits, retries, rate_limited, tokens, p50/p95/p99, ttfr p50/p95 (streamed calls), streamed}}."""
+        out: Dict[str, Dict[str, Any]] = {}
+        with self._lock:
+            items = [(k, a, sorted(a.latencies), sorted(a.ttfrs)) for k, a in self._agg.items()]
+        for (stage, kind, model), a, lat, ttfr in items:
+            out[f"{stage} ({model})" if model else stage] = {
+                "stage": stage, "kind": kind, "model": model, "calls": a.calls, "errors": a.errors,
+                "parse_failures": a.parse_failures, "parse_failure_rate": a.parse_failures / a.calls,
+                "repaired": a.repaired, "reasked": a.reasked, "cache_hits": a.cache_hits,
+                "retries": a.retries, "rate_limited": a.rate_limited,
+                "prompt_tokens": a.prompt_tokens, "completion_tokens": a.completion_tokens,
+                "cached_tokens": a.cached_tokens, "latency_sum_s": a.latency_sum,
+                "p50_s": _pct(lat, 0.50), "p95_s": _pct(lat, 0.95), "p99_s": _pct(lat, 0.99),
+                "streamed": len(ttfr), "ttfr_p50_s": _pct(ttfr, 0.50), "ttfr_p95_s": _pct(ttfr, 0.95)}
+        return out
+
+
+def _pct(xs: List[float], q: float) -> Optional[float]:
+    return xs[min(len(xs) - 1, int(q * len(xs)))] if xs else None
+
+
+RECORDER = MetricsRecorder()
+
+
+@contextmanager
+def record_call(stage: str, kind: str = "llm", model: Optional[str] = None, table: Optional[str] = None,
+                items: Optional[int] = None, recorder: Optional[MetricsRecorder] = None):
+    """Time one model call (see module docstring); yields its CallMetrics."""
+    recorder = recorder or RECORDER
+    call = CallMetrics(stage, kind, model, table, items)
+    try:
+        yield call
+    except Exception as e:
+        parse_failure = call.latency_s is not None   # the call itself returned: parsing failed
+        recorder.add(call, parse_failure, None if parse_failure else f"{type(e).__name__}: {e}")
+        raise
+    recorder.add(call, False, None)
+
+
+def model_name(llm: Any) -> Optional[str]:
+    """Model name of a LangChain chat model (None for clients without one)."""
+    return getattr(llm, "model_name", None) or getattr(llm, "model", None)
+
+
+def configure_run(run: str, metrics_dir: Optional[str] = None) -> None:
+    RECORDER.configure(run, metrics_dir)
+
+
+def summary_lines() -> List[str]:
+    """
+    Per-stage summary: calls, errors, parse failures, retries, 429s, tokens, p50/p95/p99 latency;
+    then cache hits (answers that billed no tokens), time to first result of streamed stages and
+    the structured-output outcome of JSON stages.
+    """
+    snap = RECORDER.snapshot()
+    if not snap:
+        return []
+
+    def ms(v):
+        return f"{v * 1000:8.1f}" if v is not None else f"{'-':>8}"
+
+    lines = [f"[metrics] {'stage':<28}{'calls':>6}{'err':>5}{'parse':>6}{'retry':>6}{'429':>5}"
+             f"{'prompt tok':>11}{'compl tok':>10}{'cached':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"]
+    for name, s in sorted(snap.items()):
+        lines.append(f"[metrics] {name[:28]:<28}{s['calls']:>6}{s['errors']:>5}{s['parse_failures']:>6}"
+                     f"{s['retries']:>6}{s['rate_limited']:>5}{s['prompt_tokens']:>11}{s['completion_tokens']:>10}"
+                     f"{s['cached_tokens']:>8}{ms(s['p50_s'])} {ms(s['p95_s'])} {ms(s['p99_s'])}")
+    for name, s in sorted(snap.items()):
+        if s["cache_hits"]:
+            lines.append(f"[metrics] {name[:28]:<28} response cache: {s['cache_hits']}/{s['calls']} calls "
+                         f"replayed (0 tokens billed), {s['calls'] - s['cache_hits']} sent")
+    for name, s in sorted(snap.items()):
+        if s["streamed"]:
+            lines.append(f"[metrics] {name[:28]:<28} first result (streamed {s['streamed']}): "
+                         f"p50 {ms(s['ttfr_p50_s']).strip()} ms, p95 {ms(s['ttfr_p95_s']).strip()} ms "
+                         f"vs total p50 {ms(s['p50_s']).strip()} ms")
+    for name, s in sorted(snap.items()):
+        if s["repaired"] or s["reasked"] or s["parse_failures"]:
+            lines.append(f"[metrics] {name[:28]:<28} structured output: parse failures {s['parse_failures']}/"
+                         f"{s['calls']} ({s['parse_failure_rate']:.1%}), repaired {s['repaired']}, "
+                         f"re-asked {s['reasked']} -> answers saved {s['repaired'] + s['reasked']}")
+    return lines
+
+
+def prometheus_text() -> str:
+    """Prometheus text exposition format (counters + a latency summary per stage/kind/model)."""
+    snap = RECORDER.snapshot()
+    counters = [("model_calls_total", "calls", "Model calls."),
+                ("model_call_errors_total", "errors", "Calls that raised."),
+                ("model_parse_failures_total", "parse_failures", "Responses that could not be parsed."),
+                ("model_retries_total", "retries", "Retries made by the caller."),
+                ("model_rate_limited_total", "rate_limited", "Attempts rejected with HTTP 429."),
+                ("model_repaired_total", "repaired", "JSON answers repaired client-side (no extra call)."),
+                ("model_reasked_total", "reasked", "JSON answers completed by re-asking for invalid fields."),
+                ("model_cache_hits_total", "cache_hits", "Answers replayed from the local response cache (not billed)."),
+                ("model_prompt_tokens_total", "prompt_tokens", "Prompt (input) tokens."),
+                ("model_completion_tokens_total", "completion_tokens", "Completion (output) tokens."),
+                ("model_cached_tokens_total", "cached_tokens", "Prompt tokens served from the provider cache.")]
+
+    def labels(s, extra=""):
+        esc = lambda v: str(v).replace("\\", "\\\\").replace('"', '\\"')
+        return (f'{{run="{esc(RECORDER.run or "")}",stage="{esc(s["stage"])}",kind="{esc(s["kind"])}",'
+                f'model="{esc(s["model"])}"{extra}}}')
+
+    out: List[str] = []
+    for metric, field, help_text in counters:
+        out += [f"# HELP {metric} {help_text}", f"# TYPE {metric} counter"]
+        out += [f"{metric}{labels(s)} {s[field]}" for s in snap.values()]
+    out += ["# HELP model_call_latency_seconds Wall latency of model calls.",
+            "# TYPE model_call_latency_seconds summary"]
+    for s in snap.values():
+        for q, key in (("0.5", "p50_s"), ("0.95", "p95_s"), ("0.99", "p99_s")):
+            if s[key] is not None:
+                quantile = ',quantile="%s"' % q
+                out.append(f"model_call_latency_seconds{labels(s, quantile)} {s[key]:.6f}")
+        out.append(f"model_call_latency_seconds_sum{labels(s)} {s['latency_sum_s']:.6f}")
+        out.append(f"model_call_latency_seconds_count{labels(s)} {s['calls']}")
+    out += ["# HELP model_call_first_result_seconds Time to the first parsed entry of streamed calls.",
+            "# TYPE model_call_first_result_seconds summary"]
+    for s in snap.values():
+        if not s["streamed"]:
+            continue
+        for q, key in (("0.5", "ttfr_p50_s"), ("0.95", "ttfr_p95_s")):
+            quantile = ',quantile="%s"' % q
+            out.append(f"model_call_first_result_seconds{labels(s, quantile)} {s[key]:.6f}")
+        out.append(f"model_call_first_result_seconds_count{labels(s)} {s['streamed']}")
+    return "\n".join(out) + "\n"
+
+
+def finish_run() -> None:
+    """
+    End-of-run report of a task (also after a failure): response-cache and scheduler lines, the
+    per-stage summary, and `<run>-<timestamp>.prom` next to the JSONL (if any calls were made).
+    """
+    from .llm_cache import cache_stats_line   # imported here: both may use this module
+    from .scheduler import scheduler_stats_lines
+    cache_line = cache_stats_line()
+    if cache_line:
+        print(cache_line)
+    for line in scheduler_stats_lines():
+        print(line)
+    lines = summary_lines()
+    if not lines:
+        return
+    for line in lines:
+        print(line)
+    path = RECORDER.jsonl_path
+    if path:
+        RECORDER._file.flush()
+        prom = os.path.splitext(path)[0] + ".prom"
+        with open(prom, "w", encoding="utf-8") as f:
+            f.write(prometheus_text())
+        print(f"[metrics] {path}, {prom}")
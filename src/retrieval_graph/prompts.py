@@ -26,6 +26,8 @@ Rules:
 - Output ONLY JSON (no markdown fence, no extra commentary, no extra keys).
 - Base your descriptions on the column names and sample rows provided.
 - If a column name is ambiguous, infer cautiously from the samples.
+- If "column_stats" are provided (dtype, null_rate, min/max, approx_distinct, top_values over the WHOLE table),
+  prefer them over the few sample rows for sparse, skewed or coded columns.
 - Keep each column description short (≤1 sentence).
 """
 
@@ -79,4 +81,90 @@ Instructions:
     "why": [short bullets], "missing_info": [fields/constraints not found],
     "irrelevant_info": [fields that are off-topic for this query] }
 - No markdown fences, no extra keys, no comments.
-"""
\ No newline at end of file
+"""
+
+
+
+EVAL_BATCH_PROMPT = """You are a rigorous data analyst.
+Judge how relevant EACH candidate table is to the given user query. Judge every table independently.
+
+Scoring scale:
+5 = Fully aligned. This table alone contains the key fields needed to answer the query.
+4 = Mostly aligned. It answers the main intent but might miss minor constraints/fields.
+3 = Partially related. Provides context/partial info; likely needs joins with other tables.
+2 = Weakly related. Only tangentially related to the topic.
+1 = Irrelevant.
+
+Instructions:
+- Base your decision on each table's summary, column list, and sample rows.
+- Think about whether the table has the exact entities, filters, and measures needed.
+- Be concise and concrete in explanations.
+- Output STRICT JSON ONLY with this shape, with EXACTLY ONE entry per candidate table (same table names):
+  { "query": str,
+    "evaluations": [
+      { "table": str, "relevance_rating": 1-5, "sufficient_to_answer": true/false,
+        "why": [short bullets], "missing_info": [fields/constraints not found],
+        "irrelevant_info": [fields that are off-topic for this query] },
+      ...
+    ] }
+- No markdown fences, no extra keys, no comments.
+"""
+
+
+# Response schemas (structured_output.py): the same shapes as the prompts above, sent to the
+# provider's structured-output mode where supported and used to validate / repair every answer.
+# "default": filled in when missing or invalid instead of re-asking; "x-key": entries of the
+# array are re-asked individually, identified by this field; "minLength": client-side only.
+_RATING = {"type": "integer", "enum": [1, 2, 3, 4, 5]}
+_STRINGS = {"type": "array", "items": {"type": "string"}, "default": []}
+
+SCHEMA_SUMMARY_SCHEMA = {
+    "title": "table_summary",
+    "type": "object",
+    "properties": {
+        "table": {"type": "string"},
+        "summary": {"type": "string", "minLength": 1},
+        "columns": {"type": "array", "items": {
+            "type": "object",
+            "properties": {"name": {"type": "string", "minLength": 1},
+                           "description": {"type": "string", "default": ""}}}},
+    },
+}
+
+TABLE_MATCH_SCHEMA = {
+    "title": "table_match",
+    "type": "object",
+    "properties": {
+        "query": {"type": "string", "default": ""},
+        "choices": {"type": "array", "x-key": "table", "items": {
+            "type": "object",
+            "properties": {"table": {"type": "string", "minLength": 1},
+                           "score": _RATING,
+                           "reason": {"type": "string", "default": ""}}}},
+    },
+}
+
+_EVAL_FIELDS = {
+    "table": {"type": "string", "minLength": 1},
+    "relevance_rating": _RATING,
+    "sufficient_to_answer": {"type": "boolean", "default": False},
+    "why": _STRINGS,
+    "missing_info": _STRINGS,
+    "irrelevant_info": _STRINGS,
+}
+
+EVAL_SCHEMA = {
+    "title": "table_evaluation",
+    "type": "object",
+    "properties": dict({"query": {"type": "string", "default": ""}}, **_EVAL_FIELDS),
+}
+
+EVAL_BATCH_SCHEMA = {
+    "title": "table_evaluations",
+    "type": "object",
+    "properties": {
+        "query": {"type": "string", "default": ""},
+        "evaluations": {"type": "array", "x-key": "table",
+                        "items": {"type": "object", "properties": _EVAL_FIELDS}},
+    },
+}
@@ -0,0 +1,392 @@
+"""Shared request scheduler for chat-model and embedding calls (Tasks 1–3, embedding.py).
+
+Every model request goes through the scheduler of its quota (kind + model):
+
+    with record_call("task3.eval", model=model, table=table) as call:
+        resp = scheduler_for("llm", model).run(lambda: llm.invoke(messages),
+                                               tokens=message_tokens(messages), call=call)
+        call.done(resp)
+
+- requests/min and tokens/min buckets (LLM_RPM / LLM_TPM, EMBED_RPM / EMBED_TPM; 0 = no limit on
+  the client): a request waits until both cover it, so the account quota is used evenly instead
+  of in bursts that end in 429s. The token estimate is corrected with the usage of the response.
+- adaptive concurrency (AIMD): the in-flight limit starts at LLM_CONCURRENCY / EMBED_CONCURRENCY,
+  is halved on a 429 and grows back by ~1 per window of successes. Only requests sent after the
+  last cut can cut again, so one burst of 429s halves it once.
+- retries with jittered exponential backoff (full jitter):
+  * 429s: Retry-After is honoured and pauses the whole quota, not just the rejected request;
+    a request gives up after RATE_LIMIT_MAX_WAIT seconds (default 300) of backing off,
+  * timeouts, connection errors and 5xx: at most LLM_RETRIES / EMBED_RETRIES per request, and
+    across the process at most 10 + RETRY_BUDGET (default 0.2) x requests: when the provider is
+    down, calls fail fast instead of multiplying the load.
+Other errors (bad request, auth, parsing) are raised at once. The SDK clients are created with
+max_retries=0, so this is the only retry layer.
+- `cached=` (e.g. `lambda: cached_response(llm, messages)`, llm_cache.py) is tried first: an
+  answer from the response cache is returned without taking quota or a concurrency slot.
+
+Retries and 429s are counted on the metrics.py call; `scheduler_stats_lines()` summarizes every
+scheduler (requests, 429s, retries, time spent waiting for quota, current concurrency).
+
+Standard library only; one scheduler is shared by threads and asyncio tasks.
+"""
+
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, TypeVar
+import os
+import random
+import threading
+import time
+
+from .corpus import estimate_tokens
+
+T = TypeVar("T")
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except ValueError:
+        return default
+
+
+class TokenBucket:
+    """
+    `per_minute` units refilled continuously, at most one second's worth stored.
+    `reserve(n)` takes n units at once (the level may go negative) and returns how long the caller
+    must wait before sending; later reservations queue behind it.
+    """
+
+    def __init__(self, per_minute: float):
+        self.rate = per_minute / 60.0
+        self.capacity = max(1.0, self.rate)
+        self.level = self.capacity
+        self._t = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, n: float) -> float:
+        with self._lock:
+            now = time.monotonic()
+            self.level = min(self.capacity, self.level + (now - self._t) * self.rate)
+            self._t = now
+            self.level -= n
+            return -self.level / self.rate if self.level < 0 else 0.0
+
+    def settle(self, delta: float) -> None:
+        """Correct a reservation once the real cost is known (delta = actual - reserved)."""
+        with self._lock:
+            self.level = min(self.capacity, self.level - delta)
+
+
+class AdaptiveLimit:
+    """In-flight request limit, additive increase / multiplicative decrease (see module docstring)."""
+
+    def __init__(self, maximum: int):
+        self.maximum = max(1, int(maximum))
+        self.limit = float(self.maximum)
+        self.in_flight = 0
+        self._cut_at = 0.0
+        self._cond = threading.Condition()
+
+    def try_acquire(self) -> bool:
+        with self._cond:
+            if self.in_flight >= int(self.limit):
+                return False
+            self.in_flight += 1
+            return True
+
+    def acquire(self) -> None:
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+
+    async def acquire_async(self) -> None:
+        import asyncio
+        delay = 0.001
+        while not self.try_acquire():
+            await asyncio.sleep(delay)
+            delay = min(0.05, delay * 2)
+
+    def release(self, started: float, throttled: bool) -> None:
+        with self._cond:
+            self.in_flight -= 1
+            if throttled:
+                if started >= self._cut_at:
+                    self.limit = max(1.0, self.limit / 2)
+                    self._cut_at = time.monotonic()
+            else:
+                self.limit = min(float(self.maximum), self.limit + 1.0 / self.limit)
+            self._cond.notify_all()
+
+
+class RetryBudget:
+    """Retries allowed across the process: `minimum` + `ratio` x requests made so far."""
+
+    def __init__(self, ratio: float = 0.2, minimum: int = 10):
+        self.ratio = ratio
+        self.minimum = minimum
+        self.requests = 0
+        self.retries = 0
+        self._lock = threading.Lock()
+
+    def request(self) -> None:
+        with self._lock:
+            self.requests += 1
+
+    def try_spend(self) -> bool:
+        with self._lock:
+            if self.retries >= self.minimum + self.ratio * self.requests:
+                return False
+            self.retries += 1
+            return True
+
+
+def _status(e: BaseException) -> Optional[int]:
+    code = getattr(e, "status_code", None)
+    if code is None:
+        code = getattr(getattr(e, "response", None), "status_code", None)
+    return code if isinstance(code, int) else None
+
+
+def is_rate_limit(e: BaseException) -> bool:
+    """HTTP 429 (openai.RateLimitError and anything else carrying the status)."""
+    return _status(e) == 429 or "RateLimit" in type(e).__name__
+
+
+def is_retryable(e: BaseException) -> bool:
+    """Rate limits, timeouts, connection errors and 5xx; not 4xx or parsing errors."""
+    if is_rate_limit(e):
+        return True
+    code = _status(e)
+    if code is not None:
+        return code in (408, 409) or code >= 500
+    if isinstance(e, (TimeoutError, ConnectionError)):
+        return True
+    return any(s in c.__name__ for c in type(e).__mro__ for s in ("Timeout", "Connection", "RemoteProtocol"))
+
+
+def retry_after(e: BaseException) -> Optional[float]:
+    """Seconds from a Retry-After(-ms) response header, None if absent."""
+    headers = getattr(getattr(e, "response", None), "headers", None)
+    if not hasattr(headers, "get"):
+        return None
+    for key, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+        value = headers.get(key)
+        if value is not None:
+            try:
+                return max(0.0, float(value) * scale)
+            except ValueError:
+                pass
+    return None
+
+
+def response_tokens(resp: Any) -> int:
+    """Total tokens reported by a LangChain message (usage_metadata) or an OpenAI response (usage)."""
+    u = getattr(resp, "usage_metadata", None)
+    if u:
+        return int(u.get("total_tokens") or (u.get("input_tokens", 0) or 0) + (u.get("output_tokens", 0) or 0))
+    u = getattr(resp, "usage", None)
+    return int(getattr(u, "total_tokens", 0) or 0) if u is not None else 0
+
+
+def message_tokens(messages: List[Any], completion: Optional[int] = None) -> int:
+    """Estimated prompt tokens of chat messages + the completion reserve (LLM_COMPLETION_TOKENS)."""
+    def content(m):
+        return m.get("content", "") if isinstance(m, dict) else getattr(m, "content", str(m))
+
+    reserve = int(_env_float("LLM_COMPLETION_TOKENS", 500)) if completion is None else completion
+    return sum(estimate_tokens(str(content(m))) for m in messages) + reserve
+
+
+class Scheduler:
+    """Rate-limit-aware runner for the requests of one quota (see module docstring)."""
+
+    def __init__(self, name: str, rpm: float = 0, tpm: float = 0, concurrency: int = 16,
+                 retries: int = 6, max_throttle_s: float = 300.0, base_delay: float = 0.5,
+                 max_delay: float = 30.0, budget: Optional[RetryBudget] = None):
+        self.name = name
+        self.request_bucket = TokenBucket(rpm) if rpm > 0 else None
+        self.token_bucket = TokenBucket(tpm) if tpm > 0 else None
+        self.limit = AdaptiveLimit(concurrency)
+        self.retries = retries
+        self.max_throttle_s = max_throttle_s
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget = budget or RetryBudget()
+        self.stats = {"requests": 0, "cache_hits": 0, "rate_limited": 0, "retries": 0, "gave_up": 0,
+                      "wait_s": 0.0}
+        self._resume_at = 0.0   # Retry-After of the last 429: the whole quota waits until then
+        self._lock = threading.Lock()
+
+    def _reserve(self, tokens: int) -> float:
+        self.budget.request()
+        wait = 0.0
+        if self.request_bucket is not None:
+            wait = self.request_bucket.reserve(1)
+        if self.token_bucket is not None and tokens:
+            wait = max(wait, self.token_bucket.reserve(tokens))
+        with self._lock:
+            wait = max(wait, self._resume_at - time.monotonic())
+            self.stats["requests"] += 1
+            self.stats["wait_s"] += wait
+        return wait
+
+    def _settle(self, tokens: int, result: Any) -> None:
+        actual = response_tokens(result)
+        if self.token_bucket is not None and actual:
+            self.token_bucket.settle(actual - tokens)
+
+    def _backoff(self, e: Exception, state: Dict[str, float], retries: int, call: Any) -> Optional[float]:
+        """
+        Delay before the next attempt, or None to raise `e`. `state` counts the attempts, the
+        non-429 errors (at most `retries`) and the time spent backing off from 429s (at most
+        max_throttle_s); 429s do not draw on the retry budget.
+        """
+        throttled = is_rate_limit(e)
+        with self._lock:
+            self.stats["rate_limited"] += throttled
+        give_up = not is_retryable(e)
+        if not give_up and throttled:
+            give_up = state["throttled_s"] >= self.max_throttle_s
+        elif not give_up:
+            state["errors"] += 1
+            give_up = state["errors"] > retries or not self.budget.try_spend()
+        if give_up:
+            with self._lock:
+                self.stats["gave_up"] += is_retryable(e)
+            return None
+        delay = random.uniform(0.0, min(self.max_delay, self.base_delay * 2 ** state["attempt"]))
+        hint = retry_after(e) if throttled else None
+        if hint is not None:
+            delay = max(delay, hint + random.uniform(0.0, self.base_delay))
+            with self._lock:
+                self._resume_at = max(self._resume_at, time.monotonic() + hint)
+        with self._lock:
+            self.stats["retries"] += 1
+        if call is not None:
+            call.retry(rate_limited=throttled)
+        if throttled:
+            state["throttled_s"] += delay
+        else:
+            print(f"[scheduler] {self.name}: {type(e).__name__} ({e}); "
+                  f"retry {int(state['errors'])}/{retries} in {delay:.1f}s")
+        state["attempt"] += 1
+        return delay
+
+    def _cache_hit(self, cached: Optional[Callable[[], Any]], call: Any) -> Any:
+        hit = cached() if cached is not None else None
+        if hit is not None:
+            with self._lock:
+                self.stats["cache_hits"] += 1
+            if call is not None:
+                call.cache_hit = True   # metrics.py: no tokens billed
+        return hit
+
+    def run(self, fn: Callable[[], T], tokens: int = 0, call: Any = None,
+            retries: Optional[int] = None, cached: Optional[Callable[[], Optional[T]]] = None) -> T:
+        """
+        Call `fn()` within the limits, retrying transient errors; `tokens` = estimated cost.
+        `cached()` (optional) is tried first: a non-None answer is returned without a request.
+        """
+        hit = self._cache_hit(cached, call)
+        if hit is not None:
+            return hit
+        retries = self.retries if retries is None else retries
+        state = {"attempt": 0, "errors": 0, "throttled_s": 0.0}
+        while True:
+            self.limit.acquire()
+            started, throttled = time.monotonic(), False
+            try:
+                wait = self._reserve(tokens)
+                if wait > 0:
+                    time.sleep(wait)
+                    started = time.monotonic()
+                result = fn()
+            except Exception as e:
+                throttled = is_rate_limit(e)
+                delay = self._backoff(e, state, retries, call)
+                if delay is None:
+                    raise
+            else:
+                self._settle(tokens, result)
+                return result
+            finally:
+                self.limit.release(started, throttled)
+            time.sleep(delay)
+
+    async def arun(self, fn: Callable[[], Awaitable[T]], tokens: int = 0, call: Any = None,
+                   retries: Optional[int] = None, cached: Optional[Callable[[], Optional[T]]] = None) -> T:
+        """Async `run`: `fn()` returns an awaitable (e.g. `lambda: llm.ainvoke(messages)`)."""
+        import asyncio
+        hit = self._cache_hit(cached, call)   # a local SQLite lookup: not worth a thread hop
+        if hit is not None:
+            return hit
+        retries = self.retries if retries is None else retries
+        state = {"attempt": 0, "errors": 0, "throttled_s": 0.0}
+        while True:
+            await self.limit.acquire_async()
+            started, throttled = time.monotonic(), False
+            try:
+                wait = self._reserve(tokens)
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                    started = time.monotonic()
+                result = await fn()
+            except Exception as e:
+                throttled = is_rate_limit(e)
+                delay = self._backoff(e, state, retries, call)
+                if delay is None:
+                    raise
+            else:
+                self._settle(tokens, result)
+                return result
+            finally:
+                self.limit.release(started, throttled)
+            await asyncio.sleep(delay)
+
+
+_SCHEDULERS: Dict[Tuple[str, str], Scheduler] = {}
+_SCHEDULERS_LOCK = threading.Lock()
+_BUDGET: Optional[RetryBudget] = None
+
+
+def scheduler_for(kind: str = "llm", model: Optional[str] = None) -> Scheduler:
+    """The process-wide scheduler of a quota ("llm" or "embedding", per model), configured from env."""
+    global _BUDGET
+    key = (kind, model or "")
+    with _SCHEDULERS_LOCK:
+        sched = _SCHEDULERS.get(key)
+        if sched is None:
+            if _BUDGET is None:
+                _BUDGET = RetryBudget(_env_float("RETRY_BUDGET", 0.2))
+            prefix, retries = ("EMBED", 3) if kind == "embedding" else ("LLM", 6)
+            sched = _SCHEDULERS[key] = Scheduler(
+                f"{kind} {model}" if model else kind,
+                rpm=_env_float(f"{prefix}_RPM", 0), tpm=_env_float(f"{prefix}_TPM", 0),
+                concurrency=int(_env_float(f"{prefix}_CONCURRENCY", 16)),
+                retries=int(_env_float(f"{prefix}_RETRIES", retries)),
+                max_throttle_s=_env_float("RATE_LIMIT_MAX_WAIT", 300.0), budget=_BUDGET)
+        return sched
+
+
+def reset_schedulers() -> None:
+    """Forget all schedulers (limits are re-read from env on next use)."""
+    global _BUDGET
+    with _SCHEDULERS_LOCK:
+        _SCHEDULERS.clear()
+        _BUDGET = None
+
+
+def scheduler_snapshot() -> Dict[str, Dict[str, Any]]:
+    """{name: {requests, rate_limited, retries, gave_up, wait_s, concurrency, max_concurrency}}."""
+    with _SCHEDULERS_LOCK:
+        items = list(_SCHEDULERS.values())
+    return {s.name: dict(s.stats, wait_s=round(s.stats["wait_s"], 3), concurrency=round(s.limit.limit, 2),
+                         max_concurrency=s.limit.maximum) for s in items}
+
+
+def scheduler_stats_lines() -> List[str]:
+    return [f"[scheduler] {name}: {st['requests']} requests, {st['cache_hits']} cache hits (no quota), "
+            f"{st['rate_limited']} rate-limited, "
+            f"{st['retries']} retries, {st['gave_up']} gave up, {st['wait_s']:.1f}s queued for quota, "
+            f"concurrency {st['concurrency']:.1f}/{st['max_concurrency']}"
+            for name, st in scheduler_snapshot().items() if st["requests"] or st["cache_hits"]]
@@ -0,0 +1,478 @@
+"""Structured-output layer for the JSON answers of Tasks 1–3.
+
+One path for every prompt that expects a JSON object (schemas in prompts.py):
+
+    json_llm = with_json_mode(llm, EVAL_SCHEMA)              # provider JSON mode if supported
+    with record_call("task3.eval", model=model, table=table) as call:
+        resp = json_llm.invoke(messages)
+        call.done(resp)
+        data = structured_result(resp, EVAL_SCHEMA, llm, messages, call)
+
+1. Provider mode (LLM_JSON_MODE=auto|schema|object|off): strict `json_schema` structured output
+   for models that support it (gpt-4o, gpt-4.1, gpt-5, o1/o3/o4), `json_object` for older JSON-mode
+   models, nothing otherwise (or for clients without `bind`, e.g. the offline stubs).
+2. Client-side repair, no extra call: markdown fences, prose around the object, trailing commas,
+   Python literals / single quotes, smart quotes, a truncated tail (open strings and brackets are
+   closed), then per-schema coercion ("4" -> 4, "yes" -> true, "text" -> ["text"], key case /
+   spelling like "Relevance Rating"), extra keys dropped, defaults for optional fields.
+3. Re-ask only what is still invalid: ONE follow-up request (LLM_REASK=0 disables it) in the same
+   conversation asks for just the invalid top-level fields, or just the invalid entries of an
+   "x-key" array (e.g. two of five batched evaluations), and merges them in. Array entries that
+   stay invalid are dropped; a required field that stays invalid raises StructuredOutputError.
+
+The call of metrics.py is marked `repaired` (valid after step 2) or `reasked` (step 3, recorded
+as its own "<stage>.reask" call); both are calls saved that used to be lost to a parse failure.
+
+Standard library only.
+"""
+
+from typing import Any, Dict, List, Optional, Tuple
+import copy
+import json
+import os
+import re
+
+from .llm_cache import cached_response
+from .metrics import record_call
+from .scheduler import scheduler_for, message_tokens
+
+Error = Tuple[str, Optional[str], str]   # (top-level field, entry key of an "x-key" array or None, message)
+
+_SCHEMA_MODELS = ("gpt-4o", "gpt-4.1", "gpt-5", "o1", "o3", "o4")
+_NO_SCHEMA_MODELS = ("gpt-4o-2024-05-13", "o1-mini", "o1-preview")
+_OBJECT_MODELS = ("gpt-4-turbo", "gpt-4-1106", "gpt-4-0125", "gpt-3.5-turbo")
+_CLIENT_ONLY = ("default", "x-key", "minLength", "title")
+_WORD_RE = re.compile(r"[A-Za-z_]+")
+_NUM_RE = re.compile(r"^\s*(-?\d+(?:\.\d+)?)\s*(?:/\s*\d+)?\s*$")
+_TRUE = {"true", "yes", "y", "1"}
+_FALSE = {"false", "no", "n", "0"}
+
+
+class StructuredOutputError(ValueError):
+    """The answer still misses required fields after repair and re-ask."""
+
+
+# ---- provider mode --------------------------------------------------------------------------
+def json_mode(model: Optional[str]) -> str:
+    """'schema', 'object' or 'off' for a model name (LLM_JSON_MODE overrides 'auto')."""
+    mode = os.getenv("LLM_JSON_MODE", "auto").strip().lower()
+    if mode != "auto":
+        return mode if mode in ("schema", "object") else "off"
+    name = str(model or "").lower().rsplit("/", 1)[-1]
+    if name.startswith(_SCHEMA_MODELS) and not name.startswith(_NO_SCHEMA_MODELS):
+        return "schema"
+    if name.startswith(_OBJECT_MODELS):
+        return "object"
+    return "off"
+
+
+def strict_schema(schema: Dict[str, Any]) -> Dict[str, Any]:
+    """The provider form of a schema: client-only keywords removed, every object closed and fully required."""
+    out = {k: strict_schema(v) if isinstance(v, dict) and k == "items" else v
+           for k, v in schema.items() if k not in _CLIENT_ONLY and k != "properties"}
+    if schema.get("type") == "object":
+        props = schema.get("properties") or {}
+        out["properties"] = {k: strict_schema(v) for k, v in props.items()}
+        out["required"] = list(props)
+        out["additionalProperties"] = False
+    return out
+
+
+def with_json_mode(llm: Any, schema: Dict[str, Any]) -> Any:
+    """`llm` bound to the provider's JSON / structured-output mode for `schema` (see json_mode)."""
+    mode = json_mode(getattr(llm, "model_name", None) or getattr(llm, "model", None))
+    if mode == "off" or not hasattr(llm, "bind"):
+        return llm
+    if mode == "object":
+        return llm.bind(response_format={"type": "json_object"})
+    return llm.bind(response_format={"type": "json_schema", "json_schema": {
+        "name": schema.get("title", "answer"), "strict": True, "schema": strict_schema(schema)}})
+
+
+# ---- lenient JSON ---------------------------------------------------------------------------
+def _scan(text: str) -> Tuple[str, str]:
+    """
+    Normalize one JSON-ish object: single/smart quotes, Python literals and trailing commas
+    outside strings, an open string closed. Returns (text, closers still missing if truncated).
+    """
+    out: List[str] = []
+    stack: List[str] = []
+    quote: Optional[str] = None
+    esc = False
+    i, n = 0, len(text)
+    while i < n:
+        c = text[i]
+        if quote:
+            if esc:
+                esc = False
+            elif c == "\\":
+                esc = True
+            elif c == quote or (quote == "”" and c == "“"):
+                quote = None
+                c = '"'
+            elif c == '"':
+                c = '\\"'   # inside a single-quoted string
+            out.append(c)
+            i += 1
+            if quote is None and not stack:
+                break
+            continue
+        if c in "\"'“”":
+            quote = '"' if c == '"' else ("'" if c == "'" else "”")
+            out.append('"')
+        elif c in "{[":
+            stack.append("}" if c == "{" else "]")
+            out.append(c)
+        elif c in "}]":
+            while out and out[-1] in " \t\r\n":
+                out.pop()
+            if out and out[-1] == ",":
+                out.pop()
+            if stack:
+                stack.pop()
+            out.append(c)
+            if not stack:
+                break
+        elif c.isalpha():
+            word = _WORD_RE.match(text, i).group(0)
+            out.append({"True": "true", "False": "false", "None": "null"}.get(word, word))
+            i += len(word)
+            continue
+        else:
+            out.append(c)
+        i += 1
+    fixed = "".join(out)
+    if quote:
+        fixed += '"'
+    return fixed, "".join(reversed(stack))
+
+
+def _closed(fixed: str, closers: str) -> List[str]:
+    """Candidate completions of a truncated object: as is, without a dangling separator or key."""
+    if not closers:
+        return [fixed]
+    fixed = fixed.rstrip()
+    return [fixed + closers,
+            re.sub(r"[,:]\s*$", "", fixed) + closers,
+            re.sub(r'(?:,|(?<=[{\[]))\s*"(?:[^"\\]|\\.)*"\s*:?\s*$', "", fixed) + closers]
+
+
+def loads_lenient(text: str) -> Tuple[Any, bool]:
+    """(parsed value or None, repaired) of a model answer that should hold one JSON object."""
+    txt = (text or "").strip()
+    try:
+        return json.loads(txt), False
+    except ValueError:
+        pass
+    m = re.search(r"```(?:json|JSON)?\s*(.*?)(?:```|$)", txt, flags=re.S)
+    if m and m.group(1).strip():
+        txt = m.group(1).strip()
+    starts = [p for p in (txt.find("{"), txt.find("[")) if p >= 0]
+    if not starts:
+        return None, True
+    for candidate in _closed(*_scan(txt[min(starts):])):
+        try:
+            return json.loads(candidate), True
+        except ValueError:
+            pass
+    import ast   # last resort (Python repr with escapes); kept off the import path
+    try:
+        return ast.literal_eval(txt[min(starts):]), True
+    except (ValueError, SyntaxError, MemoryError, RecursionError):
+        return None, True
+
+
+# ---- schema validation / coercion -----------------------------------------------------------
+def _norm_key(k: Any) -> str:
+    return re.sub(r"[^a-z0-9]+", "_", str(k).lower()).strip("_")
+
+
+def _coerce(value: Any, schema: Dict[str, Any]) -> Tuple[Any, bool, Optional[str]]:
+    """(value, changed, error message or None) for one value against its schema."""
+    t = schema.get("type")
+    changed = False
+    if t == "object":
+        if not isinstance(value, dict):
+            return value, False, "expected an object"
+        clean, changed, errors = validate(value, schema)
+        return clean, changed, "; ".join(f"{f}: {msg}" for f, _, msg in errors) or None
+    if t == "array":
+        if not isinstance(value, list):
+            if isinstance(value, (str, dict)):
+                value, changed = [value], True
+            else:
+                return value, False, "expected an array"
+        items, out = schema.get("items") or {}, []
+        for v in value:
+            v2, ch, err = _coerce(v, items)
+            if err:
+                return value, changed, f"invalid entry ({err})"
+            out.append(v2)
+            changed |= ch
+        return out, changed, None
+    if t == "string":
+        if isinstance(value, (int, float)):
+            value, changed = str(value).lower() if isinstance(value, bool) else str(value), True
+        if not isinstance(value, str):
+            return value, changed, "expected a string"
+        if len(value.strip()) < schema.get("minLength", 0):
+            return value, changed, "empty"
+    elif t in ("integer", "number"):
+        if isinstance(value, str):
+            m = _NUM_RE.match(value)
+            if not m:
+                return value, False, f"expected {'an integer' if t == 'integer' else 'a number'}"
+            value, changed = float(m.group(1)), True
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            return value, changed, f"expected {'an integer' if t == 'integer' else 'a number'}"
+        if t == "integer":
+            if not float(value).is_integer():
+                return value, changed, "expected an integer"
+            if not isinstance(value, int):
+                value, changed = int(value), True
+    elif t == "boolean":
+        if isinstance(value, str) and value.strip().lower() in _TRUE | _FALSE:
+            value, changed = value.strip().lower() in _TRUE, True
+        elif isinstance(value, int) and not isinstance(value, bool) and value in (0, 1):
+            value, changed = bool(value), True
+        if not isinstance(value, bool):
+            return value, changed, "expected true/false"
+    if "enum" in schema and value not in schema["enum"]:
+        return value, changed, f"expected one of {', '.join(map(str, schema['enum']))}"
+    return value, changed, None
+
+
+def _key_of(item: Any, key: str) -> Optional[str]:
+    """Value of the "x-key" field of an array entry (key spelling normalized), if it is a string."""
+    if not isinstance(item, dict):
+        return None
+    want = _norm_key(key)
+    for k, v in item.items():
+        if _norm_key(k) == want and isinstance(v, str) and v.strip():
+            return v
+    return None
+
+
+def validate(data: Any, schema: Dict[str, Any],
+             defaults: Optional[Dict[str, Any]] = None) -> Tuple[Dict[str, Any], bool, List[Error]]:
+    """
+    Coerce `data` to an object schema. Returns (clean, changed, errors): unknown keys dropped,
+    keys matched by normalized spelling, defaults filled; entries of an "x-key" array that are
+    invalid are left out of `clean` and reported with their key (entries without one are dropped).
+    """
+    props = schema.get("properties") or {}
+    fallback = {k: p["default"] for k, p in props.items() if "default" in p}
+    fallback.update(defaults or {})
+    changed = False
+    if isinstance(data, list):
+        arrays = [k for k, p in props.items() if p.get("type") == "array"]
+        data, changed = ({arrays[0]: data}, True) if len(arrays) == 1 else ({}, True)
+    if not isinstance(data, dict):
+        data, changed = {}, True
+
+    by_norm = {_norm_key(k): k for k in props}
+    got: Dict[str, Any] = {}
+    for k, v in data.items():
+        name = k if k in props else by_norm.get(_norm_key(k))
+        if name is None or name in got:
+            changed = True
+            continue
+        changed |= name != k
+        got[name] = v
+
+    clean: Dict[str, Any] = {}
+    errors: List[Error] = []
+    for name, ps in props.items():
+        if name not in got:
+            if name in fallback:
+                clean[name], changed = copy.deepcopy(fallback[name]), True
+            else:
+                errors.append((name, None, "missing"))
+            continue
+        if ps.get("type") == "array" and ps.get("x-key") and isinstance(got[name], list):
+            key, items = ps["x-key"], []
+            for item in got[name]:
+                v, ch, err = _coerce(item, ps.get("items") or {})
+                if err is None:
+                    items.append(v)
+                    changed |= ch
+                elif _key_of(item, key) is not None:
+                    errors.append((name, _key_of(item, key), err))
+                else:
+                    changed = True
+            clean[name] = items
+            continue
+        v, ch, err = _coerce(got[name], ps)
+        if err is None:
+            clean[name] = v
+            changed |= ch
+        elif name in fallback:
+            clean[name], changed = copy.deepcopy(fallback[name]), True
+        else:
+            errors.append((name, None, err))
+    return clean, changed, errors
+
+
+# ---- re-ask ---------------------------------------------------------------------------------
+def _shape(schema: Dict[str, Any]) -> Any:
+    """Compact template of a schema for the re-ask prompt."""
+    t = schema.get("type")
+    if t == "object":
+        return {k: _shape(v) for k, v in (schema.get("properties") or {}).items()}
+    if t == "array":
+        return [_shape(schema.get("items") or {})]
+    if "enum" in schema:
+        return "<one of " + "|".join(map(str, schema["enum"])) + ">"
+    return {"string": "<string>", "integer": "<integer>", "number": "<number>",
+            "boolean": "<true|false>"}.get(t, "<value>")
+
+
+def _reask_request(messages: List[Any], raw: str, errors: List[Error],
+                   schema: Dict[str, Any]) -> Tuple[List[Any], Dict[str, Any], Dict[str, List[str]]]:
+    """(messages, sub-schema, {array field: entry keys asked}) asking only for the invalid parts."""
+    whole = {f for f, key, _ in errors if key is None}
+    entries: Dict[str, List[str]] = {}
+    for f, key, _ in errors:
+        if key is not None and f not in whole:
+            entries.setdefault(f, []).append(key)
+    fields = [f for f in schema["properties"] if f in whole or f in entries]
+    sub = {"title": f"{schema.get('title', 'answer')}_fix", "type": "object",
+           "properties": {f: schema["properties"][f] for f in fields}}
+    lines = [f"- {f}" + (f" ({schema['properties'][f]['x-key']} = {key})" if key else "") + f": {msg}"
+             for f, key, msg in errors if key is None or f not in whole]
+    notes = [f'- "{f}": return ONLY the entries for {schema["properties"][f]["x-key"]} = '
+             + ", ".join(json.dumps(k, ensure_ascii=False) for k in keys) for f, keys in entries.items()]
+    text = ("Your previous answer did not match the required JSON shape:\n" + "\n".join(lines)
+            + "\n\nReply with ONLY a JSON object that holds just these fields, corrected "
+              "(no other keys, no markdown):\n" + json.dumps(_shape(sub), ensure_ascii=False)
+            + ("\n" + "\n".join(notes) if notes else ""))
+    return (list(messages) + [{"role": "assistant", "content": raw[:8000]}, {"role": "user", "content": text}],
+            sub, entries)
+
+
+def _merge(clean: Dict[str, Any], errors: List[Error], patch: Any, sub: Dict[str, Any],
+           entries: Dict[str, List[str]]) -> List[Error]:
+    """Apply a re-ask answer to `clean`; returns the errors that remain."""
+    fixed, _, _ = validate(patch, dict(sub, properties={k: {kk: vv for kk, vv in v.items() if kk != "default"}
+                                                        for k, v in sub["properties"].items()}))
+    left: List[Error] = []
+    for f, key, msg in errors:
+        if f in fixed and f not in entries:
+            clean[f] = fixed[f]
+        else:
+            left.append((f, key, msg))
+    for f, keys in entries.items():
+        k = sub["properties"][f]["x-key"]
+        wanted = {_norm_key(x) for x in keys}
+        for entry in fixed.get(f) or []:
+            kk = _norm_key(_key_of(entry, k) or "")
+            if kk in wanted:
+                clean.setdefault(f, []).append(entry)
+                wanted.discard(kk)
+        left = [e for e in left if not (e[0] == f and e[1] is not None and _norm_key(e[1]) not in wanted)]
+    return left
+
+
+def _finish(clean: Dict[str, Any], errors: List[Error]) -> Dict[str, Any]:
+    """Array entries that stayed invalid are left out; raise if a required field did."""
+    missing = [(f, msg) for f, key, msg in errors if key is None]
+    if missing:
+        raise StructuredOutputError("invalid JSON answer: " + "; ".join(f"{f}: {m}" for f, m in missing))
+    for f, key, _ in errors:
+        print(f"[structured] no valid {f} entry for {key!r}")
+    return clean
+
+
+def _text(resp: Any) -> str:
+    content = getattr(resp, "content", resp)
+    return content if isinstance(content, str) else str(content)
+
+
+def _reask_enabled() -> bool:
+    return os.getenv("LLM_REASK", "1").strip().lower() not in ("0", "off", "false", "no")
+
+
+def _begin(resp: Any, schema: Dict[str, Any], llm: Any, messages: Optional[List[Any]], call: Any,
+           defaults: Optional[Dict[str, Any]], expect: Optional[Dict[str, List[str]]]):
+    """Parse + repair; returns (clean, errors, re-ask request or None)."""
+    raw = _text(resp)
+    data, repaired = loads_lenient(raw)
+    clean, changed, errors = validate(data, schema, defaults)
+    for f, keys in (expect or {}).items():
+        k = schema["properties"][f]["x-key"]
+        have = {_norm_key(_key_of(e, k) or "") for e in clean.get(f) or []}
+        have |= {_norm_key(key) for ff, key, _ in errors if ff == f and key is not None}
+        errors += [(f, key, "missing") for key in keys if _norm_key(key) not in have]
+    if not errors:
+        if call is not None:
+            call.repaired = repaired or changed
+        return clean, errors, None
+    if llm is None or messages is None or not _reask_enabled():
+        return clean, errors, None
+    return clean, errors, _reask_request(messages, raw, errors, schema)
+
+
+def _apply_reask(call: Any, clean: Dict[str, Any], errors: List[Error], patch: Any,
+                 sub: Dict[str, Any], entries: Dict[str, List[str]]) -> List[Error]:
+    """
+    Merge the re-ask answer; `call.reasked` only if it parsed, fixed at least one error and left
+    no required field invalid (the answer is usable because of the re-ask).
+    """
+    left = _merge(clean, errors, patch, sub, entries) if patch is not None else errors
+    if call is not None:
+        call.reasked = len(left) < len(errors) and all(key is not None for _, key, _ in left)
+    return left
+
+
+def _reask_call(call: Any):
+    return record_call(f"{getattr(call, 'stage', 'llm')}.reask", model=getattr(call, "model", None),
+                       table=getattr(call, "table", None))
+
+
+def structured_result(resp: Any, schema: Dict[str, Any], llm: Any = None, messages: Optional[List[Any]] = None,
+                      call: Any = None, defaults: Optional[Dict[str, Any]] = None,
+                      expect: Optional[Dict[str, List[str]]] = None) -> Dict[str, Any]:
+    """
+    The answer `resp` as a valid object of `schema` (see module docstring). Without `llm` /
+    `messages` nothing is re-asked. `expect` ({array field: keys}) also re-asks the entries
+    missing from an "x-key" array. `call` (metrics.py) is marked repaired / reasked.
+    """
+    clean, errors, ask = _begin(resp, schema, llm, messages, call, defaults, expect)
+    if ask is not None:
+        msgs, sub, entries = ask
+        json_llm = with_json_mode(llm, sub)
+        patch = None
+        try:
+            with _reask_call(call) as rcall:
+                r = scheduler_for("llm", rcall.model).run(lambda: json_llm.invoke(msgs),
+                                                          tokens=message_tokens(msgs), call=rcall,
+                                                          cached=lambda: cached_response(json_llm, msgs))
+                rcall.done(r)
+                patch, _ = loads_lenient(_text(r))
+        except Exception as e:
+            print(f"[structured] re-ask failed: {e}")
+        errors = _apply_reask(call, clean, errors, patch, sub, entries)
+    return _finish(clean, errors)
+
+
+async def astructured_result(resp: Any, schema: Dict[str, Any], llm: Any = None,
+                             messages: Optional[List[Any]] = None, call: Any = None,
+                             defaults: Optional[Dict[str, Any]] = None,
+                             expect: Optional[Dict[str, List[str]]] = None) -> Dict[str, Any]:
+    """Async `structured_result` (the re-ask uses `ainvoke`)."""
+    clean, errors, ask = _begin(resp, schema, llm, messages, call, defaults, expect)
+    if ask is not None:
+        msgs, sub, entries = ask
+        json_llm = with_json_mode(llm, sub)
+        patch = None
+        try:
+            with _reask_call(call) as rcall:
+                r = await scheduler_for("llm", rcall.model).arun(lambda: json_llm.ainvoke(msgs),
+                                                                 tokens=message_tokens(msgs), call=rcall,
+                                                                 cached=lambda: cached_response(json_llm, msgs))
+                rcall.done(r)
+                patch, _ = loads_lenient(_text(r))
+        except Exception as e:
+            print(f"[structured] re-ask failed: {e}")
+        errors = _apply_reask(call, clean, errors, patch, sub, entries)
+    return _finish(clean, errors)
@@ -0,0 +1,244 @@
+"""Indexed schema-summary store (SQLite) shared by Tasks 1–3.
+
+`schema_summaries.json` is one JSON array; every reader had to `json.load` all of it and then
+scan it per lookup. The store keeps one row per table (record JSON, catalog position, name and
+normalized name, both indexed), so:
+- `store.get(name)` / `name in store` / `store[name]` load ONE record through the name index
+  (exact name first, then the normalized form `Sakila Actor` -> `sakila_actor`),
+- `iter(store)` streams records in catalog order in pages, `store.head(n)` reads the first n,
+- `import_json` / `export_json` convert from / to the existing JSON format.
+
+Iteration yields records like the old list, lookups behave like a {table: record} dict, so the
+store can be passed wherever the code took `summaries` or a `by_name` dict.
+
+`open_summary_store(path)` accepts either a store file (.sqlite / .db) or the JSON file; for
+JSON a sidecar `<name>.sqlite` is (re)imported only when the JSON size/mtime changed. Task 1
+writes both files, so readers never parse the JSON. Where the sidecar cannot be written
+(read-only folder or file), the JSON is indexed into an in-memory store for this process.
+
+Standard library only, so the CLIs can import it without numpy / pandas.
+
+Usage:
+  python -m src.retrieval_graph.summary_store import outputs/task1/schema_summaries.json
+  python -m src.retrieval_graph.summary_store export outputs/task1/schema_summaries.sqlite out.json
+"""
+
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Union
+import argparse
+import json
+import os
+import re
+import sqlite3
+import threading
+
+STORE_SUFFIXES = (".sqlite", ".sqlite3", ".db")
+
+
+def norm_name(x: str) -> str:
+    """Normalized table name, same rule as task3's CSV matching."""
+    return re.sub(r"[^a-z0-9]+", "_", str(x).lower()).strip("_")
+
+
+def record_name(rec: Dict[str, Any]) -> str:
+    return str(rec.get("table") or rec.get("name") or "").strip()
+
+
+class SummaryStore:
+    """Schema summaries in one SQLite file, indexed by table name (see module docstring)."""
+
+    def __init__(self, path: str, page_size: int = 1000):
+        self.path = path
+        self.page_size = page_size
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS summaries ("
+            " pos INTEGER PRIMARY KEY, name TEXT NOT NULL, norm TEXT NOT NULL, record TEXT NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS summaries_name ON summaries(name)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS summaries_norm ON summaries(norm)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM summaries").fetchone()[0]
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        """Records in catalog order, `page_size` rows per query (memory bounded by one page)."""
+        last = -1
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT pos, record FROM summaries WHERE pos > ? ORDER BY pos LIMIT ?",
+                    (last, self.page_size)).fetchall()
+            if not rows:
+                return
+            for pos, rec in rows:
+                yield json.loads(rec)
+            last = rows[-1][0]
+
+    def __contains__(self, name: object) -> bool:
+        return isinstance(name, str) and self.get(name) is not None
+
+    def __getitem__(self, name: str) -> Dict[str, Any]:
+        rec = self.get(name)
+        if rec is None:
+            raise KeyError(name)
+        return rec
+
+    def get(self, name: str, default: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        """One record by table name (exact, else normalized); `default` if unknown."""
+        name = str(name or "").strip()
+        if not name:
+            return default
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT record FROM summaries WHERE name = ? ORDER BY pos LIMIT 1", (name,)).fetchone()
+            if row is None:
+                row = self._conn.execute(
+                    "SELECT record FROM summaries WHERE norm = ? ORDER BY pos LIMIT 1",
+                    (norm_name(name),)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def head(self, n: int) -> List[Dict[str, Any]]:
+        """The first `n` records in catalog order."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT record FROM summaries ORDER BY pos LIMIT ?", (max(0, int(n)),)).fetchall()
+        return [json.loads(r[0]) for r in rows]
+
+    def names(self) -> List[str]:
+        with self._lock:
+            return [r[0] for r in self._conn.execute("SELECT name FROM summaries ORDER BY pos")]
+
+    def meta(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def replace_all(self, records: Iterable[Dict[str, Any]], source: Optional[str] = None) -> int:
+        """
+        Replace the whole catalog in one transaction (readers see the old or the new one).
+        `source` records the size/mtime of the JSON the records came from. Returns the row count.
+        """
+        n = 0
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute("DELETE FROM summaries")
+                for rec in records:
+                    if not isinstance(rec, dict):
+                        continue
+                    name = record_name(rec)
+                    self._conn.execute(
+                        "INSERT INTO summaries (pos, name, norm, record) VALUES (?, ?, ?, ?)",
+                        (n, name, norm_name(name), json.dumps(rec, ensure_ascii=False)))
+                    n += 1
+                self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('source', ?)",
+                                   (_source_signature(source) if source else "",))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return n
+
+    def import_json(self, json_path: str) -> int:
+        """Load a schema_summaries.json array into the store (replacing its content)."""
+        with open(json_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if not isinstance(data, list):
+            raise ValueError(f"Schema summaries JSON must be a list: {json_path}")
+        return self.replace_all(data, source=json_path)
+
+    def export_json(self, json_path: str) -> int:
+        """Write the store back as the JSON array format, streaming one record at a time."""
+        os.makedirs(os.path.dirname(json_path) or ".", exist_ok=True)
+        n = 0
+        tmp = json_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write("[")
+            for rec in self:
+                f.write(",\n" if n else "\n")
+                f.write(json.dumps(rec, ensure_ascii=False, indent=2))
+                n += 1
+            f.write("\n]" if n else "]")
+        os.replace(tmp, json_path)
+        return n
+
+    def is_current(self, json_path: str) -> bool:
+        """True if the store was imported from `json_path` as it is now (size + mtime)."""
+        return self.meta("source") == _source_signature(json_path)
+
+
+def _source_signature(json_path: str) -> str:
+    st = os.stat(json_path)
+    return f"{os.path.abspath(json_path)}\0{st.st_size}\0{st.st_mtime_ns}"
+
+
+def sidecar_path(json_path: str) -> str:
+    """`schema_summaries.json` -> `schema_summaries.sqlite` (same folder)."""
+    return os.path.splitext(json_path)[0] + ".sqlite"
+
+
+def open_summary_store(path: str) -> SummaryStore:
+    """
+    Store for a summaries path: a store file is opened as is; a JSON file goes through its
+    sidecar store, re-imported only when the JSON changed since the last import (in memory
+    when the sidecar cannot be created or updated).
+    """
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Schema summaries not found: {path}")
+    if path.lower().endswith(STORE_SUFFIXES):
+        return SummaryStore(path)
+    store = None
+    try:
+        store = SummaryStore(sidecar_path(path))
+        if not store.is_current(path):
+            store.import_json(path)
+        return store
+    except (OSError, sqlite3.Error) as e:
+        if store is not None:
+            store.close()
+        print(f"[summary_store] cannot write {sidecar_path(path)} ({e}); indexing {path} in memory")
+    store = SummaryStore(":memory:")
+    store.import_json(path)
+    return store
+
+
+def summary_lookup(summaries: Union[SummaryStore, Dict[str, Dict[str, Any]], Iterable[Dict[str, Any]]]
+                   ) -> Callable[[str], Optional[Dict[str, Any]]]:
+    """name -> record (or None) over a store, a {table: record} dict or a list of records."""
+    if isinstance(summaries, (SummaryStore, dict)):
+        return summaries.get
+    by_name: Dict[str, Dict[str, Any]] = {}
+    for s in summaries:
+        by_name.setdefault(record_name(s), s)
+    return by_name.get
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import/export schema summaries (JSON <-> SQLite store)")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    imp = sub.add_parser("import", help="JSON -> store (default: sidecar <name>.sqlite)")
+    imp.add_argument("json_path")
+    imp.add_argument("store", nargs="?", default=None)
+    exp = sub.add_parser("export", help="store -> JSON")
+    exp.add_argument("store")
+    exp.add_argument("json_path")
+    args = parser.parse_args()
+
+    if args.cmd == "import":
+        store = SummaryStore(args.store or sidecar_path(args.json_path))
+        print(f"[summaries] {store.import_json(args.json_path)} tables -> {store.path}")
+    else:
+        print(f"[summaries] {SummaryStore(args.store).export_json(args.json_path)} tables -> {args.json_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,25 +5,91 @@ This module contains utility functions for:
 to use only OpenAI API with configuration from `.env`.
 """
 
+from langchain_core.caches import BaseCache, RETURN_VAL_TYPE
 from langchain_core.language_models import BaseChatModel
-from langchain_core.messages import AnyMessage
+from langchain_core.load import dumps, loads
+from langchain_core.messages import AnyMessage, convert_to_messages
 from langchain_openai import ChatOpenAI
+import json
 import os
+import threading
+from typing import Any, Dict, Optional, Tuple
+import httpx
 from dotenv import load_dotenv
+from .llm_cache import SQLiteResponseCache, get_response_cache, deterministic_mode
 
 # Ensure .env is loaded (for OPENAI_API_KEY, OPENAI_MODEL)
 load_dotenv()
 
-def load_chat_model(model_name: str = None) -> BaseChatModel:
-    """Load an OpenAI chat model.
+# One client per (model, settings), shared by every caller in the process
+_MODEL_CACHE: Dict[Tuple, BaseChatModel] = {}
+_MODEL_LOCK = threading.Lock()
+
+class LangChainResponseCache(BaseCache):
+    """LangChain cache hook over the SQLite response store (generations serialized as JSON)."""
+
+    def __init__(self, store: SQLiteResponseCache):
+        self.store = store
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        raw = self.store.get(prompt, llm_string)
+        if raw is None:
+            return None
+        try:
+            return [loads(g) for g in json.loads(raw)]
+        except Exception:
+            return None   # unreadable entry: behave like a miss, it is overwritten on update
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        self.store.put(prompt, llm_string, json.dumps([dumps(g) for g in return_val]))
+
+    def clear(self, **kwargs: Any) -> None:
+        self.store.clear()
+
+    def cached_message(self, llm: BaseChatModel, messages: Any, **kwargs: Any) -> Optional[AnyMessage]:
+        """
+        The message `llm.invoke(messages, **kwargs)` would return from this cache, or None.
+        Same key as BaseChatModel's own lookup (llm_string of the call settings + dumped messages);
+        a miss is not counted, the request that follows looks up again.
+        """
+        prompt = dumps(convert_to_messages(messages))
+        raw = self.store.get(prompt, llm._get_llm_string(stop=None, **kwargs), count_miss=False)
+        if raw is None:
+            return None
+        try:
+            return loads(json.loads(raw)[0]).message
+        except Exception:
+            return None
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except ValueError:
+        return default
+
+def load_chat_model(model_name: str = None,
+                    temperature: float = 0.7,
+                    pool_size: Optional[int] = None,
+                    timeout: Optional[float] = None) -> BaseChatModel:
+    """Load an OpenAI chat model (cached: repeated calls return the same client).
 
     Args:
         model_name (str, optional): The model name (e.g. 'gpt-4o-mini').
                                     If None, defaults to OPENAI_MODEL in .env.
+        temperature (float): 0-2 decide "creativity" (pinned to 0 when LLM_DETERMINISTIC=1).
+        pool_size (int, optional): Max keep-alive HTTP connections
+                                   (default: OPENAI_POOL_SIZE or 20).
+        timeout (float, optional): Request timeout in seconds
+                                   (default: OPENAI_TIMEOUT or 60; connect: OPENAI_CONNECT_TIMEOUT or 10).
 
     Requires:
         - OPENAI_API_KEY in environment or .env file
         - OPENAI_MODEL in environment or .env file (optional, default=gpt-4o-mini)
+        - OPENAI_BASE_URL (optional, e.g. a local stub server)
+        - LLM_CACHE* (optional, persistent response cache, see llm_cache.py; used at
+          temperature 0 unless LLM_CACHE names a file)
+        - LLM_RPM / LLM_TPM / LLM_CONCURRENCY / LLM_RETRIES (optional, see scheduler.py; SDK
+          retries are off, the callers retry through the shared scheduler)
     """
     model_name = model_name or os.getenv("OPENAI_MODEL", "gpt-4o-mini")
     api_key = os.getenv("OPENAI_API_KEY")
@@ -31,8 +97,36 @@ def load_chat_model(model_name: str = None) -> BaseChatModel:
     if not api_key:
         raise ValueError("Missing OPENAI_API_KEY in environment variables or .env file")
 
-    return ChatOpenAI(
-        model=model_name,
-        api_key=api_key,
-        temperature=0.7, #0-2 decide "creativity"
-    )
+    pool_size = int(pool_size or _env_float("OPENAI_POOL_SIZE", 20))
+    timeout = float(timeout or _env_float("OPENAI_TIMEOUT", 60.0))
+    connect_timeout = min(timeout, _env_float("OPENAI_CONNECT_TIMEOUT", 10.0))
+    base_url = os.getenv("OPENAI_BASE_URL") or None
+    if deterministic_mode():
+        temperature = 0.0
+    cache = get_response_cache(temperature)   # temperature 0 or an explicit LLM_CACHE path only
+
+    key = (model_name, api_key, base_url, float(temperature), pool_size, timeout, connect_timeout,
+           id(cache))
+    with _MODEL_LOCK:
+        llm = _MODEL_CACHE.get(key)
+        if llm is not None:
+            return llm
+
+        limits = httpx.Limits(max_connections=pool_size,
+                              max_keepalive_connections=pool_size,
+                              keepalive_expiry=60.0)
+        http_timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        llm = ChatOpenAI(
+            model=model_name,
+            api_key=api_key,
+            base_url=base_url,
+            temperature=temperature, #0-2 decide "creativity"
+            timeout=timeout,
+            max_retries=0,       # retries + rate limits: scheduler.py
+            stream_usage=True,   # token usage on the last chunk of streamed calls (metrics.py)
+            cache=LangChainResponseCache(cache) if cache is not None else False,
+            http_client=httpx.Client(limits=limits, timeout=http_timeout),
+            http_async_client=httpx.AsyncClient(limits=limits, timeout=http_timeout),
+        )
+        _MODEL_CACHE[key] = llm
+        return llm
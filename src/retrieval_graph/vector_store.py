@@ -0,0 +1,170 @@
+"""Compact, memory-mapped table-embedding matrix.
+
+The EmbeddingStore (.npz, keyed by text hash) stays the source of truth; this module keeps a
+ready-to-rank copy of the matrix aligned with the catalog order:
+
+    <store_dir>/<model>[.<dtype>][.d<dim>].vec        raw rows, C order (float32 / float16 / int8)
+    <store_dir>/<model>[.<dtype>][.d<dim>].scale      int8 only: float32 scale per row
+    <store_dir>/<model>[.<dtype>][.d<dim>].vec.json   {fingerprint, dtype, rows, dim}, written last
+
+The files are opened with `np.memmap(mode="r")`: a warm start reads no vectors up front, ranking
+runs on the mapped pages, and several worker processes mapping the same file share one copy
+in the OS page cache.
+
+Options:
+- `dtype`: float32 (exact), float16 (half the bytes) or int8 (a quarter; symmetric per-row scale),
+- `dim`:   keep only the first `dim` components (rows re-normalized; text-embedding-3 vectors
+           are trained to be truncated this way), queries are truncated the same way.
+float16 / int8 matrices are wrapped in QuantizedMatrix, which scores in row blocks so only one
+block is ever up-cast to float32. `benchmarks/bench_vector_store.py` reports recall loss
+against memory saved.
+"""
+
+from typing import Optional, Tuple, Union
+import json
+import os
+import numpy as np
+
+from .embedding import _unit_matrix
+
+DTYPES = {"float32": np.float32, "float16": np.float16, "int8": np.int8}
+_TAGS = {"float32": "f32", "float16": "f16", "int8": "i8"}
+
+
+def vector_tag(dtype: str = "float32", dim: Optional[int] = None) -> str:
+    """File-name suffix of a layout ('' for the default float32 / full dimension)."""
+    if dtype not in DTYPES:
+        raise ValueError(f"unknown vector dtype: {dtype} (expected one of {', '.join(DTYPES)})")
+    if dtype == "float32" and not dim:
+        return ""
+    return f".{_TAGS[dtype]}" + (f".d{int(dim)}" if dim else "")
+
+
+def truncate(mat: np.ndarray, dim: Optional[int]) -> np.ndarray:
+    """First `dim` components of every row, re-normalized (a no-op without `dim`)."""
+    mat = np.asarray(mat, dtype=np.float32)
+    if mat.ndim == 1:
+        mat = mat.reshape(1, -1)
+    if dim and dim < mat.shape[1]:
+        return _unit_matrix(mat[:, :dim])
+    return mat
+
+
+def quantize(mat: np.ndarray, dtype: str = "float32",
+             dim: Optional[int] = None) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """(rows in `dtype`, per-row float32 scales for int8 else None) of a unit-normalized matrix."""
+    mat = truncate(mat, dim)
+    if dtype == "int8":
+        scales = np.abs(mat).max(axis=1) / 127.0
+        scales[scales == 0.0] = 1.0
+        codes = np.clip(np.rint(mat / scales[:, None]), -127, 127).astype(np.int8)
+        return codes, scales.astype(np.float32)
+    return mat.astype(DTYPES[dtype]), None
+
+
+class QuantizedMatrix:
+    """
+    Read-only float16 / int8 table matrix that behaves like the float32 one where ranking needs it:
+    `m @ q`, `m.scores(Q)`, `m[rows]` (rows de-quantized to float32), `m.shape`.
+    Scoring walks the rows in blocks, so memory stays bounded however large the (mapped) matrix is.
+    """
+
+    def __init__(self, data: np.ndarray, scales: Optional[np.ndarray] = None, block: int = 65536):
+        self.data = data
+        self.scales = scales
+        self.block = block
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return self.data.shape
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.data.nbytes + (self.scales.nbytes if self.scales is not None else 0))
+
+    def __len__(self) -> int:
+        return int(self.data.shape[0])
+
+    def __getitem__(self, idx) -> np.ndarray:
+        rows = np.asarray(self.data[idx], dtype=np.float32)
+        if self.scales is not None:
+            s = self.scales[idx]
+            rows *= s[..., None] if np.ndim(s) else s
+        return rows
+
+    def scores(self, qmat: np.ndarray) -> np.ndarray:
+        """(queries x tables) dot products for unit query rows."""
+        q = np.asarray(qmat, dtype=np.float32)
+        out = np.empty((q.shape[0], self.data.shape[0]), dtype=np.float32)
+        for lo in range(0, self.data.shape[0], self.block):
+            out[:, lo:lo + self.block] = q @ self[lo:lo + self.block].T
+        return out
+
+    def __matmul__(self, q: np.ndarray) -> np.ndarray:
+        return self.scores(np.asarray(q, dtype=np.float32).reshape(1, -1))[0]
+
+
+Matrix = Union[np.ndarray, QuantizedMatrix]
+
+
+def as_matrix(data: np.ndarray, scales: Optional[np.ndarray] = None) -> Matrix:
+    """float32 rows are used as is (BLAS reads the mapped pages directly), others are wrapped."""
+    if data.dtype == np.float32 and scales is None:
+        return data
+    return QuantizedMatrix(data, scales)
+
+
+class VectorFile:
+    """One on-disk layout (model, dtype, dim) of the table matrix, see module docstring."""
+
+    def __init__(self, base: str, dtype: str = "float32", dim: Optional[int] = None):
+        self.dtype = dtype
+        self.dim = int(dim) if dim else None
+        prefix = base + vector_tag(dtype, dim)
+        self.vec_path = prefix + ".vec"
+        self.scale_path = prefix + ".scale"
+        self.meta_path = prefix + ".vec.json"
+
+    def open(self, fingerprint: Optional[str] = None) -> Optional[Matrix]:
+        """Map the matrix read-only; None if missing, stale (fingerprint) or inconsistent."""
+        try:
+            with open(self.meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if fingerprint is not None and meta.get("fingerprint") != fingerprint:
+            return None
+        if meta.get("dtype") != self.dtype:
+            return None
+        rows, dim = int(meta["rows"]), int(meta["dim"])
+        itemsize = np.dtype(DTYPES[self.dtype]).itemsize
+        try:
+            if rows == 0 or os.path.getsize(self.vec_path) != rows * dim * itemsize:
+                return None
+            data = np.memmap(self.vec_path, dtype=DTYPES[self.dtype], mode="r", shape=(rows, dim))
+            scales = None
+            if self.dtype == "int8":
+                scales = np.memmap(self.scale_path, dtype=np.float32, mode="r", shape=(rows,))
+        except (OSError, ValueError) as e:
+            print(f"[vectors] ignore unreadable {self.vec_path}: {e}")
+            return None
+        return as_matrix(data, scales)
+
+    def write(self, mat: np.ndarray, fingerprint: str) -> None:
+        """Quantize and write the matrix; the meta file goes last, so readers never see a partial one."""
+        data, scales = quantize(mat, self.dtype, self.dim)
+        os.makedirs(os.path.dirname(self.vec_path) or ".", exist_ok=True)
+        if os.path.exists(self.meta_path):
+            os.remove(self.meta_path)   # invalid until the new meta is in place
+        for path, arr in ((self.vec_path, data), (self.scale_path, scales)):
+            if arr is None:
+                continue
+            tmp = path + ".tmp"
+            with open(tmp, "wb") as f:
+                np.ascontiguousarray(arr).tofile(f)
+            os.replace(tmp, path)
+        tmp = self.meta_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"fingerprint": fingerprint, "dtype": self.dtype,
+                       "rows": int(data.shape[0]), "dim": int(data.shape[1])}, f)
+        os.replace(tmp, self.meta_path)
@@ -13,9 +13,17 @@ Simplified output for Task 1.
 
 """
 
-import os, re, glob, json
+import os, re, glob, json, argparse, hashlib
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import pandas as pd
+from src.retrieval_graph.csv_sample import detect_encoding, read_csv_head
+from src.retrieval_graph.llm_cache import configure as configure_llm_cache, cached_response
+from src.retrieval_graph.metrics import record_call, model_name, configure_run, finish_run
+from src.retrieval_graph.summary_store import SummaryStore, sidecar_path
+from src.retrieval_graph.scheduler import scheduler_for, message_tokens
+from src.retrieval_graph.structured_output import with_json_mode, structured_result
+from src.retrieval_graph.prompts import SCHEMA_SUMMARY_SCHEMA
 
 
 def get_chat_model(name: str):
@@ -59,6 +67,11 @@ CONFIG = {
     "use_llm": True,
     "llm_name": "gpt-4o-mini",
     "lower_table": True,                         # lower case
+    "workers": 1,                                # tables summarized concurrently (1 = sequential)
+    "incremental": False,                        # reuse summaries of unchanged CSVs
+    "fingerprints": "schema_fingerprints.json",  # stored next to the output JSON
+    "profile": True,                             # stream each CSV once for column stats shown to the LLM
+    "profiles": "column_profiles.json",          # cached stats, stored next to the output JSON
 }
 
 
@@ -75,13 +88,49 @@ def discover_csvs(csv_dir: str):
         paths += glob.glob(os.path.join(csv_dir, "**", pat), recursive=True)
     return sorted(set(paths))
 
-def read_csv_any(p: str) -> pd.DataFrame:
-    for enc in ("utf-8", "utf-8-sig", "latin1"):
-        try:
-            return pd.read_csv(p, encoding=enc)
-        except Exception:
-            pass
-    return pd.read_csv(p)  # 最后一次按默认再试
+def read_csv_any(p: str, nrows: int = None) -> pd.DataFrame:
+    """
+    Read a CSV with the encoding detected once from a small byte prefix.
+    With `nrows`, only the header + first `nrows` rows are parsed (bounded memory).
+    """
+    if nrows is not None:
+        return read_csv_head(p, nrows)
+    return pd.read_csv(p, encoding=detect_encoding(p))
+
+
+def table_fingerprint(p: str, salt: str = "", block: int = 65536, full: bool = False) -> str:
+    """
+    Cheap fingerprint of a CSV: file size + modification time + first block (header and the
+    sampled rows the LLM sees) + last block, so an in-place edit in the middle is caught by the
+    mtime. `full=True` hashes the whole content instead (no mtime: a copied or touched file
+    with the same bytes is unchanged). `salt` ties it to the prompt/model that produced the summary.
+    """
+    st = os.stat(p)
+    h = hashlib.sha256(f"{salt}\0{st.st_size}\0{'' if full else st.st_mtime_ns}\0".encode("utf-8"))
+    with open(p, "rb") as f:
+        if full:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+            return h.hexdigest()
+        h.update(f.read(block))
+        if st.st_size > 2 * block:
+            f.seek(-block, os.SEEK_END)
+            h.update(f.read())
+    return h.hexdigest()
+
+def load_previous(out_path: Path, fp_path: Path):
+    """
+    Previous run's records ({table: record}) and fingerprints ({csv path: {...}}),
+    empty when either file is missing or unreadable.
+    """
+    try:
+        with open(out_path, "r", encoding="utf-8") as f:
+            records = {str(r.get("table")): r for r in json.load(f) if isinstance(r, dict)}
+        with open(fp_path, "r", encoding="utf-8") as f:
+            fps = json.load(f)
+        return records, (fps if isinstance(fps, dict) else {})
+    except Exception:
+        return {}, {}
 
 
 def simple_fallback(table: str, df: pd.DataFrame) -> dict:
@@ -99,10 +148,29 @@ def simple_fallback(table: str, df: pd.DataFrame) -> dict:
     }
 
 
-def llm_structured_summary(llm, prompt: str, table: str, df: pd.DataFrame, sample_rows: int) -> dict:
+def get_profile(p: str, cache: dict, full_hash: bool = False):
+    """
+    Column statistics for one CSV: reuse the cached profile if the file is unchanged,
+    otherwise run the streaming profiler. Returns {"fingerprint", "profile"} or None.
+    """
+    from src.retrieval_graph.profiler import profile_csv   # numpy: only when profiling is on
+    fp = table_fingerprint(p, full=full_hash)
+    hit = cache.get(p)
+    if hit and hit.get("fingerprint") == fp:
+        return hit
+    try:
+        return {"fingerprint": fp, "profile": profile_csv(p)}
+    except Exception as e:
+        print(f"[Task1] Profiling failed on {p}: {e}")
+        return None
+
+
+def llm_structured_summary(llm, prompt: str, table: str, df: pd.DataFrame, sample_rows: int,
+                           profile: dict = None) -> dict:
     """
     Generate a structured table summary using the LLM.
-    Includes column names and a few sample rows to help infer semantics.
+    Includes column names and a few sample rows to help infer semantics,
+    plus compact column statistics (null rate, dtype, range, distinct count, top values) if profiled.
     """
     payload = {
         "table": table,
@@ -110,16 +178,22 @@ def llm_structured_summary(llm, prompt: str, table: str, df: pd.DataFrame, sampl
         "sample_rows": df.head(sample_rows).to_dict(orient="records"),
         # row = 5. If available, include a few rows of sample data in the prompt to help infer semantics.
     }
+    if profile:
+        payload["row_count"] = profile.get("rows")
+        payload["column_stats"] = profile.get("columns")
     messages = [
         {"role": "system", "content": prompt},
         {"role": "user", "content": json.dumps(payload, ensure_ascii=False)}
     ]
-    resp = llm.invoke(messages)
-    txt = getattr(resp, "content", str(resp)).strip()
-    # trim response to valid JSON (between the first '{' and last '}')
-    if "{" in txt and "}" in txt:
-        txt = txt[txt.find("{"): txt.rfind("}")+1]
-    obj = json.loads(txt)
+    json_llm = with_json_mode(llm, SCHEMA_SUMMARY_SCHEMA)
+    with record_call("task1.summarize", model=model_name(llm), table=table) as call:
+        # rate limits / transient errors are retried by the scheduler, not turned into fallbacks
+        resp = scheduler_for("llm", model_name(llm)).run(lambda: json_llm.invoke(messages),
+                                                         tokens=message_tokens(messages), call=call,
+                                                         cached=lambda: cached_response(json_llm, messages))
+        call.done(resp)
+        # validated against the schema: drift repaired, invalid fields re-asked (structured_output.py)
+        obj = structured_result(resp, SCHEMA_SUMMARY_SCHEMA, llm, messages, call, defaults={"table": table})
 
     # normalize fields
     t = obj.get("table") or table
@@ -135,9 +209,68 @@ def llm_structured_summary(llm, prompt: str, table: str, df: pd.DataFrame, sampl
 
     return {"table": t, "summary": summ, "columns": cols_out}
 
-def main():
-    csv_dir = CONFIG["csv_dir"]
-    out_path = Path(CONFIG["out"])
+def table_name_from_path(p: str) -> str:
+    fname = os.path.basename(p)
+    table = re.sub(r"\.csv$", "", fname, flags=re.I)
+    return re.sub(r"^sakila_", "", table, flags=re.I)
+
+
+def summarize_table(llm, prompt: str, p: str, sample_n: int, profile: dict = None):
+    """
+    Read one CSV and summarize it (LLM, or fallback when the LLM is missing/fails).
+    Returns (record, from_llm); record is None when the CSV cannot be read.
+    """
+    table = table_name_from_path(p)
+    try:
+        df = read_csv_any(p, nrows=sample_n)   # only header + the rows shown to the LLM
+    except Exception as e:
+        print(f"[Task1] Skip {p}: {e}")
+        return None, False
+
+    from_llm = False
+    try:
+        if llm:
+            rec = llm_structured_summary(llm, prompt, table, df, sample_n, profile)
+            from_llm = True
+        else:
+            rec = simple_fallback(table, df)
+    except Exception as e:
+        print(f"[Task1] LLM failed on {table}: {e} -> fallback.")
+        rec = simple_fallback(table, df)
+
+    if CONFIG["lower_table"]:
+        rec["table"] = str(rec["table"]).lower()
+
+    print("OK:", rec["table"])
+    return rec, from_llm
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Task 1: summarize each CSV table with the LLM")
+    parser.add_argument("--csv-dir", type=str, default=CONFIG["csv_dir"], help="Folder with CSVs")
+    parser.add_argument("--out", type=str, default=CONFIG["out"], help="Output JSON path")
+    parser.add_argument("--workers", type=int, default=CONFIG["workers"],
+                        help="Tables summarized concurrently (CSV reads + LLM calls overlap)")
+    parser.add_argument("--incremental", action="store_true", default=CONFIG["incremental"],
+                        help="Only re-summarize new/changed CSVs; reuse the rest, prune removed tables. "
+                             "A CSV counts as changed when its size, mtime, first or last 64 KB differ; "
+                             "tools that restore the mtime after an edit need --full-hash")
+    parser.add_argument("--full-hash", action="store_true",
+                        help="Fingerprint whole CSV contents (reads every file; ignores mtime)")
+    parser.add_argument("--no-profile", dest="profile", action="store_false", default=CONFIG["profile"],
+                        help="Skip the streaming column profiler (column stats in the LLM payload)")
+    parser.add_argument("--deterministic", action="store_true",
+                        help="Pin temperature to 0 (reproducible runs); the LLM response cache is only "
+                        "used at temperature 0 or with LLM_CACHE=<path>")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Bypass the LLM response cache (on with --deterministic or LLM_CACHE=<path>)")
+    return parser.parse_args()
+
+
+def run(args) -> None:
+    """Summarize every CSV under --csv-dir into --out (and its SQLite index)."""
+    csv_dir = args.csv_dir
+    out_path = Path(args.out)
     sample_n = int(CONFIG["sample_rows"])
 
     csv_paths = discover_csvs(csv_dir)
@@ -153,31 +286,68 @@ def main():
     llm = get_chat_model(CONFIG["llm_name"]) if CONFIG["use_llm"] else None
     prompt = get_schema_prompt()
 
-    records = []
+    # Incremental mode: a CSV whose fingerprint matches the last run reuses its record
+    fp_path = out_path.parent / CONFIG["fingerprints"]
+    salt = f"{CONFIG['llm_name'] if llm else 'fallback'}\0{sample_n}\0{args.profile}\0{prompt}"
+    fingerprints = {}
     for p in csv_paths:
-        fname = os.path.basename(p)
-        table = re.sub(r"\.csv$", "", fname, flags=re.I)
-        table = re.sub(r"^sakila_", "", table, flags=re.I)
         try:
-            df = read_csv_any(p)
-        except Exception as e:
+            fingerprints[p] = table_fingerprint(p, salt, full=args.full_hash)
+        except OSError as e:   # vanished / unreadable since discovery: skip it like an unparsable CSV
             print(f"[Task1] Skip {p}: {e}")
-            continue
+    csv_paths = [p for p in csv_paths if p in fingerprints]
+    prev_records, prev_fps = load_previous(out_path, fp_path) if args.incremental else ({}, {})
 
+    reused = {}
+    for p in csv_paths:
+        old = prev_fps.get(p) or {}
+        if old.get("fingerprint") == fingerprints[p] and old.get("table") in prev_records:
+            reused[p] = prev_records[old["table"]]
+    todo = [p for p in csv_paths if p not in reused]
+    if args.incremental:
+        print(f"[Task1] incremental: {len(reused)} unchanged, {len(todo)} to summarize, "
+              f"{len(set(prev_fps) - set(csv_paths))} removed")
+
+    # Column profiles are cached by file content, so unchanged CSVs are streamed only once
+    prof_path = out_path.parent / CONFIG["profiles"]
+    prev_profiles = {}
+    if args.profile and prof_path.exists():
         try:
-            if llm:
-                rec = llm_structured_summary(llm, prompt, table, df, sample_n)
-            else:
-                rec = simple_fallback(table, df)
-        except Exception as e:
-            print(f"[Task1] LLM failed on {table}: {e} -> fallback.")
-            rec = simple_fallback(table, df)
+            with open(prof_path, "r", encoding="utf-8") as f:
+                prev_profiles = json.load(f)
+        except Exception:
+            prev_profiles = {}
+    new_profiles = {p: prev_profiles[p] for p in reused if p in prev_profiles}
 
-        if CONFIG["lower_table"]:
-            rec["table"] = str(rec["table"]).lower()
+    def work(p):
+        prof = get_profile(p, prev_profiles, args.full_hash) if args.profile else None
+        if prof:
+            new_profiles[p] = prof
+        return summarize_table(llm, prompt, p, sample_n, (prof or {}).get("profile"))
 
+    # pool.map keeps csv_paths order, so schema_summaries.json stays deterministic
+    workers = max(1, int(args.workers))
+    if workers == 1:
+        results = [work(p) for p in todo]
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(work, todo))
+    fresh = dict(zip(todo, results))
+
+    records = []
+    new_fps = {}
+    for p in csv_paths:
+        if p in reused:
+            rec, cacheable = reused[p], True
+        else:
+            rec, from_llm = fresh[p]
+            # fallback summaries are not remembered, so the LLM is retried next run
+            cacheable = from_llm or not llm
+        if rec is None:
+            continue
         records.append(rec)
-        print("OK:", rec["table"])
+        if cacheable:
+            new_fps[p] = {"table": rec["table"], "fingerprint": fingerprints[p]}
 
     if not records:
         raise RuntimeError("[Task1] 0 tables processed. Check CSV files & encodings.")
@@ -185,9 +355,28 @@ def main():
     out_path.parent.mkdir(parents=True, exist_ok=True)
     with open(out_path, "w", encoding="utf-8") as f:
         json.dump(records, f, ensure_ascii=False, indent=2)
+    # indexed copy for tasks 2/3 (name lookups, streaming); stamped with the JSON it mirrors
+    store = SummaryStore(sidecar_path(str(out_path)))
+    store.replace_all(records, source=str(out_path))
+    store.close()
+    with open(fp_path, "w", encoding="utf-8") as f:
+        json.dump(new_fps, f, ensure_ascii=False, indent=2)
+    if args.profile:
+        with open(prof_path, "w", encoding="utf-8") as f:
+            json.dump({p: new_profiles[p] for p in csv_paths if p in new_profiles}, f, ensure_ascii=False)
 
-    print(f"[Task1] wrote {out_path} ({len(records)} tables)")
+    print(f"[Task1] wrote {out_path} ({len(records)} tables) + index {store.path}")
     print(f"[Task1] CSV list saved to {debug_list}")
 
+
+def main():
+    args = parse_args()
+    configure_llm_cache(args.deterministic, args.no_cache)
+    configure_run("task1")
+    try:
+        run(args)
+    finally:   # failed runs report their calls too (tokens spent, errors)
+        finish_run()
+
 if __name__ == "__main__":
     main()
@@ -19,21 +19,34 @@ python task2_search_chatgpt.py "employee salaries" --schemas outputs/schema_summ
 import argparse
 import json
 import os
-import re
-from typing import Any, Dict, List, Optional
-from dotenv import load_dotenv
-load_dotenv()  # load .envv
-
-# from src.retrieval_graph.utils import load_chat_model
-from openai import OpenAI  
-try:
-    from src.retrieval_graph.utils import load_chat_model
-except ImportError:
-    from utils import load_chat_model  # fallback for running directly from the project root
-
-from src.retrieval_graph.embedding import embed_rank_tables
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+# Heavy dependencies (openai, langchain, numpy) are imported inside the code path that
+# needs them, so `--help`, bm25 mode and `import task2_search` stay fast.
+from src.retrieval_graph.llm_cache import configure as configure_llm_cache, cached_response
+from src.retrieval_graph.metrics import record_call, configure_run, finish_run
+from src.retrieval_graph.summary_store import open_summary_store, summary_lookup
+from src.retrieval_graph.corpus import estimate_tokens
+from src.retrieval_graph.json_stream import stream_invoke, emit_once
+from src.retrieval_graph.scheduler import scheduler_for, message_tokens
+from src.retrieval_graph.structured_output import with_json_mode, structured_result
+from concurrent.futures import ThreadPoolExecutor
 import math
 
+# Token budget for the candidate snippets of ONE ranking prompt (larger sets go to the tournament)
+PROMPT_TOKENS = int(os.getenv("RANK_PROMPT_TOKENS", "8000"))
+RANK_WORKERS = int(os.getenv("RANK_WORKERS", "16"))  # shard prompts in flight per tournament level
+
+
+def load_chat_model(model: str):
+    """Chat client from utils.load_chat_model (imported on first use: it pulls in LangChain)."""
+    try:
+        from src.retrieval_graph.utils import load_chat_model as _loader
+    except ImportError:
+        from utils import load_chat_model as _loader  # fallback for running directly from the project root
+    return _loader(model)
+
 def read_json(path: str) -> Any:
     with open(path, "r", encoding="utf-8") as f:
         return json.load(f)
@@ -78,91 +91,583 @@ def build_table_snippet(tbl: Dict[str, Any], max_summary_len: int = 320) -> str:
     return "\n".join(parts)
 
 
-from src.retrieval_graph.prompts import TABLE_MATCH_PROMPT
+from src.retrieval_graph.prompts import TABLE_MATCH_PROMPT, TABLE_MATCH_SCHEMA
 
-def call_llm_rank(query: str, table_snippets: List[str], k: int, model: str) -> Dict[str, Any]:
+def snippet_table(snippet: str) -> str:
+    """Table name of a build_table_snippet output (its first line is "- table: <name>")."""
+    first = snippet.split("\n", 1)[0]
+    return first.split(":", 1)[1].strip() if ":" in first else first.strip()
+
+
+def pack_snippets(table_snippets: List[str], budget_tokens: int) -> List[List[str]]:
+    """
+    Split snippets into consecutive shards whose estimated tokens fill at most `budget_tokens`
+    (a single oversized snippet still gets its own shard). Catalog order is kept.
+    """
+    shards: List[List[str]] = []
+    cur: List[str] = []
+    used = 0
+    for sn in table_snippets:
+        n = estimate_tokens(sn) + 1   # + the joining newline
+        if cur and used + n > budget_tokens:
+            shards.append(cur)
+            cur, used = [], 0
+        cur.append(sn)
+        used += n
+    if cur:
+        shards.append(cur)
+    return shards
+
+
+def call_llm_rank(query: str, table_snippets: List[str], k: int, model: str,
+                  budget_tokens: Optional[int] = None, workers: Optional[int] = None,
+                  on_choice: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
     """
     Use the LLM to rank candidate tables for a given query.
         - query: the user input question
         - table_snippets: compressed descriptions of tables (from build_table_snippet)
         - k: number of top tables to return
         - model: model name to load via load_chat_model
+        - budget_tokens: token budget for the snippets of one prompt (default PROMPT_TOKENS);
+          when the snippets do not fit, a tournament ranks token-packed shards concurrently
+          and reranks the shard winners (see tournament_rank)
+        - on_choice: streaming mode, called with each {"table", "score", "reason"} entry as soon as
+          it is complete (tournament: entries of the final level)
     Returns:
         Parsed JSON object with table scores and reasons.
     """
-    
-    if OpenAI is None:
-        raise RuntimeError("openai package not installed. Run: pip install openai")
+    budget = budget_tokens or PROMPT_TOKENS
+    if len(table_snippets) > k and sum(estimate_tokens(sn) + 1 for sn in table_snippets) > budget:
+        return tournament_rank(query, table_snippets, k, model, budget, workers or RANK_WORKERS, on_choice)
+    return rank_prompt(query, table_snippets, k, model, on_choice)
+
+
+def tournament_rank(query: str, table_snippets: List[str], k: int, model: str,
+                    budget_tokens: int, workers: int,
+                    on_choice: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+    """
+    Map-reduce ranking for candidate sets larger than one prompt:
+    each level packs the remaining snippets into shards of `budget_tokens`, ranks all shards
+    concurrently (one round trip per level) and keeps each shard's top-k; once the winners
+    fit in one prompt, a final call ranks them. A shard whose request fails (after the
+    scheduler's retries) is not dropped: its tables go on to the next level unranked. If no
+    shard narrows (each holds at most k tables), fewer winners are kept per shard, down to one;
+    a catalog that still cannot narrow raises instead of being truncated. Returns the usual
+    {"choices": [...]} plus "tournament": {"levels", "calls", "failed", "candidates"}
+    (candidates per level).
+    """
+    remaining = list(table_snippets)
+    stats: Dict[str, Any] = {"levels": 0, "calls": 0, "failed": 0, "candidates": []}
+    while len(remaining) > k and sum(estimate_tokens(sn) + 1 for sn in remaining) > budget_tokens:
+        shards = pack_snippets(remaining, budget_tokens)
+        stats["levels"] += 1
+        stats["calls"] += len(shards)
+        stats["candidates"].append(len(remaining))
+
+        def run(shard):
+            try:
+                return rank_prompt(query, shard, k, model)
+            except Exception as e:
+                print(f"[Task2] tournament shard of {len(shard)} tables failed: {e}; "
+                      f"its tables go on to the next level")
+                return None
+
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(shards)))) as pool:
+            results = list(pool.map(run, shards))
+        if all(r is None for r in results):
+            raise RuntimeError("every tournament shard failed")
+        stats["failed"] += sum(r is None for r in results)
+
+        # per shard: its ranked picks, or None (failed: every table carried over)
+        picks: List[Optional[List[str]]] = []
+        for shard, res in zip(shards, results):
+            if res is None:
+                picks.append(None)
+                continue
+            by_name = {snippet_table(sn): sn for sn in shard}
+            picks.append([by_name.pop(str(c.get("table", ""))) for c in res.get("choices") or []
+                          if isinstance(c, dict) and str(c.get("table", "")) in by_name])
+        keep = k
+        while True:
+            winners = [sn for shard, p in zip(shards, picks) for sn in (shard if p is None else p[:keep])]
+            if len(winners) < len(remaining) or keep == 1:
+                break
+            keep = max(1, keep // 2)   # no shard narrowed at k: keep fewer per shard
+        if not winners:
+            raise RuntimeError("tournament shards returned no known tables")
+        if len(winners) >= len(remaining):
+            raise RuntimeError(f"tournament cannot narrow {len(remaining)} tables: each shard of "
+                               f"--prompt-tokens {budget_tokens} holds at most one table; raise the budget")
+        if keep < k:
+            print(f"[Task2] tournament level {stats['levels']}: keeping top-{keep} per shard "
+                  f"({len(shards)} shards of at most {k} tables)")
+        remaining = winners
 
+    data = rank_prompt(query, remaining, k, model, on_choice)
+    stats["levels"] += 1
+    stats["calls"] += 1
+    stats["candidates"].append(len(remaining))
+    data["tournament"] = stats
+    return data
+
+
+def rank_prompt(query: str, table_snippets: List[str], k: int, model: str,
+                on_choice: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+    """
+    One ranking request over `table_snippets` (no budgeting), parsed into the TABLE_MATCH_PROMPT JSON.
+    With `on_choice`, the answer is streamed and every "choices" entry is passed on as soon as it
+    is complete (the time to the first one is recorded as ttfr in metrics.py).
+    """
     llm = load_chat_model(model)
+    json_llm = with_json_mode(llm, TABLE_MATCH_SCHEMA)
     content = f"User query:\n{query}\n\nK = {k}\n\nCandidate tables:\n" + "\n".join(table_snippets)
-
-    resp = llm.invoke([
+    messages = [
         {"role": "system", "content": TABLE_MATCH_PROMPT},
         {"role": "user", "content": content},
-    ])
+    ]
 
-    txt = getattr(resp, "content", str(resp)).strip()
-    try:
-        data = json.loads(txt)
-    except Exception:
-        # Fallback: attempt to extract JSON via regex
-        m = re.search(r"\{.*\}", txt, flags=re.S)
-        if not m:
-            raise ValueError(f"LLM did not return JSON. Raw:\n{txt}")
-        data = json.loads(m.group(0))
+    with record_call("task2.rank", model=model, items=len(table_snippets)) as call:
+        cached = None
+        if on_choice is None:
+            request = lambda: json_llm.invoke(messages)
+            cached = lambda: cached_response(json_llm, messages)   # hits take no quota
+        else:
+            @emit_once   # a retried stream starts over: each table is passed on once
+            def on_event(ev):
+                if ev[0] == "item" and ev[1] == "choices" and isinstance(ev[2], dict):
+                    call.first_result()
+                    on_choice(ev[2])
+            request = lambda: stream_invoke(json_llm, messages, on_event)
+        resp = scheduler_for("llm", model).run(request, tokens=message_tokens(messages), call=call,
+                                               cached=cached)
+        call.done(resp)
+        # drift repaired client-side; only invalid "choices" entries are re-asked (structured_output.py)
+        data = structured_result(resp, TABLE_MATCH_SCHEMA, llm, messages, call, defaults={"query": query})
     return data
 
 
+def normalize_choices(result: Dict[str, Any], summaries: Any) -> List[Dict[str, Any]]:
+    """
+    Normalize the LLM output:
+        - Extract table name / score / reason from the LLM response.
+        - Look up the original summary record to recover path / full summary / full columns for downstream use.
+    `summaries` is a SummaryStore (indexed lookup), a {table: record} dict or a list of records.
+    """
+    choices = result.get("choices") or []
+    lookup = summary_lookup(summaries)
+    ranked = []
+    for c in choices:
+        tbl = str(c.get("table", ""))
+        score = int(c.get("score", 0)) if str(c.get("score", "")).isdigit() else c.get("score", 0)
+        reason = str(c.get("reason", ""))
+        # Find original record (path, full columns, summary) for convenience
+        match = lookup(tbl)
+        ranked.append({
+            "table": tbl,
+            "score": score,
+            "reason": reason,
+            "path": (match or {}).get("path"),
+            "summary": (match or {}).get("summary"),
+            "columns": (match or {}).get("columns"),
+        })
+    return ranked
+
+
+def read_queries(path: str) -> List[Dict[str, Any]]:
+    """
+    Load queries for batch mode:
+        - .jsonl: one object per line with "query" (optional "id", and "gold": relevant tables
+          used to report first-stage recall in hybrid mode), or a bare JSON string
+        - anything else: one query per non-empty line
+    Returns [{"id": ..., "query": str}].
+    """
+    out: List[Dict[str, Any]] = []
+    with open(path, "r", encoding="utf-8") as f:
+        for i, line in enumerate(f):
+            line = line.strip()
+            if not line:
+                continue
+            if path.lower().endswith(".jsonl"):
+                obj = json.loads(line)
+                if isinstance(obj, str):
+                    obj = {"query": obj}
+                q = str(obj.get("query") or "").strip()
+                if q:
+                    rec = {"id": obj.get("id", i), "query": q}
+                    if obj.get("gold"):
+                        rec["gold"] = obj["gold"] if isinstance(obj["gold"], list) else [obj["gold"]]
+                    out.append(rec)
+            else:
+                out.append({"id": i, "query": line})
+    return out
+
+
+def first_stage_rank(args: argparse.Namespace, summaries: Any, query: str,
+                     store_dir: Optional[str]) -> List[Dict[str, Any]]:
+    """
+    Hybrid mode, stage 1: cheap retrieval of the top `--limit` candidates (no chat model call).
+    """
+    if args.first_stage == "embedding":
+        from src.retrieval_graph.embedding import embed_rank_tables
+        return embed_rank_tables(summaries, query, args.embedding_model, k=args.limit, store_dir=store_dir,
+                                 index=args.index, nlist=args.nlist, nprobe=args.nprobe,
+                                 dtype=args.vector_dtype, dim=args.vector_dim)
+    from src.retrieval_graph.lexical import lexical_rank_tables
+    return lexical_rank_tables(summaries, query, k=args.limit, index_path=args.bm25_index)
+
+
+def rerank_candidates(args: argparse.Namespace, query: str, candidates: List[Dict[str, Any]],
+                      summaries: Any, by_name: Any,
+                      on_choice: Optional[Callable[[Dict[str, Any]], None]] = None) -> List[Dict[str, Any]]:
+    """
+    Hybrid mode, stage 2: the LLM ranks only the first-stage candidates,
+    so the prompt size is bounded by --limit however large the catalog is.
+    No candidates: [] without calling the LLM (it could only answer nothing or invent tables).
+    """
+    snippets = [build_table_snippet(by_name[c["table"]]) for c in candidates if c["table"] in by_name]
+    if not snippets:
+        return []
+    return normalize_choices(call_llm_rank(query, snippets, args.k, args.model,
+                                           budget_tokens=getattr(args, "prompt_tokens", None),
+                                           on_choice=on_choice), by_name)
+
+
+def stream_printer(t0: float, timing: Dict[str, float]) -> Callable[[Dict[str, Any]], None]:
+    """--stream: print each ranked table as soon as its entry is complete; keeps time-to-first-result."""
+    n = [0]
+
+    def show(c: Dict[str, Any]) -> None:
+        n[0] += 1
+        elapsed = time.perf_counter() - t0
+        timing.setdefault("first", elapsed)
+        print(f"  -> [{n[0]}] table: {c.get('table')}  score: {c.get('score')}  "
+              f"reason: {c.get('reason')}  (+{elapsed:.2f}s)", flush=True)
+    return show
+
+
+def llm_candidates(summaries: Any, limit: int) -> Any:
+    """
+    Records shown to the LLM in llm mode: the first `limit` tables, or the whole catalog
+    with limit <= 0 (call_llm_rank packs them into budgeted prompts).
+    """
+    return summaries.head(limit) if limit > 0 else summaries
+
+
+def first_stage_recall(candidates: List[Dict[str, Any]], gold: List[str]) -> Optional[float]:
+    """
+    Share of the gold tables that survived the first stage (None without gold labels).
+    """
+    gold_set = {str(g).strip().lower() for g in gold or [] if str(g).strip()}
+    if not gold_set:
+        return None
+    return len(gold_set & {str(c["table"]).lower() for c in candidates}) / len(gold_set)
+
+
+def run_batch(args: argparse.Namespace, summaries: Any, store_dir: Optional[str]) -> None:
+    """
+    Batch query mode (--queries-file): summaries are loaded once, results are streamed to a JSONL
+    (one record per query) and throughput is reported as queries per second.
+    Embedding mode embeds the queries in batches and scores each batch against the whole catalog
+    with one matrix multiply (--index ann: through the IVF index, --nlist / --nprobe).
+    """
+    queries = read_queries(args.queries_file)
+    if not queries:
+        raise ValueError(f"No queries found in {args.queries_file}")
+    out_path = args.out or os.path.join("outputs", "task2", "task2_batch_results.jsonl")
+    os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+
+    t0 = time.perf_counter()
+    ranker = None
+    if args.mode == "embedding" or (args.mode == "hybrid" and args.first_stage == "embedding"):
+        from src.retrieval_graph.embedding import EmbeddingRanker
+        ranker = EmbeddingRanker(summaries, args.embedding_model, store_dir,
+                                 dtype=args.vector_dtype, dim=args.vector_dim,
+                                 index=args.index, nlist=args.nlist, nprobe=args.nprobe)
+    snippets = [build_table_snippet(s) for s in llm_candidates(summaries, args.limit)] if args.mode == "llm" else []
+    by_name = summaries   # SummaryStore: indexed name lookups
+    bm25 = None
+    if args.mode == "bm25" or (args.mode == "hybrid" and args.first_stage == "lexical"):
+        from src.retrieval_graph.lexical import load_bm25_index
+        bm25 = load_bm25_index(summaries, args.bm25_index)
+    t_ready = time.perf_counter()
+
+    done = 0
+    recalls: List[float] = []
+    with open(out_path, "w", encoding="utf-8") as f:
+        for i in range(0, len(queries), args.batch_size):
+            batch = queries[i:i + args.batch_size]
+            if args.mode == "hybrid":
+                if ranker is not None:
+                    stage1 = ranker.rank([q["query"] for q in batch], args.limit)
+                else:
+                    stage1 = [bm25.search(q["query"], args.limit) for q in batch]
+                records = []
+                for q, cands in zip(batch, stage1):
+                    rec = {"id": q["id"], "query": q["query"], "mode": "hybrid", "model": args.model,
+                           "first_stage": {"method": args.first_stage, "n": len(cands),
+                                           "candidates": [c["table"] for c in cands]}}
+                    rec_recall = first_stage_recall(cands, q.get("gold"))
+                    if rec_recall is not None:
+                        rec["first_stage"]["recall"] = rec_recall
+                        recalls.append(rec_recall)
+                    if not cands:
+                        print(f"[Task2] query {q['id']}: no first-stage candidates, LLM rerank skipped")
+                    try:
+                        rec["choices"] = rerank_candidates(args, q["query"], cands, summaries, by_name)
+                    except Exception as e:
+                        rec["choices"], rec["error"] = [], str(e)
+                    records.append(rec)
+            elif bm25 is not None:
+                records = [{"id": q["id"], "query": q["query"], "mode": "bm25",
+                            "choices": bm25.search(q["query"], args.k)} for q in batch]
+            elif ranker is not None:
+                results = ranker.rank([q["query"] for q in batch], args.k)
+                records = [{"id": q["id"], "query": q["query"], "mode": "embedding",
+                            "embedding_model": args.embedding_model, "choices": r}
+                           for q, r in zip(batch, results)]
+            else:
+                records = []
+                for q in batch:
+                    try:
+                        ranked = normalize_choices(call_llm_rank(q["query"], snippets, args.k, args.model,
+                                                                 budget_tokens=args.prompt_tokens),
+                                                   summaries)
+                        records.append({"id": q["id"], "query": q["query"], "mode": "llm",
+                                        "model": args.model, "choices": ranked})
+                    except Exception as e:
+                        records.append({"id": q["id"], "query": q["query"], "mode": "llm",
+                                        "model": args.model, "choices": [], "error": str(e)})
+            for rec in records:
+                f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+            f.flush()
+            done += len(records)
+            elapsed = time.perf_counter() - t_ready
+            print(f"[Task2] {done}/{len(queries)} queries  {done / elapsed if elapsed else 0.0:.1f} q/s")
+
+    total = time.perf_counter() - t0
+    query_time = time.perf_counter() - t_ready
+    print("=" * 80)
+    print(f"Queries: {done}  Mode: {args.mode}")
+    print(f"Setup (load catalog/embeddings): {t_ready - t0:.2f}s")
+    print(f"Ranking: {query_time:.2f}s  -> {done / query_time if query_time else 0.0:.1f} queries/s")
+    print(f"Total: {total:.2f}s")
+    if recalls:
+        print(f"First-stage recall@{args.limit} ({args.first_stage}): {sum(recalls) / len(recalls):.3f} "
+              f"over {len(recalls)} labelled queries")
+    print(f"Saved: {out_path}")
+
+
 def main():
     """
     Define and configure command-line arguments for Task 2:
     This parser allows the user to provide:
       query              Natural language query (positional argument)
-      --schemas          Path to Task 1 schema summaries JSON (default: outputs/task1/schema_summaries.json)
+      --schemas          Task 1 schema summaries: JSON or its SQLite store (default: outputs/task1/schema_summaries.json)
       --k                How many tables to select (default: 5)
       --model            OpenAI chat model name (default: from OPENAI_MODEL env var or "gpt-4o-mini")
-      --limit            Max number of candidate tables to pass into the LLM (default: 30)
+      --limit            Max number of candidate tables to pass into the LLM (default: 30, 0 = all)
+      --prompt-tokens    Token budget of the candidates in one prompt; larger sets are ranked
+                         by a parallel tournament (default: RANK_PROMPT_TOKENS or 8000)
+      --queries-file     Batch mode: rank every query in a JSONL/TXT file, stream results to --out
     """
-    
+    from dotenv import load_dotenv
+    load_dotenv()  # load .env (before the argument defaults read OPENAI_MODEL)
+
     parser = argparse.ArgumentParser(description="Task 2 (ChatGPT): Rank tables using Task 1 summaries + LLM")
-    parser.add_argument("query", type=str, help="Natural language query")
+    parser.add_argument("query", type=str, nargs="?", default=None, help="Natural language query")
+    parser.add_argument("--queries-file", type=str, default=None,
+                        help="Batch mode: JSONL ({\"query\": ...} per line) or TXT (one query per line)")
+    parser.add_argument("--batch-size", type=int, default=256,
+                        help="Batch mode: queries embedded/scored per batch")
+    parser.add_argument("--out", type=str, default=None,
+                        help="Batch mode: output JSONL (default outputs/task2/task2_batch_results.jsonl)")
     parser.add_argument("--schemas", type=str, default="outputs/task1/schema_summaries.json",
-                        help="Path to Task 1 schema summaries JSON")
+                        help="Task 1 schema summaries: JSON or SQLite store (.sqlite)")
     parser.add_argument("--k", type=int, default=5, help="How many tables to select")
     parser.add_argument("--model", type=str, default=os.getenv("OPENAI_MODEL", "gpt-4o-mini"),
                         help="OpenAI chat model (default from OPENAI_MODEL or 'gpt-4o-mini')")
-    parser.add_argument("--limit", type=int, default=30, help="Max candidates to show the LLM")
+    parser.add_argument("--limit", type=int, default=30,
+                        help="Max candidates to show the LLM (0 = whole catalog; hybrid mode: first-stage top-N)")
+    parser.add_argument("--prompt-tokens", type=int, default=PROMPT_TOKENS,
+                        help="Token budget for candidate snippets per prompt; candidates that do not fit "
+                             "are ranked in concurrent shards, then the shard winners are reranked")
     #embedding
     parser.add_argument("--mode", type=str, default="llm",
-                    choices=["llm", "embedding"],
-                    help="Ranking mode: 'llm' (default) or 'embedding'")
+                    choices=["llm", "embedding", "hybrid", "bm25"],
+                    help="Ranking mode: 'llm' (default), 'embedding', 'hybrid' "
+                         "(cheap first stage picks --limit candidates, the LLM reranks them), "
+                         "or 'bm25' (offline lexical ranking, no API call)")
+    parser.add_argument("--first-stage", type=str, default="embedding", choices=["embedding", "lexical"],
+                    help="Hybrid mode: first-stage retriever (default: embedding; lexical = BM25)")
+    parser.add_argument("--bm25-index", type=str, default=None,
+                    help="BM25 inverted index file (default: <schemas dir>/bm25_index.json)")
+    parser.add_argument("--gold", type=str, default=None,
+                    help="Hybrid mode: comma-separated relevant tables, to report first-stage recall")
     parser.add_argument("--embedding-model", type=str, default="text-embedding-3-small",
                     help="Embedding model name")
+    parser.add_argument("--embedding-store", type=str, default=None,
+                    help="Folder for cached table embeddings (default: <schemas dir>/embeddings)")
+    parser.add_argument("--no-embedding-store", action="store_true",
+                    help="Re-embed the whole catalog on every call (no on-disk cache)")
+    parser.add_argument("--vector-dtype", type=str, default="float32", choices=["float32", "float16", "int8"],
+                    help="Table-embedding matrix layout (memory-mapped from the store): "
+                         "float32 exact, float16 / int8 quantized")
+    parser.add_argument("--vector-dim", type=int, default=None,
+                    help="Keep only the first N embedding dimensions (rows re-normalized)")
+    parser.add_argument("--index", type=str, default="exact", choices=["exact", "ann"],
+                    help="Embedding search: 'exact' brute force (default) or 'ann' IVF index")
+    parser.add_argument("--nlist", type=int, default=None,
+                    help="ANN: number of IVF lists (default ~sqrt(#tables))")
+    parser.add_argument("--nprobe", type=int, default=8,
+                    help="ANN: lists scanned per query (higher = better recall, slower)")
+    parser.add_argument("--ann-report", action="store_true",
+                    help="ANN: also run the exact path and print recall@k")
+    parser.add_argument("--stream", action="store_true",
+                    help="llm/hybrid single query: stream the answer and print each table as soon as "
+                         "it is ranked (reports time-to-first-result)")
+    parser.add_argument("--deterministic", action="store_true",
+                    help="Pin temperature to 0 (reproducible runs); the LLM response cache is only "
+                    "used at temperature 0 or with LLM_CACHE=<path>")
+    parser.add_argument("--no-cache", action="store_true",
+                    help="Bypass the LLM response cache (on with --deterministic or LLM_CACHE=<path>)")
     args = parser.parse_args()
-    
-    
-    
+    configure_llm_cache(args.deterministic, args.no_cache)
+    if not args.query and not args.queries_file:
+        parser.error("either a query or --queries-file is required")
+    configure_run("task2")
+    try:
+        run(args)
+    finally:   # failed runs report their calls too (tokens spent, errors)
+        finish_run()
+
+
+def run(args: argparse.Namespace) -> None:
+    """
+    Rank tables for `args.query` (or every query of --queries-file) in the selected --mode.
+    """
     # Validate schema summaries input
     if not os.path.exists(args.schemas):
         raise FileNotFoundError(f"Schema summaries not found: {args.schemas}")
         
-    summaries = read_json(args.schemas)
-    if not isinstance(summaries, list) or not summaries:
-        raise ValueError("Schema summaries JSON must be a non-empty list")
+    # Indexed store (sidecar of the JSON): records are streamed / looked up by name, never all parsed
+    summaries = open_summary_store(args.schemas)
+    if not len(summaries):
+        raise ValueError("Schema summaries must be a non-empty list")
+
+    store_dir = None
+    if not args.no_embedding_store:
+        store_dir = args.embedding_store or os.path.join(
+            os.path.dirname(args.schemas) or ".", "embeddings")
+
+    args.bm25_index = args.bm25_index or os.path.join(os.path.dirname(args.schemas) or ".", "bm25_index.json")
+
+    if args.queries_file:
+        run_batch(args, summaries, store_dir)
+        return
+
+    if args.mode == "bm25":
+        from src.retrieval_graph.lexical import load_bm25_index
+        t0 = time.perf_counter()
+        index = load_bm25_index(summaries, args.bm25_index)
+        t1 = time.perf_counter()
+        ranked = index.search(args.query, args.k)
+        t2 = time.perf_counter()
+
+        print("=" * 80)
+        print(f"Query: {args.query}")
+        print("Mode: bm25 (offline)")
+        print(f"Index: {args.bm25_index} ({len(index)} tables, load/sync {(t1 - t0) * 1000:.1f} ms, "
+              f"query {(t2 - t1) * 1000:.3f} ms)")
+        print(f"Schemas: {args.schemas}")
+        print("-" * 80)
+        for i, r in enumerate(ranked, 1):
+            print(f"[{i}] table: {r['table']}  score: {r['score']:.4f}")
+        print("=" * 80)
+
+        os.makedirs(os.path.join("outputs", "task2"), exist_ok=True)
+        out_path = os.path.join("outputs", "task2", "task2_llm_results.json")
+        write_json(out_path, {
+            "query": args.query,
+            "mode": "bm25",
+            "schemas": args.schemas,
+            "choices": ranked
+        })
+        print(f"Saved: {out_path}")
+        return
+
+    if args.mode == "hybrid":
+        t0 = time.perf_counter()
+        candidates = first_stage_rank(args, summaries, args.query, store_dir)
+        t1 = time.perf_counter()
+        timing: Dict[str, float] = {}
+        ranked = rerank_candidates(args, args.query, candidates, summaries, summaries,
+                                   on_choice=stream_printer(t1, timing) if args.stream else None)
+        t2 = time.perf_counter()
+        recall = first_stage_recall(candidates, (args.gold or "").split(","))
+
+        print("=" * 80)
+        print(f"Query: {args.query}")
+        print(f"Mode: hybrid ({args.first_stage} top-{args.limit} -> LLM rerank)")
+        print(f"Model: {args.model}")
+        print(f"Schemas: {args.schemas}")
+        print(f"First stage: {len(candidates)}/{len(summaries)} tables in {t1 - t0:.2f}s, "
+              f"rerank {t2 - t1:.2f}s"
+              + (f" (first result after {timing['first']:.2f}s)" if "first" in timing else ""))
+        if recall is not None:
+            print(f"First-stage recall@{args.limit}: {recall:.3f}")
+        print("-" * 80)
+        if not candidates:
+            print(f"No first-stage candidates ({args.first_stage}): LLM rerank skipped "
+                  f"(try --first-stage embedding or another wording)")
+        for i, r in enumerate(ranked, 1):
+            print(f"[{i}] table: {r['table']}  score: {r['score']}  reason: {r['reason']}")
+        print("=" * 80)
+
+        os.makedirs(os.path.join("outputs", "task2"), exist_ok=True)
+        out_path = os.path.join("outputs", "task2", "task2_llm_results.json")
+        first_stage = {"method": args.first_stage, "n": len(candidates),
+                       "candidates": [c["table"] for c in candidates]}
+        if recall is not None:
+            first_stage["recall"] = recall
+        write_json(out_path, {
+            "query": args.query,
+            "mode": "hybrid",
+            "model": args.model,
+            "schemas": args.schemas,
+            "first_stage": first_stage,
+            "choices": ranked
+        })
+        print(f"Saved: {out_path}")
+        return
 
     if args.mode == "embedding":
+        from src.retrieval_graph.embedding import embed_rank_tables
+        ann_report = {} if (args.index == "ann" and args.ann_report) else None
         ranked = embed_rank_tables(
             summaries=summaries,
             query=args.query,
             embedding_model=args.embedding_model,
             k=args.k,
+            store_dir=store_dir,
+            index=args.index,
+            nlist=args.nlist,
+            nprobe=args.nprobe,
+            report=ann_report,
+            dtype=args.vector_dtype,
+            dim=args.vector_dim,
         )
 
         print("=" * 80)
         print(f"Query: {args.query}")
         print(f"Mode: embedding")
         print(f"Embedding model: {args.embedding_model}")
+        print(f"Embedding store: {store_dir or 'disabled'}")
+        print(f"Index: {args.index}  vectors: {args.vector_dtype}"
+              + (f", first {args.vector_dim} dims" if args.vector_dim else ""))
+        if ann_report:
+            print(f"ANN recall@{args.k} vs exact: {ann_report['recall_at_k']:.3f} "
+                  f"(nlist={ann_report['nlist']}, nprobe={ann_report['nprobe']}, "
+                  f"tables={ann_report['tables']})")
         print(f"Schemas: {args.schemas}")
         print("-" * 80)
         for i, r in enumerate(ranked, 1):
@@ -184,37 +689,27 @@ def main():
     
 
     # Build compact snippets for the LLM
-    snippets = [build_table_snippet(s) for s in summaries[: args.limit]]
+    snippets = [build_table_snippet(s) for s in llm_candidates(summaries, args.limit)]
 
-    result = call_llm_rank(args.query, snippets, args.k, args.model)
+    t0 = time.perf_counter()
+    timing: Dict[str, float] = {}
+    result = call_llm_rank(args.query, snippets, args.k, args.model, budget_tokens=args.prompt_tokens,
+                           on_choice=stream_printer(t0, timing) if args.stream else None)
+    elapsed = time.perf_counter() - t0
     
-    """
-    Normalize the LLM output:
-        - Extract table name / score / reason from the LLM response.
-        - Look up the original summary record to recover path / full summary / full columns for downstream use.
-    """
-    choices = result.get("choices") or []
-    ranked = []
-    for c in choices:
-        tbl = str(c.get("table", ""))
-        score = int(c.get("score", 0)) if str(c.get("score", "")).isdigit() else c.get("score", 0)
-        reason = str(c.get("reason", ""))
-        # Find original record (path, full columns, summary) for convenience
-        match = next((s for s in summaries if (s.get("table") or s.get("name")) == tbl), None)
-        ranked.append({
-            "table": tbl,
-            "score": score,
-            "reason": reason,
-            "path": (match or {}).get("path"),
-            "summary": (match or {}).get("summary"),
-            "columns": (match or {}).get("columns"),
-        })
+    ranked = normalize_choices(result, summaries)
 
     # print results
     print("=" * 80)
     print(f"Query: {args.query}")
     print(f"Model: {args.model}")
     print(f"Schemas: {args.schemas}")
+    tour = result.get("tournament")
+    if "first" in timing:
+        print(f"Streamed: first result {timing['first']:.2f}s, total {elapsed:.2f}s")
+    if tour:
+        print(f"Tournament: {len(snippets)} tables, {tour['levels']} levels, {tour['calls']} calls "
+              f"(candidates per level {tour['candidates']}), {elapsed:.2f}s")
     print("-" * 80)
     for i, r in enumerate(ranked, 1):
         print(f"[{i}] table: {r['table']}  score: {r['score']}  reason: {r['reason']}")
@@ -226,12 +721,15 @@ def main():
     # insure contain outputs/task2 
     
     # save result to outputs/task2/task2_llm_results.json
-    write_json(os.path.join("outputs", "task2", "task2_llm_results.json"), {
+    out = {
         "query": args.query,
         "model": args.model,
         "schemas": args.schemas,
         "choices": ranked
-    })
+    }
+    if tour:
+        out["tournament"] = tour
+    write_json(os.path.join("outputs", "task2", "task2_llm_results.json"), out)
     print("Saved: outputs/task2/task2_llm_results.json")
 
 
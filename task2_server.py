@@ -0,0 +1,307 @@
+# -*- coding: utf-8 -*-
+"""
+Task 2 as a long-lived local service
+------------------------------------
+Keeps the schema summaries, the table embeddings, the BM25 index and the chat client
+in memory, so a query from the UI only pays for ranking itself.
+
+Endpoints (JSON):
+  POST /search   {"query": str, "k": 5, "mode": "embedding|bm25|llm|hybrid", "limit": 30}
+                 -> {"query", "mode", "choices": [...], "latency_ms"}
+  GET  /stats    request counts, p50/p95/p99 latency per mode, catalog info, model-call metrics,
+                 rate-limit scheduler state (429s, retries, current concurrency)
+  GET  /metrics  model-call metrics (LLM + embeddings) in Prometheus text format
+  GET  /health   {"ok": true}
+
+Errors: 400 for a malformed body or request ({"k": "x"}, unknown mode), 502 when the model
+provider fails (API errors, timeouts, an unusable answer), 500 for anything else.
+
+The summaries file is watched (mtime); when it changes, a new catalog is built in the
+background and swapped in atomically, requests keep using the old one until then.
+
+Usage:
+  python task2_server.py --port 8000 --schemas outputs/task1/schema_summaries.json
+  curl -s localhost:8000/search -d '{"query": "find an actor whose last name is GUINESS", "mode": "bm25"}'
+"""
+
+import argparse
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List
+
+import task2_search as t2
+from src.retrieval_graph.lexical import load_bm25_index
+from src.retrieval_graph.metrics import RECORDER, configure_run, prometheus_text
+from src.retrieval_graph.summary_store import open_summary_store, record_name
+from src.retrieval_graph.scheduler import scheduler_snapshot, is_retryable
+from src.retrieval_graph.structured_output import StructuredOutputError
+
+
+class BadRequest(ValueError):
+    """Invalid /search request (HTTP 400)."""
+
+
+def is_upstream_error(e: BaseException) -> bool:
+    """Failures of the chat / embedding provider (HTTP 502) rather than of the request or the server."""
+    return (isinstance(e, StructuredOutputError) or is_retryable(e)
+            or type(e).__module__.split(".")[0] in ("openai", "httpx"))
+
+
+def _int_param(req: Dict[str, Any], name: str, default: int) -> int:
+    """Integer field of the request body; 0 is a value (limit 0 = whole catalog), only null/absent is not."""
+    value = req.get(name)
+    if value is None:
+        return default
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise BadRequest(f"'{name}' must be an integer, got {value!r}") from None
+
+
+class Catalog:
+    """One immutable snapshot of everything ranking needs (swapped as a whole on reload)."""
+
+    def __init__(self, args: argparse.Namespace):
+        self.schemas = args.schemas
+        self.mtime = os.path.getmtime(args.schemas)
+        summaries = list(open_summary_store(args.schemas))   # warm copy; the store is only read here
+        if not summaries:
+            raise ValueError("Schema summaries must be a non-empty list")
+        self.summaries: List[Dict[str, Any]] = summaries
+        self.by_name: Dict[str, Dict[str, Any]] = {}
+        for s in summaries:
+            self.by_name.setdefault(record_name(s), s)
+        self.bm25 = load_bm25_index(summaries, args.bm25_index)
+        self.ranker = None   # EmbeddingRanker; numpy/openai are only imported when enabled
+        if not args.no_embeddings:
+            try:
+                from src.retrieval_graph.embedding import EmbeddingRanker
+                self.ranker = EmbeddingRanker(summaries, args.embedding_model, args.embedding_store,
+                                              dtype=args.vector_dtype, dim=args.vector_dim)
+            except Exception as e:
+                print(f"[server] embeddings unavailable ({e}); embedding/hybrid modes use bm25")
+        self.loaded_at = time.time()
+
+
+class LatencyStats:
+    """Per-mode request counter with a bounded window of recent latencies."""
+
+    def __init__(self, window: int = 10000):
+        self.window = window
+        self.lock = threading.Lock()
+        self.samples: Dict[str, List[float]] = {}
+        self.counts: Dict[str, int] = {}
+        self.errors = 0
+
+    def add(self, mode: str, ms: float) -> None:
+        with self.lock:
+            buf = self.samples.setdefault(mode, [])
+            buf.append(ms)
+            if len(buf) > self.window:
+                del buf[: len(buf) - self.window]
+            self.counts[mode] = self.counts.get(mode, 0) + 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        def pct(xs, q):
+            return xs[min(len(xs) - 1, int(q * len(xs)))] if xs else None
+
+        with self.lock:
+            out: Dict[str, Any] = {"errors": self.errors, "modes": {}}
+            for mode, xs in self.samples.items():
+                xs = sorted(xs)
+                out["modes"][mode] = {"requests": self.counts[mode], "p50_ms": pct(xs, 0.50),
+                                      "p95_ms": pct(xs, 0.95), "p99_ms": pct(xs, 0.99)}
+            return out
+
+
+class TableSearchService:
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.catalog = Catalog(args)
+        self.reload_lock = threading.Lock()
+        self.stats = LatencyStats()
+
+    def maybe_reload(self) -> bool:
+        """Rebuild the catalog if the summaries file changed; keep serving the old one on failure."""
+        try:
+            mtime = os.path.getmtime(self.args.schemas)
+        except OSError:
+            return False
+        if mtime == self.catalog.mtime or not self.reload_lock.acquire(blocking=False):
+            return False
+        try:
+            self.catalog = Catalog(self.args)   # single reference swap: readers see old or new
+            print(f"[server] reloaded {self.args.schemas} ({len(self.catalog.summaries)} tables)")
+            return True
+        except Exception as e:
+            print(f"[server] reload failed, keeping previous catalog: {e}")
+            self.catalog.mtime = mtime   # do not retry the same broken file in a loop
+            return False
+        finally:
+            self.reload_lock.release()
+
+    def search(self, req: Dict[str, Any]) -> Dict[str, Any]:
+        if not isinstance(req, dict):
+            raise BadRequest("request body must be a JSON object")
+        query = str(req.get("query") or "").strip()
+        if not query:
+            raise BadRequest("'query' is required")
+        mode = req.get("mode") or self.args.mode
+        if mode not in ("embedding", "bm25", "llm", "hybrid"):
+            raise BadRequest(f"unknown mode: {mode}")
+        k = _int_param(req, "k", self.args.k)
+        if k < 1:
+            raise BadRequest("'k' must be at least 1")
+        limit = _int_param(req, "limit", self.args.limit)
+        cat = self.catalog   # snapshot for the whole request
+
+        if mode in ("embedding", "hybrid") and cat.ranker is None:
+            mode = "bm25" if mode == "embedding" else "hybrid-bm25"
+
+        if mode == "bm25":
+            choices = cat.bm25.search(query, k)
+        elif mode == "embedding":
+            choices = cat.ranker.rank([query], k)[0]
+        elif mode in ("hybrid", "hybrid-bm25"):
+            n = limit if limit > 0 else len(cat.summaries)   # limit 0 = rerank the whole catalog
+            cands = cat.ranker.rank([query], n)[0] if mode == "hybrid" else cat.bm25.search(query, n)
+            ns = argparse.Namespace(k=k, model=self.args.model, prompt_tokens=self.args.prompt_tokens)
+            choices = t2.rerank_candidates(ns, query, cands, cat.summaries, cat.by_name)
+        else:   # llm
+            snippets = [t2.build_table_snippet(s) for s in (cat.summaries[:limit] if limit > 0 else cat.summaries)]
+            choices = t2.normalize_choices(t2.call_llm_rank(query, snippets, k, self.args.model,
+                                                            budget_tokens=self.args.prompt_tokens),
+                                           cat.by_name)
+        return {"query": query, "mode": mode, "choices": choices}
+
+
+def make_handler(service: TableSearchService):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *a):
+            pass
+
+        def _send(self, code: int, obj: Any) -> None:
+            body = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path.startswith("/health"):
+                return self._send(200, {"ok": True})
+            if self.path.startswith("/metrics"):
+                body = prometheus_text().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                return
+            if self.path.startswith("/stats"):
+                cat = service.catalog
+                out = service.stats.snapshot()
+                out["catalog"] = {"schemas": cat.schemas, "tables": len(cat.summaries),
+                                  "embeddings": cat.ranker is not None,
+                                  "embedding_bytes": int(cat.ranker.tmat.nbytes) if cat.ranker else 0,
+                                  "loaded_at": cat.loaded_at}
+                out["model_calls"] = RECORDER.snapshot()
+                out["schedulers"] = scheduler_snapshot()
+                return self._send(200, out)
+            self._send(404, {"error": "not found"})
+
+        def do_POST(self):
+            if not self.path.startswith("/search"):
+                return self._send(404, {"error": "not found"})
+            t0 = time.perf_counter()
+            try:
+                n = int(self.headers.get("Content-Length", "0"))
+                req = json.loads(self.rfile.read(n) or b"{}")
+                out = service.search(req)
+            except Exception as e:
+                with service.stats.lock:
+                    service.stats.errors += 1
+                if isinstance(e, (BadRequest, json.JSONDecodeError, UnicodeDecodeError)):
+                    return self._send(400, {"error": str(e)})
+                if is_upstream_error(e):
+                    print(f"[server] upstream failure: {type(e).__name__}: {e}")
+                    return self._send(502, {"error": f"model provider failed: {e}"})
+                print(f"[server] internal error: {type(e).__name__}: {e}")
+                return self._send(500, {"error": f"internal error: {type(e).__name__}"})
+            ms = (time.perf_counter() - t0) * 1000
+            out["latency_ms"] = round(ms, 3)
+            service.stats.add(out["mode"], ms)
+            print(f"[server] {out['mode']:<11} {ms:9.2f} ms  {out['query'][:60]}")
+            self._send(200, out)
+
+    return Handler
+
+
+def main():
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Task 2 table-search service (warm in-memory catalog)")
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--schemas", type=str, default="outputs/task1/schema_summaries.json",
+                        help="Task 1 schema summaries: JSON or SQLite store (watched for changes)")
+    parser.add_argument("--mode", type=str, default="embedding",
+                        choices=["embedding", "bm25", "llm", "hybrid"], help="Default ranking mode")
+    parser.add_argument("--k", type=int, default=5, help="Default number of tables to return")
+    parser.add_argument("--limit", type=int, default=30, help="Default LLM candidates (llm/hybrid, 0 = all)")
+    parser.add_argument("--prompt-tokens", type=int, default=t2.PROMPT_TOKENS,
+                        help="Token budget of candidates per ranking prompt (larger sets: parallel tournament)")
+    parser.add_argument("--model", type=str, default=os.getenv("OPENAI_MODEL", "gpt-4o-mini"))
+    parser.add_argument("--embedding-model", type=str, default="text-embedding-3-small")
+    parser.add_argument("--embedding-store", type=str, default=None,
+                        help="Folder for cached table embeddings (default: <schemas dir>/embeddings)")
+    parser.add_argument("--vector-dtype", type=str, default="float32", choices=["float32", "float16", "int8"],
+                        help="Table-embedding matrix layout; the file is memory-mapped, so several "
+                             "server processes share one copy")
+    parser.add_argument("--vector-dim", type=int, default=None,
+                        help="Keep only the first N embedding dimensions")
+    parser.add_argument("--no-embeddings", action="store_true",
+                        help="Do not load embeddings (bm25/llm only, no API call at startup)")
+    parser.add_argument("--bm25-index", type=str, default=None,
+                        help="BM25 index file (default: <schemas dir>/bm25_index.json)")
+    parser.add_argument("--reload-interval", type=float, default=2.0,
+                        help="Seconds between checks of the summaries file (0 = no hot reload)")
+    args = parser.parse_args()
+
+    base = os.path.dirname(args.schemas) or "."
+    args.embedding_store = args.embedding_store or os.path.join(base, "embeddings")
+    args.bm25_index = args.bm25_index or os.path.join(base, "bm25_index.json")
+
+    configure_run("task2_server", metrics_dir="off")   # in memory only: served on /metrics
+    t0 = time.perf_counter()
+    service = TableSearchService(args)
+    if args.mode in ("llm", "hybrid"):
+        t2.load_chat_model(args.model)   # build the pooled chat client before the first request
+    print(f"[server] {len(service.catalog.summaries)} tables ready in {time.perf_counter() - t0:.2f}s")
+
+    if args.reload_interval > 0:
+        def watch():
+            while True:
+                time.sleep(args.reload_interval)
+                service.maybe_reload()
+        threading.Thread(target=watch, daemon=True).start()
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(service))
+    print(f"[server] listening on http://{args.host}:{args.port}  (POST /search, GET /stats)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
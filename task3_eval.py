@@ -23,16 +23,29 @@ Usage:
                        --model gpt-4o-mini
 """
 
-import argparse, os, json, re, datetime, random
-from typing import Any, Dict, List, Optional, Tuple
+import argparse, os, json, re, time, datetime
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Tuple
 from pathlib import Path
-from dotenv import load_dotenv
-load_dotenv()   #load .evn
-try:
-    from src.retrieval_graph.utils import load_chat_model
-except Exception:
-    from utils import load_chat_model
-import pandas as pd
+# pandas, LangChain and asyncio are imported where they are used (sample_rows,
+# load_chat_model, --concurrency), so `--help` and argument errors return without loading them.
+from src.retrieval_graph.llm_cache import configure as configure_llm_cache, cached_response
+from src.retrieval_graph.metrics import record_call, model_name, configure_run, finish_run
+from src.retrieval_graph.summary_store import open_summary_store
+from src.retrieval_graph.json_stream import stream_invoke, emit_once
+from src.retrieval_graph.scheduler import scheduler_for, message_tokens
+from src.retrieval_graph.structured_output import with_json_mode, structured_result, astructured_result
+
+if TYPE_CHECKING:
+    import asyncio
+
+
+def load_chat_model(model: str):
+    """Chat client from utils.load_chat_model (imported on first use: it pulls in LangChain)."""
+    try:
+        from src.retrieval_graph.utils import load_chat_model as _loader
+    except Exception:
+        from utils import load_chat_model as _loader
+    return _loader(model)
 
 
 
@@ -64,18 +77,18 @@ def build_table_index(csv_dir: str) -> Dict[str, str]:
 def sample_rows(csv_path: str, n: int = 3) -> List[Dict[str, Any]]:
     """
     Extract up to n sample rows (default = 3) from a CSV file.
-    - Reads the CSV with pandas.
-    - Always takes the first n rows (deterministic, not random).
+    - Parses only the header + first n rows (deterministic, not random; bounded memory).
     - Converts values to strings:
         NaN values are replaced with "".
         Strings longer than 60 characters are truncated and appended with "...".
     - Returns a list of row dictionaries, with column names as keys.
     - On failure, returns a single dictionary containing a warning.
     """
+    import pandas as pd
+    from src.retrieval_graph.csv_sample import read_csv_head
     try:
-        df = pd.read_csv(csv_path)
         # head n (no random to keep determinism)
-        df = df.head(n)
+        df = read_csv_head(csv_path, n)
         rows = []
         for _, r in df.iterrows():
             row = {}
@@ -90,61 +103,292 @@ def sample_rows(csv_path: str, n: int = 3) -> List[Dict[str, Any]]:
         return [{"_warning": f"sample_rows_failed: {e}"}]
 
 
-from src.retrieval_graph.prompts import EVAL_PROMPT
+from src.retrieval_graph.prompts import EVAL_PROMPT, EVAL_BATCH_PROMPT, EVAL_SCHEMA, EVAL_BATCH_SCHEMA
 
-def call_llm_eval(model: str, query: str, table: str,
-                  summary: str, columns: List[Dict[str, Any]],
-                  samples: List[Dict[str, Any]]) -> Dict[str, Any]:
+def candidate_payload(table: str, summary: str, columns: List[Dict[str, Any]],
+                      samples: List[Dict[str, Any]]) -> Dict[str, Any]:
     """
-    Use utils.load_chat_model(model) to eval one candidate table against the query.
-    Return STRICT-JSON as dictated by EVAL_PROMPT; robust to minor formatting drift.
+    Compact description of one candidate table for the evaluation prompt.
     """
-    llm = load_chat_model(model)
-    if llm is None:
-        raise RuntimeError("Failed to load chat model. Check utils.load_chat_model / OPENAI_* envs.")
-
     # 压缩负载，控制 token
     col_names = [c["name"] if isinstance(c, dict) and "name" in c else str(c)
                  for c in (columns or [])][:64]
-
-    payload: Dict[str, Any] = {
-        "query": query,
+    return {
         "table": table,
         "table_summary": (summary or "")[:800],  # truncate summary to max 800 characters
         "columns": col_names[:40],               # include only the first 40 column names
         "samples": samples[:3],                  # include only the first 3 sample rows
     }
+
+def build_eval_messages(query: str, table: str, summary: str,
+                        columns: List[Dict[str, Any]],
+                        samples: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+    """
+    Build the system + user messages for evaluating one candidate table.
+    """
+    payload: Dict[str, Any] = {"query": query}
+    payload.update(candidate_payload(table, summary, columns, samples))
     user_content = json.dumps(payload, ensure_ascii=False)
 
-    #Directly call llm.invoke(messages) (same approach as in Task 1)
-    messages = [
+    return [
         {"role": "system", "content": EVAL_PROMPT},
         {"role": "user", "content": user_content},
     ]
-    resp = llm.invoke(messages)
 
-    #Parse the LLM output
-    txt = getattr(resp, "content", str(resp)).strip()
+def default_eval(query: str, table: str) -> Dict[str, Any]:
+    """
+    EVAL_PROMPT record with every field at its default (relevance_rating 0 = not rated).
+    """
+    return {"query": query, "table": table, "relevance_rating": 0, "sufficient_to_answer": False,
+            "why": [], "missing_info": [], "irrelevant_info": []}
+
+def parse_eval_response(resp: Any, query: str, table: str, llm: Any = None,
+                        messages: Optional[List[Dict[str, str]]] = None, call: Any = None) -> Dict[str, Any]:
+    """
+    Parse the LLM output into the EVAL_PROMPT JSON (EVAL_SCHEMA): formatting drift is repaired,
+    invalid fields are re-asked once when `llm` / `messages` are given (structured_output.py).
+    """
+    return structured_result(resp, EVAL_SCHEMA, llm, messages, call, defaults={"query": query, "table": table})
+
+def call_llm_eval(model: str, query: str, table: str,
+                  summary: str, columns: List[Dict[str, Any]],
+                  samples: List[Dict[str, Any]],
+                  stats: Optional[Dict[str, float]] = None,
+                  on_field: Optional[Callable[[str, Any], None]] = None) -> Dict[str, Any]:
+    """
+    Use utils.load_chat_model(model) to eval one candidate table against the query.
+    Return STRICT-JSON as dictated by EVAL_PROMPT; robust to minor formatting drift.
+    `stats` (optional) accumulates calls / input_tokens / output_tokens / seconds.
+    `on_field` (optional) streams the answer: called with (key, value) for each top-level field
+    as soon as it is complete; the arrival of "relevance_rating" is the time-to-first-result.
+    """
+    llm = load_chat_model(model)
+    if llm is None:
+        raise RuntimeError("Failed to load chat model. Check utils.load_chat_model / OPENAI_* envs.")
+    json_llm = with_json_mode(llm, EVAL_SCHEMA)
+
+    #Directly call llm.invoke(messages) (same approach as in Task 1)
+    messages = build_eval_messages(query, table, summary, columns, samples)
+    t0 = time.perf_counter()
+    with record_call("task3.eval", model=model, table=table) as call:
+        cached = None
+        if on_field is None:
+            request = lambda: json_llm.invoke(messages)
+            cached = lambda: cached_response(json_llm, messages)   # hits take no quota
+        else:
+            @emit_once   # a retried stream starts over: each field is passed on once
+            def on_event(ev):
+                if ev[0] == "field":
+                    if ev[1] == "relevance_rating":
+                        call.first_result()
+                    on_field(ev[1], ev[2])
+            request = lambda: stream_invoke(json_llm, messages, on_event)
+        resp = scheduler_for("llm", model).run(request, tokens=message_tokens(messages), call=call,
+                                               cached=cached)
+        call.done(resp)
+        if stats is not None:
+            tin, tout = usage_tokens(resp)
+            stats["calls"] = stats.get("calls", 0) + 1
+            stats["input_tokens"] = stats.get("input_tokens", 0) + tin
+            stats["output_tokens"] = stats.get("output_tokens", 0) + tout
+            stats["seconds"] = stats.get("seconds", 0.0) + time.perf_counter() - t0
+        return parse_eval_response(resp, query, table, llm, messages, call)
+
+def usage_tokens(resp: Any) -> Tuple[int, int]:
+    """
+    (input_tokens, output_tokens) reported by the provider, (0, 0) if unavailable.
+    """
+    usage = getattr(resp, "usage_metadata", None) or {}
+    return int(usage.get("input_tokens", 0) or 0), int(usage.get("output_tokens", 0) or 0)
+
+def call_llm_eval_batch(model: str, query: str, jobs: List[Dict[str, Any]],
+                        stats: Optional[Dict[str, float]] = None,
+                        on_eval: Optional[Callable[[Dict[str, Any]], None]] = None,
+                        workers: int = 1) -> List[Dict[str, Any]]:
+    """
+    Evaluate several candidate tables in ONE request (EVAL_BATCH_PROMPT, per-table JSON array).
+    Entries that are missing or malformed are re-asked together in one follow-up request
+    (EVAL_BATCH_SCHEMA, structured_output.py); tables still without exactly one valid entry
+    are re-evaluated individually with call_llm_eval (`workers` at a time).
+    Results follow the order of `jobs`. `stats` (optional) accumulates calls / tokens / seconds.
+    `on_eval` (optional) streams the answer: called with each "evaluations" entry as soon as it
+    is complete (entries are validated afterwards, as without streaming).
+    """
+    stats = stats if stats is not None else {}
+    llm = load_chat_model(model)
+    if llm is None:
+        raise RuntimeError("Failed to load chat model. Check utils.load_chat_model / OPENAI_* envs.")
+    json_llm = with_json_mode(llm, EVAL_BATCH_SCHEMA)
+
+    payload = {
+        "query": query,
+        "candidates": [candidate_payload(j["table"], j["summary"], j["columns"], j["samples"])
+                       for j in jobs],
+    }
+    messages = [
+        {"role": "system", "content": EVAL_BATCH_PROMPT},
+        {"role": "user", "content": json.dumps(payload, ensure_ascii=False)},
+    ]
+    t0 = time.perf_counter()
+    entries: List[Any] = []
     try:
-        data = json.loads(txt)
-    except Exception:
-        m = re.search(r"\{.*\}", txt, flags=re.S)
-        if not m:
-            raise ValueError(f"LLM did not return JSON. Raw:\n{txt}")
-        data = json.loads(m.group(0))
-
-    # Add default keys to avoid missing fields
-    data.setdefault("query", query)
-    data.setdefault("table", table)
-    data.setdefault("relevance_rating", 0)
-    data.setdefault("sufficient_to_answer", False)
-    data.setdefault("why", [])
-    data.setdefault("missing_info", [])
-    data.setdefault("irrelevant_info", [])
+        with record_call("task3.eval_batch", model=model, items=len(jobs)) as call:
+            cached = None
+            if on_eval is None:
+                request = lambda: json_llm.invoke(messages)
+                cached = lambda: cached_response(json_llm, messages)
+            else:
+                @emit_once   # each table once, also across retried streams
+                def on_event(ev):
+                    if ev[0] == "item" and ev[1] == "evaluations" and isinstance(ev[2], dict):
+                        call.first_result()
+                        on_eval(ev[2])
+                request = lambda: stream_invoke(json_llm, messages, on_event)
+            resp = scheduler_for("llm", model).run(request, tokens=message_tokens(messages), call=call,
+                                                   cached=cached)
+            call.done(resp)
+            tin, tout = usage_tokens(resp)
+            stats["input_tokens"] = stats.get("input_tokens", 0) + tin
+            stats["output_tokens"] = stats.get("output_tokens", 0) + tout
+            entries = structured_result(resp, EVAL_BATCH_SCHEMA, llm, messages, call, defaults={"query": query},
+                                        expect={"evaluations": [j["table"] for j in jobs]})["evaluations"]
+    except Exception as e:
+        print(f"[Task3] batched evaluation failed ({e}); falling back to per-table calls")
+    stats["calls"] = stats.get("calls", 0) + 1
+    stats["seconds"] = stats.get("seconds", 0.0) + time.perf_counter() - t0
+
+    # table -> entry, only when the table appears exactly once
+    seen: Dict[str, List[Dict[str, Any]]] = {}
+    for e in entries:
+        seen.setdefault(norm_name(e["table"]), []).append(e)
+
+    def reevaluate(j: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, float]]:
+        print(f"[Task3] re-evaluating {j['table']} individually")
+        part: Dict[str, float] = {}   # merged afterwards: the calls may run in threads
+        try:
+            return call_llm_eval(model, query, j["table"], j["summary"], j["columns"], j["samples"],
+                                 stats=part), part
+        except Exception as e:
+            return failed_eval(query, j["table"], e), part
+
+    redo = [i for i, j in enumerate(jobs) if len(seen.get(norm_name(j["table"]), [])) != 1]
+    if workers > 1 and len(redo) > 1:
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=min(workers, len(redo))) as pool:
+            redone = dict(zip(redo, pool.map(reevaluate, [jobs[i] for i in redo])))
+    else:
+        redone = {i: reevaluate(jobs[i]) for i in redo}
+
+    out: List[Dict[str, Any]] = []
+    for i, j in enumerate(jobs):
+        if i in redone:
+            data, part = redone[i]
+            add_stats(stats, part)
+            stats["retried"] = stats.get("retried", 0) + 1
+        else:
+            data = default_eval(query, j["table"])
+            data.update(seen[norm_name(j["table"])][0], table=j["table"])
+        out.append(data)
+    return out
+
+def add_stats(total: Dict[str, float], part: Dict[str, float]) -> Dict[str, float]:
+    """Add the calls / tokens / seconds counters of `part` into `total`."""
+    for key, v in part.items():
+        total[key] = total.get(key, 0) + v
+    return total
+
+async def eval_batches_async(model: str, query: str, jobs: List[Dict[str, Any]], batch_size: int,
+                             concurrency: int, stats: Dict[str, float],
+                             on_eval: Optional[Callable[[Dict[str, Any]], None]] = None
+                             ) -> List[Dict[str, Any]]:
+    """
+    --batch-size with --concurrency: up to `concurrency` batch requests in flight (each one in a
+    worker thread, call_llm_eval_batch is blocking), results in candidate order. `stats` adds up
+    the request time of all batches (not wall time).
+    """
+    import asyncio
+    sem = asyncio.Semaphore(max(1, concurrency))
+    batches = [jobs[i:i + batch_size] for i in range(0, len(jobs), batch_size)]
+
+    async def one(batch):
+        part: Dict[str, float] = {}
+        async with sem:
+            res = await asyncio.to_thread(call_llm_eval_batch, model, query, batch, part, on_eval, concurrency)
+        return res, part
+
+    results = await asyncio.gather(*[one(b) for b in batches], return_exceptions=True)
+    out: List[Dict[str, Any]] = []
+    for batch, r in zip(batches, results):
+        if isinstance(r, BaseException):
+            out += [failed_eval(query, j["table"], r) for j in batch]
+        else:
+            out += r[0]
+            add_stats(stats, r[1])
+    return out
+
+async def acall_llm_eval(llm, sem: "asyncio.Semaphore", query: str, table: str,
+                         summary: str, columns: List[Dict[str, Any]],
+                         samples: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Async version of call_llm_eval (llm.ainvoke), at most `sem` requests in flight.
+    """
+    messages = build_eval_messages(query, table, summary, columns, samples)
+    json_llm = with_json_mode(llm, EVAL_SCHEMA)
+    async with sem:
+        with record_call("task3.eval", model=model_name(llm), table=table) as call:
+            resp = await scheduler_for("llm", model_name(llm)).arun(
+                lambda: json_llm.ainvoke(messages), tokens=message_tokens(messages), call=call,
+                cached=lambda: cached_response(json_llm, messages))
+            call.done(resp)
+            return await astructured_result(resp, EVAL_SCHEMA, llm, messages, call,
+                                            defaults={"query": query, "table": table})
+
+async def eval_candidates_async(model: str, query: str, jobs: List[Dict[str, Any]],
+                                concurrency: int) -> List[Dict[str, Any]]:
+    """
+    Evaluate all candidates concurrently; results come back in the original candidate order.
+    A failing candidate does not stop the others: it gets a record with an "error" field.
+    """
+    import asyncio
+    llm = load_chat_model(model)
+    if llm is None:
+        raise RuntimeError("Failed to load chat model. Check utils.load_chat_model / OPENAI_* envs.")
+    sem = asyncio.Semaphore(max(1, concurrency))
+    results = await asyncio.gather(
+        *[acall_llm_eval(llm, sem, query, j["table"], j["summary"], j["columns"], j["samples"])
+          for j in jobs],
+        return_exceptions=True,
+    )
+    return [failed_eval(query, j["table"], r) if isinstance(r, BaseException) else r
+            for j, r in zip(jobs, results)]
+
+def failed_eval(query: str, table: str, err: BaseException) -> Dict[str, Any]:
+    """
+    Record for a candidate whose evaluation failed after the scheduler's retries:
+    the run goes on, the error is kept in the "error" field.
+    """
+    print(f"[Task3] evaluation failed on {table}: {err}")
+    data = default_eval(query, table)
+    data["error"] = f"{type(err).__name__}: {err}"
     return data
 
 
 
+def print_eval_stats(label: str, stats: Dict[str, float]) -> None:
+    print(f"[Task3] {label}: {int(stats.get('calls', 0))} calls, "
+          f"{int(stats.get('input_tokens', 0))} input + {int(stats.get('output_tokens', 0))} output tokens, "
+          f"{stats.get('seconds', 0.0):.2f}s"
+          + (f", {int(stats['retried'])} re-evaluated individually" if stats.get("retried") else ""))
+
+def print_savings(base: Dict[str, float], new: Dict[str, float]) -> None:
+    def pct(key):
+        b = float(base.get(key, 0) or 0)
+        return f"{100.0 * (b - float(new.get(key, 0) or 0)) / b:.1f}%" if b else "n/a"
+    print(f"[Task3] batched vs per-table savings: input tokens {pct('input_tokens')}, "
+          f"output tokens {pct('output_tokens')}, latency {pct('seconds')}")
+
+
+
 def spearman(a: List[float], b: List[float]) -> Optional[float]:
     """
     Simple Spearman correlation
@@ -213,7 +457,7 @@ def main():
     Define and configure command-line arguments for Task 3:
       -results        Path to Task 2 output JSON (query + candidate tables)
                        (default: outputs/task2/task2_llm_results.json)
-      -schemas        Path to Task 1 schema summaries JSON
+      -schemas        Task 1 schema summaries: JSON or its SQLite store
                        (default: outputs/task1/schema_summaries.json)
       -csv-dir        Folder containing CSV files (used to fetch sample rows)
                        (default: data)
@@ -221,7 +465,17 @@ def main():
                        (default: from OPENAI_MODEL env var or "gpt-4o-mini")
       -sample-rows    Number of sample rows per table to include in the evaluation
                        (default: 3)
+      -concurrency    Max LLM evaluations in flight (asyncio + ainvoke); with -batch-size,
+                       max batch requests in flight (default: 1 = sequential)
+      -batch-size     Candidates judged per request with one shared prompt; tables missing or
+                       malformed in the batched answer are re-evaluated individually
+                       (default: 1 = per-table requests)
+      -compare        Also run per-table mode and print token/latency savings
+      -stream         Stream answers (sequential and batched modes): print each rating as soon
+                       as it is parsed, report time-to-first-result
     """
+    from dotenv import load_dotenv
+    load_dotenv()   # load .env (before the argument defaults read OPENAI_MODEL)
 
     parser = argparse.ArgumentParser(description="Task 3: LLM-based evaluation of Task 2 tables")
     parser.add_argument("--results", type=str,
@@ -229,22 +483,49 @@ def main():
                         help="Task 2 output JSON (contains query + candidate tables)")
     parser.add_argument("--schemas", type=str,
                         default=os.path.join("outputs", "task1", "schema_summaries.json"),
-                        help="Task 1 summaries JSON")
+                        help="Task 1 summaries: JSON or SQLite store (.sqlite)")
     parser.add_argument("--csv-dir", type=str, default="data",
                         help="Folder with CSVs (for 3 sample rows)")
     parser.add_argument("--model", type=str, default=os.getenv("OPENAI_MODEL", "gpt-4o-mini"),
                         help="OpenAI model (default from env or gpt-4o-mini)")
     parser.add_argument("--sample-rows", type=int, default=3, help="Rows per table to include")
+    parser.add_argument("--concurrency", type=int, default=1,
+                        help="Candidates evaluated concurrently via asyncio (1 = sequential); "
+                             "with --batch-size: batch requests in flight")
+    parser.add_argument("--batch-size", type=int, default=1,
+                        help="Candidates judged per LLM request (1 = one request per table)")
+    parser.add_argument("--compare", action="store_true",
+                        help="With --batch-size: also run per-table mode and report token/latency savings "
+                             "(bypasses the response cache)")
+    parser.add_argument("--stream", action="store_true",
+                        help="Stream answers and print each rating as soon as it is parsed "
+                             "(sequential / --batch-size modes)")
+    parser.add_argument("--deterministic", action="store_true",
+                        help="Pin temperature to 0 (reproducible runs); the LLM response cache is only "
+                        "used at temperature 0 or with LLM_CACHE=<path>")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Bypass the LLM response cache (on with --deterministic or LLM_CACHE=<path>)")
     args = parser.parse_args()
+    # --compare measures real calls in both modes: cached answers would skew the savings
+    configure_llm_cache(args.deterministic, args.no_cache or args.compare)
+    configure_run("task3")
+    try:
+        run(args)
+    finally:   # failed runs report their calls too (tokens spent, errors)
+        finish_run()
+
 
+def run(args) -> None:
+    """Rate Task 2's candidate tables for its query (see main for the options)."""
     if not os.path.exists(args.results):
         raise FileNotFoundError(f"Task2 results not found: {args.results}")
     if not os.path.exists(args.schemas):
         raise FileNotFoundError(f"Task1 summaries not found: {args.schemas}")
 
     t2 = read_json(args.results)
-    summaries = read_json(args.schemas)
-    if not isinstance(summaries, list) or not summaries:
+    # Indexed store: only the K candidate records are read (name / normalized-name lookup)
+    summaries = open_summary_store(args.schemas)
+    if not len(summaries):
         raise ValueError("Schema summaries must be a non-empty list")
 
     query = t2.get("query", "")
@@ -253,13 +534,6 @@ def main():
         raise ValueError("Task2 results missing 'query' or 'choices'")
 
 
-    # Build table -> schema mapping
-    by_table: Dict[str, Dict[str, Any]] = {}
-    for s in summaries:
-        name = (s.get("table") or s.get("name") or "").strip()
-        if name:
-            by_table[norm_name(name)] = s
-
     # Build table -> csv path index for samples
     csv_index = build_table_index(args.csv_dir)
 
@@ -293,12 +567,13 @@ def main():
 
     # Timestamp for evaluation records
     now = datetime.datetime.now().isoformat(timespec="seconds")
+    jobs: List[Dict[str, Any]] = []
     for c in choices:
         tbl = c.get("table") or ""
         t2_score = c.get("score", None)
         # Look up schema summary/columns from Task 1
         key = norm_name(tbl)
-        sch = by_table.get(key, {})
+        sch = summaries.get(tbl) or {}
         summary = sch.get("summary") or ""
         columns = sch.get("columns") or []
 
@@ -316,9 +591,59 @@ def main():
                     csv_path = v
                     break
         samples = sample_rows(csv_path, n=args.sample_rows) if csv_path else [{"_warning": "csv_not_found"}]
-
-        # Call LLM to evaluate this single table against the query
-        data = call_llm_eval(model, query, tbl, summary, columns, samples)
+        jobs.append({"table": tbl, "t2_score": t2_score, "summary": summary,
+                     "columns": columns, "samples": samples, "csv_path": csv_path})
+
+    # --batch-size > 1: several candidates per request (one shared system prompt)
+    # --concurrency > 1: all LLM calls in flight at once (asyncio), results kept in candidate order;
+    #                    with --batch-size, up to N batch requests (and their re-evaluations) at once
+    # --stream: ratings are printed as soon as they are parsed, before the full answer arrives
+    t_start = time.perf_counter()
+    first: List[float] = []
+
+    def show_rating(table: str, rating: Any) -> None:
+        first.append(time.perf_counter() - t_start)
+        print(f"  -> {table}: rating {rating}  (+{first[-1]:.2f}s)", flush=True)
+
+    evaluated = None
+    if args.batch_size > 1:
+        batch_stats: Dict[str, float] = {}
+        evaluated = []
+        on_eval = (lambda e: show_rating(e.get("table"), e.get("relevance_rating"))) if args.stream else None
+        if args.concurrency > 1:
+            import asyncio
+            evaluated = asyncio.run(eval_batches_async(model, query, jobs, args.batch_size,
+                                                       args.concurrency, batch_stats, on_eval))
+        else:
+            for i in range(0, len(jobs), args.batch_size):
+                evaluated += call_llm_eval_batch(model, query, jobs[i:i + args.batch_size], batch_stats,
+                                                 on_eval=on_eval)
+        print_eval_stats("batched", batch_stats)
+        if args.compare:
+            single_stats: Dict[str, float] = {}
+            for j in jobs:
+                call_llm_eval(model, query, j["table"], j["summary"], j["columns"], j["samples"],
+                              stats=single_stats)
+            print_eval_stats("per-table", single_stats)
+            print_savings(single_stats, batch_stats)
+    elif args.concurrency > 1:
+        import asyncio   # only the concurrent path needs the event loop
+        evaluated = asyncio.run(eval_candidates_async(model, query, jobs, args.concurrency))
+
+    for i, j in enumerate(jobs):
+        tbl, t2_score, csv_path = j["table"], j["t2_score"], j["csv_path"]
+        if evaluated is not None:
+            data = evaluated[i]
+        else:
+            # Call LLM to evaluate this single table against the query
+            on_field = None
+            if args.stream:
+                on_field = lambda key, v, t=tbl: show_rating(t, v) if key == "relevance_rating" else None
+            try:
+                data = call_llm_eval(model, query, tbl, j["summary"], j["columns"], j["samples"],
+                                     on_field=on_field)
+            except Exception as e:
+                data = failed_eval(query, tbl, e)
         data.update({
             "model_name": model,
             "eval_time": now,
@@ -335,17 +660,20 @@ def main():
             lines_md.append(f"- **Task2 score:** {t2_score}")
         why = data.get("why") or []
         if isinstance(why, list) and why:
-            lines_md.append(f"- **Why:** " + "; ".join(str(x) for x in why))
+            lines_md.append("- **Why:** " + "; ".join(str(x) for x in why))
         miss = data.get("missing_info") or []
         if miss:
-            lines_md.append(f"- **Missing info:** " + "; ".join(str(x) for x in miss))
+            lines_md.append("- **Missing info:** " + "; ".join(str(x) for x in miss))
         irr = data.get("irrelevant_info") or []
         if irr:
-            lines_md.append(f"- **Irrelevant info:** " + "; ".join(str(x) for x in irr))
+            lines_md.append("- **Irrelevant info:** " + "; ".join(str(x) for x in irr))
+        if data.get("error"):
+            lines_md.append(f"- **Evaluation failed:** {data['error']}")
         lines_md.append("")
 
         # Aggregate numbers for reflection (Spearman / Top-1 checks)
-        if isinstance(data.get("relevance_rating"), (int, float)) and isinstance(t2_score, (int, float)):
+        if (isinstance(data.get("relevance_rating"), (int, float)) and isinstance(t2_score, (int, float))
+                and not data.get("error")):
             ratings_t3.append(float(data["relevance_rating"]))
             scores_t2.append(float(t2_score))
             # Record (table, Task2 score, Task3 rating)
@@ -361,6 +689,8 @@ def main():
     write_reflection(out_reflect, choices, pairs, scores_t2, ratings_t3)
 
 
+    if first:
+        print(f"Streamed: first result {first[0]:.2f}s, total {time.perf_counter() - t_start:.2f}s")
     print(f"Saved: {out_jsonl}")
     print(f"Saved: {out_md}")
     print(f"Saved: {out_reflect}")
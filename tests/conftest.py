@@ -0,0 +1,5 @@
+import os
+import sys
+
+# the tasks import the package as `src.retrieval_graph` from the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,89 @@
+import pytest
+
+from src.retrieval_graph.json_stream import JsonStreamParser, emit_once, stream_invoke
+from src.retrieval_graph.scheduler import Scheduler
+
+ANSWER = ('```json\n{"query": "a, b", "choices": [{"table": "x", "reason": "has } and ]"}, '
+          '{"table": "y"}], "n": 4}\n```')
+EVENTS = [("field", "query", "a, b"),
+          ("item", "choices", {"table": "x", "reason": "has } and ]"}),
+          ("item", "choices", {"table": "y"}),
+          ("field", "choices", [{"table": "x", "reason": "has } and ]"}, {"table": "y"}]),
+          ("field", "n", 4)]
+
+
+@pytest.mark.parametrize("size", [1, 3, 7, len(ANSWER)])
+def test_events_do_not_depend_on_chunking(size):
+    parser = JsonStreamParser()
+    events = []
+    for i in range(0, len(ANSWER), size):
+        events += parser.feed(ANSWER[i:i + size])
+    assert events == EVENTS and parser.done
+
+
+def test_item_is_reported_before_the_answer_ends():
+    parser = JsonStreamParser()
+    assert parser.feed('{"choices": [{"table": "x"}') == [("item", "choices", {"table": "x"})]
+    assert parser.feed(', {"tab') == []
+
+
+def test_unparsable_element_is_skipped():
+    parser = JsonStreamParser()
+    events = parser.feed('{"choices": [{"table": }, {"table": "y"}]}')
+    assert ("item", "choices", {"table": "y"}) in events
+    assert all(ev[2] != {"table": None} for ev in events)
+
+
+def test_emit_once_dedupes_items_by_key_and_fields_by_name():
+    seen = []
+    emit = emit_once(seen.append)
+    for _ in range(2):
+        emit(("item", "choices", {"table": "x", "score": 5}))
+        emit(("item", "choices", {"table": "y"}))
+        emit(("field", "relevance_rating", 4))
+    emit(("item", "choices", {"table": "x", "score": 1}))   # same table, later attempt: not again
+    emit(("item", "other", ["no", "key"]))
+    assert seen == [("item", "choices", {"table": "x", "score": 5}), ("item", "choices", {"table": "y"}),
+                    ("field", "relevance_rating", 4), ("item", "other", ["no", "key"])]
+
+
+class Chunk:
+    def __init__(self, content):
+        self.content = content
+
+    def __add__(self, other):
+        return Chunk(self.content + other.content)
+
+
+class FlakyStream:
+    """Streams most of the answer, fails once with a timeout, then streams all of it."""
+
+    def __init__(self, text):
+        self.text = text
+        self.calls = 0
+
+    def stream(self, messages):
+        self.calls += 1
+        for i in range(0, len(self.text), 5):
+            if self.calls == 1 and i > len(self.text) * 3 // 4:
+                raise TimeoutError("read timed out")
+            yield Chunk(self.text[i:i + 5])
+
+
+def test_retried_stream_emits_each_entry_once(monkeypatch):
+    monkeypatch.setattr("random.uniform", lambda a, b: 0.0)
+    llm = FlakyStream(ANSWER)
+    tables = []
+    on_event = emit_once(lambda ev: ev[0] == "item" and tables.append(ev[2]["table"]))
+    resp = Scheduler("test").run(lambda: stream_invoke(llm, [], on_event))
+    assert llm.calls == 2 and resp.content == ANSWER
+    assert tables == ["x", "y"]
+
+
+def test_empty_stream_raises():
+    class Empty:
+        def stream(self, messages):
+            return iter(())
+
+    with pytest.raises(ValueError):
+        stream_invoke(Empty(), [], lambda ev: None)
@@ -0,0 +1,51 @@
+import json
+
+from src.retrieval_graph.lexical import BM25Index, INDEX_FORMAT, load_bm25_index, stem, tokenize
+
+SUMMARIES = [
+    {"table": "film", "summary": "Each film with its title, length and rating.",
+     "columns": [{"name": "film_id"}, {"name": "length"}]},
+    {"table": "payment", "summary": "A payment made by a customer for a rental.",
+     "columns": [{"name": "payment_id"}, {"name": "amount"}]},
+    {"table": "category", "summary": "A film genre.", "columns": [{"name": "category_id"}]},
+]
+
+
+def test_plurals_fold_to_the_singular():
+    assert [stem(w) for w in ["films", "payments", "categories", "addresses", "status", "this"]] == \
+        ["film", "payment", "category", "address", "status", "this"]
+    assert tokenize("Customer_Payments") == ["customer", "payment"]
+
+
+def test_plural_query_matches_the_singular_table(tmp_path):
+    index = load_bm25_index(SUMMARIES, str(tmp_path / "bm25_index.json"))
+    assert index.search("payments over 10", 1)[0]["table"] == "payment"
+    assert index.search("films longer than 120 minutes", 1)[0]["table"] == "film"
+    assert index.search("categories", 1)[0]["table"] == "category"
+
+
+def test_add_replace_and_remove():
+    index = BM25Index()
+    index.add("actor", "actor first name last name")
+    index.add("film", "film title")
+    assert len(index) == 2 and index.search("actor", 5)[0]["table"] == "actor"
+    index.add("actor", "performer")   # replaced: old terms gone
+    assert index.search("actor", 5) == [] and "actor" not in index.postings
+    index.remove("actor")
+    assert len(index) == 1 and index.total_len == 2 and "performer" not in index.postings
+    index.remove("missing")   # no-op
+
+
+def test_sync_saves_only_changes_and_rebuilds_old_formats(tmp_path):
+    path = tmp_path / "bm25_index.json"
+    load_bm25_index(SUMMARIES, str(path))
+    saved = json.loads(path.read_text())
+    assert saved["format"] == INDEX_FORMAT and set(saved["docs"]) == {"film", "payment", "category"}
+
+    index = load_bm25_index(SUMMARIES[:2], str(path))   # category dropped from the catalog
+    assert len(index) == 2 and set(json.loads(path.read_text())["docs"]) == {"film", "payment"}
+
+    old = dict(saved, format=1, docs={"film": {"hash": "x", "tf": {"films": 3}}})
+    path.write_text(json.dumps(old))
+    index = load_bm25_index(SUMMARIES, str(path))
+    assert "films" not in index.postings and index.search("films", 1)[0]["table"] == "film"
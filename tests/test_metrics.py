@@ -0,0 +1,24 @@
+import json
+
+from src.retrieval_graph import metrics
+from src.retrieval_graph.metrics import configure_run, finish_run, record_call
+
+
+def run_once(metrics_dir, table):
+    configure_run("task9", str(metrics_dir))
+    with record_call("task9.eval", model="m", table=table) as call:
+        call.done()
+    finish_run()
+    return metrics.RECORDER.jsonl_path
+
+
+def test_runs_do_not_overwrite_earlier_metrics(tmp_path, monkeypatch, capsys):
+    times = iter(["20260101-000000", "20260101-000001", "20260101-000001"])
+    monkeypatch.setattr(metrics.time, "strftime", lambda fmt: next(times))
+    paths = [run_once(tmp_path, t) for t in ("a", "b", "c")]
+    configure_run("task9", "off")   # close the last file
+    assert [p.rsplit("/", 1)[1] for p in paths] == ["task9-20260101-000000.jsonl"] + ["task9-20260101-000001.jsonl"] * 2
+    tables = [[json.loads(line)["table"] for line in open(p)] for p in sorted(set(paths))]
+    assert tables == [["a"], ["b", "c"]]   # a same-second rerun appends
+    assert (tmp_path / "task9-20260101-000000.prom").exists()
+    assert "[metrics]" in capsys.readouterr().out
@@ -0,0 +1,131 @@
+import asyncio
+
+import pytest
+
+from src.retrieval_graph.metrics import CallMetrics
+from src.retrieval_graph.scheduler import (AdaptiveLimit, RetryBudget, Scheduler, TokenBucket,
+                                           is_rate_limit, is_retryable, retry_after)
+
+
+class HTTPError(Exception):
+    def __init__(self, status_code, headers=None):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.response = type("Response", (), {"headers": headers or {}, "status_code": status_code})()
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    slept = []
+    monkeypatch.setattr("time.sleep", slept.append)
+    monkeypatch.setattr("random.uniform", lambda a, b: b)
+    return slept
+
+
+def flaky(*errors, result="ok"):
+    left = list(errors)
+
+    def fn():
+        if left:
+            raise left.pop(0)
+        return result
+    return fn
+
+
+def test_error_classification():
+    assert is_rate_limit(HTTPError(429)) and is_retryable(HTTPError(429))
+    assert is_retryable(HTTPError(503)) and is_retryable(TimeoutError())
+    assert not is_retryable(HTTPError(400)) and not is_retryable(ValueError("bad json"))
+    assert retry_after(HTTPError(429, {"retry-after-ms": "1500"})) == 1.5
+    assert retry_after(HTTPError(429, {"retry-after": "2"})) == 2.0
+    assert retry_after(HTTPError(429)) is None
+
+
+def test_token_bucket_waits_for_the_refill():
+    bucket = TokenBucket(per_minute=60)   # 1 unit/s, one second stored
+    assert bucket.reserve(1) == 0.0
+    assert bucket.reserve(2) == pytest.approx(2.0, abs=0.05)
+    bucket.settle(-2)   # the request cost less than reserved
+    assert bucket.reserve(1) == pytest.approx(1.0, abs=0.05)
+
+
+def test_adaptive_limit_halves_once_per_burst():
+    limit = AdaptiveLimit(8)
+    started = [0.0] * 3
+    for s in started:
+        assert limit.try_acquire()
+    for s in started:
+        limit.release(s, throttled=True)   # sent before the cut: only the first one cuts
+    assert limit.limit == 4.0
+    for _ in range(40):
+        limit.acquire()
+        limit.release(1e18, throttled=False)
+    assert limit.limit == 8.0
+
+
+def test_transient_errors_are_retried_and_counted():
+    call = CallMetrics("test", "llm", None, None, None)
+    sched = Scheduler("test", retries=3)
+    assert sched.run(flaky(HTTPError(503), HTTPError(429), TimeoutError()), call=call) == "ok"
+    assert (call.retries, call.rate_limited) == (3, 1)
+    assert sched.stats["requests"] == 4 and sched.stats["rate_limited"] == 1
+
+
+def test_non_retryable_error_is_raised_at_once():
+    sched = Scheduler("test")
+    with pytest.raises(ValueError):
+        sched.run(flaky(ValueError("bad request")))
+    assert sched.stats["requests"] == 1 and sched.stats["retries"] == 0
+
+
+def test_retries_per_request_and_process_budget():
+    sched = Scheduler("test", retries=1)
+    with pytest.raises(TimeoutError):
+        sched.run(flaky(TimeoutError(), TimeoutError()))
+    assert sched.stats["gave_up"] == 1
+
+    broke = Scheduler("test", retries=5, budget=RetryBudget(ratio=0.0, minimum=1))
+    with pytest.raises(TimeoutError):
+        broke.run(flaky(TimeoutError(), TimeoutError()))
+    assert broke.stats["retries"] == 1
+
+
+def test_retry_after_pauses_the_quota(no_sleep):
+    sched = Scheduler("test", base_delay=0.1)
+    sched.run(flaky(HTTPError(429, {"retry-after": "3"})))
+    assert no_sleep and no_sleep[0] >= 3.0
+
+
+def test_cache_hit_takes_no_quota():
+    call = CallMetrics("test", "llm", None, None, None)
+    sched = Scheduler("test", rpm=1, tpm=10)
+    calls = []
+    assert sched.run(lambda: calls.append(1), tokens=1000, call=call, cached=lambda: "cached") == "cached"
+    assert calls == [] and call.cache_hit
+    assert sched.stats["requests"] == 0 and sched.stats["cache_hits"] == 1
+    assert sched.request_bucket.reserve(1) == 0.0   # nothing was reserved for the hit
+    call.done(type("Msg", (), {"usage_metadata": {"input_tokens": 100, "output_tokens": 20}})())
+    assert (call.prompt_tokens, call.completion_tokens) == (0, 0)
+
+
+def test_cache_miss_runs_the_request():
+    sched = Scheduler("test")
+    assert sched.run(lambda: "net", cached=lambda: None) == "net"
+    assert sched.stats["requests"] == 1 and sched.stats["cache_hits"] == 0
+
+
+def test_arun_retries_and_uses_the_cache(monkeypatch):
+    async def no_wait(_):
+        return None
+    monkeypatch.setattr("asyncio.sleep", no_wait)
+    sched = Scheduler("test")
+    errors = [HTTPError(502)]
+
+    async def request():
+        if errors:
+            raise errors.pop()
+        return "ok"
+
+    assert asyncio.run(sched.arun(request)) == "ok"
+    assert asyncio.run(sched.arun(request, cached=lambda: "hit")) == "hit"
+    assert sched.stats == dict(sched.stats, requests=2, retries=1, cache_hits=1)
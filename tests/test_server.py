@@ -0,0 +1,88 @@
+import argparse
+import http.client
+import json
+import threading
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+import task2_server as srv
+from src.retrieval_graph.lexical import load_bm25_index
+from src.retrieval_graph.structured_output import StructuredOutputError
+
+SUMMARIES = [{"table": "actor", "summary": "Actors with first and last names.", "columns": [{"name": "last_name"}]},
+             {"table": "payment", "summary": "Customer payments.", "columns": [{"name": "amount"}]}]
+
+
+class RateLimitError(Exception):
+    status_code = 429
+
+
+def service(search=None):
+    """TableSearchService around an in-memory catalog, no file and no model client."""
+    svc = srv.TableSearchService.__new__(srv.TableSearchService)
+    svc.args = argparse.Namespace(mode="bm25", k=5, limit=30, model="m", prompt_tokens=1000)
+    svc.catalog = argparse.Namespace(summaries=SUMMARIES, ranker=None, bm25=load_bm25_index(SUMMARIES),
+                                     by_name={s["table"]: s for s in SUMMARIES})
+    svc.stats = srv.LatencyStats()
+    if search:
+        svc.search = search
+    return svc
+
+
+def post(svc, body):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), srv.make_handler(svc))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        conn = http.client.HTTPConnection(*server.server_address, timeout=5)
+        conn.request("POST", "/search", body=body if isinstance(body, bytes) else json.dumps(body))
+        resp = conn.getresponse()
+        return resp.status, json.loads(resp.read())
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_int_param():
+    assert srv._int_param({"limit": 0}, "limit", 30) == 0   # 0 is a value, not "unset"
+    assert srv._int_param({"limit": None}, "limit", 30) == 30
+    assert srv._int_param({"k": "3"}, "k", 5) == 3
+    with pytest.raises(srv.BadRequest, match="'k' must be an integer"):
+        srv._int_param({"k": "x"}, "k", 5)
+
+
+@pytest.mark.parametrize("req, msg", [
+    ([1], "JSON object"), ({}, "'query' is required"), ({"query": "q", "mode": "sql"}, "unknown mode"),
+    ({"query": "q", "k": 0}, "at least 1"), ({"query": "q", "limit": []}, "'limit' must be an integer")])
+def test_search_rejects_bad_requests(req, msg):
+    with pytest.raises(srv.BadRequest, match=msg):
+        service().search(req)
+
+
+def test_is_upstream_error():
+    assert srv.is_upstream_error(StructuredOutputError("missing fields"))
+    assert srv.is_upstream_error(RateLimitError("slow down"))
+    assert srv.is_upstream_error(TimeoutError())
+    assert not srv.is_upstream_error(KeyError("table_name"))
+    assert not srv.is_upstream_error(srv.BadRequest("bad"))
+
+
+def test_search_ok_and_bad_request_over_http():
+    code, out = post(service(), {"query": "actor last name", "k": 1})
+    assert code == 200 and out["mode"] == "bm25" and [c["table"] for c in out["choices"]] == ["actor"]
+    assert post(service(), {"query": "q", "k": "x"})[0] == 400
+    assert post(service(), b"{not json")[0] == 400
+
+
+@pytest.mark.parametrize("exc, code", [(StructuredOutputError("unusable answer"), 502),
+                                       (RateLimitError("429"), 502),
+                                       (KeyError("bug"), 500)])
+def test_failures_map_to_status(exc, code):
+    def search(req):
+        raise exc
+    svc = service(search)
+    status, out = post(svc, {"query": "q"})
+    assert status == code and "error" in out
+    assert svc.stats.errors == 1
+    if code == 500:
+        assert "bug" not in out["error"]   # internal details stay in the server log
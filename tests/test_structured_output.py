@@ -0,0 +1,143 @@
+import json
+
+import pytest
+
+from src.retrieval_graph.metrics import CallMetrics
+from src.retrieval_graph.prompts import EVAL_BATCH_SCHEMA, EVAL_SCHEMA, TABLE_MATCH_SCHEMA
+from src.retrieval_graph.structured_output import (StructuredOutputError, loads_lenient,
+                                                   structured_result, validate)
+
+
+class Msg:
+    def __init__(self, content):
+        self.content = content
+
+
+class FakeLLM:
+    """Answers re-asks from a list (no `bind`: with_json_mode leaves it as is)."""
+
+    def __init__(self, *answers):
+        self.answers = list(answers)
+        self.asked = []
+
+    def invoke(self, messages):
+        self.asked.append(messages)
+        return Msg(self.answers.pop(0))
+
+
+def new_call():
+    return CallMetrics("test", "llm", None, None, None)
+
+
+@pytest.fixture(autouse=True)
+def no_response_cache(monkeypatch):
+    monkeypatch.setenv("LLM_CACHE", "off")
+    monkeypatch.delenv("LLM_REASK", raising=False)
+
+
+# ---- lenient parsing ------------------------------------------------------------------------
+def test_valid_json_is_not_repaired():
+    assert loads_lenient('{"a": 1}') == ({"a": 1}, False)
+
+
+@pytest.mark.parametrize("text, expected", [
+    ('{"query": "q", "choices": [{"table": "actor", "score": 5}, {"table": "fil',
+     {"query": "q", "choices": [{"table": "actor", "score": 5}, {"table": "fil"}]}),
+    ('{"query": "q", "choices": [{"table": "actor", "score": 5},',
+     {"query": "q", "choices": [{"table": "actor", "score": 5}]}),
+    ('{"query": "q", "choices": [{"table": "actor", "sco',
+     {"query": "q", "choices": [{"table": "actor"}]}),
+])
+def test_truncated_tail_is_closed(text, expected):
+    data, repaired = loads_lenient(text)
+    assert repaired and data == expected
+
+
+def test_single_quotes_and_python_literals():
+    data, repaired = loads_lenient("{'table': 'actor', 'ok': True, 'note': None, 'why': ['it\\'s \"x\"',],}")
+    assert repaired
+    assert data == {"table": "actor", "ok": True, "note": None, "why": ['it\'s "x"']}
+
+
+def test_fences_and_prose_around_the_object():
+    text = 'Here you go:\n```json\n{"relevance_rating": 4}\n```\nHope it helps.'
+    assert loads_lenient(text) == ({"relevance_rating": 4}, True)
+
+
+def test_no_object_at_all():
+    assert loads_lenient("sorry, I cannot help") == (None, True)
+
+
+# ---- validation -----------------------------------------------------------------------------
+def test_validate_coerces_keys_and_values():
+    clean, changed, errors = validate({"Relevance Rating": "4", "table": "actor",
+                                       "sufficient_to_answer": "yes", "extra": 1}, EVAL_SCHEMA)
+    assert errors == [] and changed
+    assert clean["relevance_rating"] == 4 and clean["sufficient_to_answer"] is True
+    assert "extra" not in clean and clean["why"] == []
+
+
+def test_validate_reports_invalid_keyed_entries():
+    data = {"choices": [{"table": "actor", "score": 5}, {"table": "film", "score": 9}, {"score": 2}]}
+    clean, _, errors = validate(data, TABLE_MATCH_SCHEMA)
+    assert [c["table"] for c in clean["choices"]] == ["actor"]
+    assert [(f, key) for f, key, _ in errors] == [("choices", "film")]
+
+
+# ---- re-ask ---------------------------------------------------------------------------------
+def test_repaired_answer_is_not_reasked():
+    call = new_call()
+    llm = FakeLLM()
+    out = structured_result(Msg("{'table': 'actor', 'relevance_rating': '5',}"), EVAL_SCHEMA, llm,
+                            [{"role": "user", "content": "rate"}], call)
+    assert out["relevance_rating"] == 5
+    assert call.repaired and not call.reasked and llm.asked == []
+
+
+def test_reask_merges_only_the_invalid_entries():
+    answer = json.dumps({"query": "q", "evaluations": [
+        {"table": "actor", "relevance_rating": 5},
+        {"table": "film", "relevance_rating": "very"}]})
+    llm = FakeLLM(json.dumps({"evaluations": [{"table": "film", "relevance_rating": 3},
+                                              {"table": "actor", "relevance_rating": 1}]}))
+    call = new_call()
+    out = structured_result(Msg(answer), EVAL_BATCH_SCHEMA, llm, [{"role": "user", "content": "rate"}], call,
+                            expect={"evaluations": ["actor", "film", "store"]})
+    by_table = {e["table"]: e["relevance_rating"] for e in out["evaluations"]}
+    assert by_table == {"actor": 5, "film": 3}   # the re-ask does not overwrite valid entries
+    prompt = llm.asked[0][-1]["content"]
+    assert '"film"' in prompt and '"store"' in prompt and '"actor"' not in prompt
+    assert call.reasked   # film fixed; store still missing, an entry is dropped but the answer is usable
+
+
+def test_reask_fixes_a_required_field():
+    llm = FakeLLM('{"relevance_rating": 2}')
+    call = new_call()
+    out = structured_result(Msg('{"table": "actor", "relevance_rating": "n/a"}'), EVAL_SCHEMA, llm,
+                            [{"role": "user", "content": "rate"}], call)
+    assert out["relevance_rating"] == 2 and call.reasked
+
+
+def test_failed_reask_is_not_counted():
+    answer = json.dumps({"evaluations": [{"table": "film", "relevance_rating": "very"}]})
+    call = new_call()
+    out = structured_result(Msg(answer), EVAL_BATCH_SCHEMA, FakeLLM("no json here"),
+                            [{"role": "user", "content": "rate"}], call)
+    assert out["evaluations"] == []
+    assert not call.reasked
+
+
+def test_required_field_still_invalid_raises():
+    call = new_call()
+    with pytest.raises(StructuredOutputError):
+        structured_result(Msg('{"table": "actor"}'), EVAL_SCHEMA, FakeLLM('{"relevance_rating": 9}'),
+                          [{"role": "user", "content": "rate"}], call)
+    assert not call.reasked
+
+
+def test_reask_disabled(monkeypatch):
+    monkeypatch.setenv("LLM_REASK", "0")
+    llm = FakeLLM()
+    with pytest.raises(StructuredOutputError):
+        structured_result(Msg("{}"), EVAL_SCHEMA, llm, [{"role": "user", "content": "rate"}], new_call())
+    assert llm.asked == []
@@ -0,0 +1,79 @@
+import argparse
+import os
+
+import pytest
+
+import task1_schema_summary as t1
+
+
+def write_csv(path, rows=20_000):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("id,name,amount\n")
+        for i in range(rows):
+            f.write(f"{i},name_{i:05d},{i % 97}.50\n")
+
+
+def edit_middle(path):
+    """Same size, same first / last 64 KB: only the middle changes."""
+    st = os.stat(path)
+    with open(path, "r+b") as f:
+        f.seek(st.st_size // 2)
+        c = f.read(1)
+        f.seek(st.st_size // 2)
+        f.write(b"7" if c != b"7" else b"8")
+    return st
+
+
+def test_fingerprint_sees_an_in_place_edit(tmp_path):
+    p = str(tmp_path / "t.csv")
+    write_csv(p)
+    assert os.path.getsize(p) > 3 * 65536
+    before = t1.table_fingerprint(p)
+    assert t1.table_fingerprint(p) == before and t1.table_fingerprint(p, salt="other") != before
+    st = edit_middle(p)
+    os.utime(p, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000))
+    assert t1.table_fingerprint(p) != before
+
+
+def test_full_hash_ignores_mtime_but_not_content(tmp_path):
+    p = str(tmp_path / "t.csv")
+    write_csv(p)
+    before = t1.table_fingerprint(p, full=True)
+    st = os.stat(p)
+    os.utime(p, ns=(st.st_atime_ns, st.st_mtime_ns + 5_000_000_000))
+    assert t1.table_fingerprint(p, full=True) == before
+    cheap = t1.table_fingerprint(p)
+    st = edit_middle(p)
+    os.utime(p, ns=(st.st_atime_ns, st.st_mtime_ns))   # a tool that restores the mtime
+    assert t1.table_fingerprint(p) == cheap   # the documented limit of the cheap fingerprint
+    assert t1.table_fingerprint(p, full=True) != before
+
+
+@pytest.fixture
+def offline(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)   # the run writes outputs/_debug_task1_files_found.txt
+    monkeypatch.setitem(t1.CONFIG, "use_llm", False)
+
+
+def run_incremental(tmp_path, capsys, **kw):
+    args = argparse.Namespace(csv_dir=str(tmp_path / "csv"), out=str(tmp_path / "out" / "s.json"),
+                              workers=1, incremental=True, profile=False, full_hash=False,
+                              deterministic=False, no_cache=True)
+    vars(args).update(kw)
+    t1.run(args)
+    return next(line for line in capsys.readouterr().out.splitlines() if "incremental:" in line)
+
+
+def test_incremental_run_reuses_unchanged_tables(tmp_path, capsys, offline):
+    (tmp_path / "csv").mkdir()
+    write_csv(str(tmp_path / "csv" / "a.csv"), rows=50)
+    write_csv(str(tmp_path / "csv" / "b.csv"), rows=50)
+    assert "0 unchanged, 2 to summarize" in run_incremental(tmp_path, capsys)
+    assert "2 unchanged, 0 to summarize, 0 removed" in run_incremental(tmp_path, capsys)
+
+    st = os.stat(tmp_path / "csv" / "a.csv")
+    with open(tmp_path / "csv" / "a.csv", "a", encoding="utf-8") as f:
+        f.write("999,new,1.00\n")
+    os.remove(tmp_path / "csv" / "b.csv")
+    assert "0 unchanged, 1 to summarize, 1 removed" in run_incremental(tmp_path, capsys)
+    assert os.stat(tmp_path / "csv" / "a.csv").st_size > st.st_size
@@ -0,0 +1,78 @@
+import asyncio
+import json
+import threading
+
+import pytest
+
+import task3_eval as t3
+
+
+class Msg:
+    def __init__(self, content):
+        self.content = content
+        self.usage_metadata = {"input_tokens": 10, "output_tokens": 5}
+
+
+class JudgeLLM:
+    """Batched answers rate every candidate except those in `skip` (and break those in `bad`)."""
+
+    def __init__(self, skip=(), bad=(), fix=()):
+        self.skip, self.bad, self.fix = set(skip), set(bad), set(fix)
+        self.requests = []
+        self.lock = threading.Lock()
+
+    def invoke(self, messages):
+        user = messages[-1]["content"]
+        with self.lock:
+            self.requests.append(user)
+        if user.startswith("Your previous answer"):   # re-ask: only the tables listed in `fix`
+            return Msg(json.dumps({"evaluations": [{"table": t, "relevance_rating": 2}
+                                                   for t in sorted(self.fix) if f'"{t}"' in user]}))
+        payload = json.loads(user)
+        if "candidates" not in payload:   # per-table request
+            return Msg(json.dumps({"table": payload["table"], "relevance_rating": 1}))
+        return Msg(json.dumps({"query": payload["query"], "evaluations": [
+            {"table": c["table"], "relevance_rating": "n/a" if c["table"] in self.bad else 5}
+            for c in payload["candidates"] if c["table"] not in self.skip]}))
+
+
+def jobs(*tables):
+    return [{"table": t, "summary": f"{t} table", "columns": [{"name": "id"}], "samples": []} for t in tables]
+
+
+@pytest.fixture(autouse=True)
+def offline(monkeypatch):
+    monkeypatch.setenv("LLM_CACHE", "off")
+    monkeypatch.setenv("LLM_JSON_MODE", "off")
+
+
+def use(monkeypatch, llm):
+    monkeypatch.setattr(t3, "load_chat_model", lambda model: llm)
+    return llm
+
+
+def test_invalid_entries_are_reasked_then_evaluated_individually(monkeypatch):
+    llm = use(monkeypatch, JudgeLLM(skip={"c"}, bad={"b", "d"}, fix={"b"}))
+    stats = {}
+    out = t3.call_llm_eval_batch("m", "q", jobs("a", "b", "c", "d"), stats)
+    assert [(e["table"], e["relevance_rating"]) for e in out] == [("a", 5), ("b", 2), ("c", 1), ("d", 1)]
+    assert stats["retried"] == 2   # c (missing) and d (still invalid after the re-ask)
+    assert len(llm.requests) == 4 and stats["calls"] == 3
+
+
+def test_batches_run_concurrently_in_candidate_order(monkeypatch):
+    llm = use(monkeypatch, JudgeLLM(skip={"t3", "t6"}))
+    stats = {}
+    tables = [f"t{i}" for i in range(8)]
+    out = asyncio.run(t3.eval_batches_async("m", "q", jobs(*tables), 3, 4, stats))
+    assert [e["table"] for e in out] == tables
+    assert [e["relevance_rating"] for e in out] == [5, 5, 5, 1, 5, 5, 1, 5]
+    assert stats["retried"] == 2 and stats["calls"] == 3 + 2
+
+
+def test_failed_batch_becomes_error_records(monkeypatch):
+    def boom(model):
+        raise RuntimeError("no client")
+    monkeypatch.setattr(t3, "load_chat_model", boom)
+    out = asyncio.run(t3.eval_batches_async("m", "q", jobs("a", "b"), 2, 2, {}))
+    assert [e["table"] for e in out] == ["a", "b"] and all("no client" in e["error"] for e in out)
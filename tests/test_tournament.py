@@ -0,0 +1,65 @@
+import threading
+
+import pytest
+
+import task2_search as t2
+
+# "- table: t07\n..." snippets; the fake ranker prefers higher table numbers
+SNIPPETS = [f"- table: t{i:02d}\n  summary: {'words ' * 20}" for i in range(40)]
+
+
+def fake_ranker(fail=()):
+    calls = []
+    fail = set(fail)
+    lock = threading.Lock()
+
+    def rank_prompt(query, snippets, k, model, on_choice=None):
+        names = [t2.snippet_table(sn) for sn in snippets]
+        with lock:
+            calls.append(names)
+            failing = set(names) & fail
+            fail.difference_update(failing)   # each listed table fails its shard once
+        if failing:
+            raise TimeoutError("shard timed out")
+        best = sorted(names, reverse=True)[:k]
+        return {"choices": [{"table": n, "score": 5, "reason": ""} for n in best]}
+    return rank_prompt, calls
+
+
+def test_small_candidate_sets_take_one_call(monkeypatch):
+    rank, calls = fake_ranker()
+    monkeypatch.setattr(t2, "rank_prompt", rank)
+    data = t2.call_llm_rank("q", SNIPPETS[:3], 2, "m", budget_tokens=10_000)
+    assert len(calls) == 1 and "tournament" not in data
+
+
+def test_tournament_finds_the_best_tables(monkeypatch):
+    rank, calls = fake_ranker()
+    monkeypatch.setattr(t2, "rank_prompt", rank)
+    data = t2.call_llm_rank("q", SNIPPETS, 3, "m", budget_tokens=400)
+    assert [c["table"] for c in data["choices"]] == ["t39", "t38", "t37"]
+    assert data["tournament"]["levels"] >= 2 and data["tournament"]["failed"] == 0
+    assert all(sum(t2.estimate_tokens(SNIPPETS[int(n[1:])]) + 1 for n in shard) <= 400 for shard in calls)
+
+
+def test_failed_shard_tables_stay_in_the_tournament(monkeypatch):
+    rank, _ = fake_ranker(fail={"t39"})   # the shard holding the best table fails once
+    monkeypatch.setattr(t2, "rank_prompt", rank)
+    data = t2.call_llm_rank("q", SNIPPETS, 3, "m", budget_tokens=400)
+    assert data["choices"][0]["table"] == "t39"
+    assert data["tournament"]["failed"] >= 1
+
+
+def test_keeps_fewer_per_shard_instead_of_truncating(monkeypatch):
+    rank, _ = fake_ranker()
+    monkeypatch.setattr(t2, "rank_prompt", rank)
+    per_shard = t2.estimate_tokens(SNIPPETS[0]) * 3   # ~3 tables per shard, k = 5: no shard narrows at k
+    data = t2.call_llm_rank("q", SNIPPETS, 5, "m", budget_tokens=per_shard)
+    assert [c["table"] for c in data["choices"]][:1] == ["t39"]
+
+
+def test_cannot_narrow_raises(monkeypatch):
+    rank, _ = fake_ranker()
+    monkeypatch.setattr(t2, "rank_prompt", rank)
+    with pytest.raises(RuntimeError, match="cannot narrow"):
+        t2.call_llm_rank("q", SNIPPETS[:6], 1, "m", budget_tokens=1)